@@ -0,0 +1,413 @@
+# explain_check.py
+# Fails if any query the API runs falls back to a sequential scan on a large
+# table. It seeds a database with a realistic amount of data (use a scratch
+# database), collects every SQL statement from mycicada_api/*.py, runs each
+# one under EXPLAIN ANALYZE inside a rolled-back transaction and reports Seq
+# Scan nodes on tables above --min-rows. Statements that fail to run count as
+# failures too.
+#
+#   python benchmarks/explain_check.py --database-url postgresql://postgres@localhost/cicada_explain
+#   python benchmarks/explain_check.py --database-url ... --users 50000 --verbose
+#
+# Statements are found with ast: the SQL literal passed to fetch/fetchrow/
+# fetchval/execute, with parameter values picked from the seeded data by type
+# and by the name of the argument passed for them. Queries assembled at run
+# time are covered by dynamic_cases(), which calls the real function with a
+# recording connection.
+import argparse
+import ast
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import asyncpg
+
+ROOT = Path(__file__).resolve().parent.parent
+API_DIR = ROOT / "mycicada_api"
+
+sys.path.insert(0, str(API_DIR))
+sys.path.insert(0, str(ROOT))
+
+QUERY_METHODS = {"fetch", "fetchrow", "fetchval", "execute"}
+# Not request-path SQL: DDL and bulk tooling
+SKIP_FILES = {"schema.py", "catalog_tool.py", "gunicorn.conf.py"}
+
+# Full scans that are intended, with the reason
+ALLOWED_SCANS = {
+    ("proficiency.py", "cohort_summary"): "aggregate over every learner, cached for COHORT_CACHE_TTL",
+}
+
+SEED_DOMAIN = "explain.check"
+
+
+# --- Collecting statements ---
+
+def _module_constants():
+    """Module-level string constants across the API, for resolving f-string SQL."""
+    constants = {}
+    for path in API_DIR.glob("*.py"):
+        for node in ast.parse(path.read_text(encoding="utf-8")).body:
+            if (isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name)
+                    and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)):
+                constants[node.targets[0].id] = node.value.value
+    return constants
+
+
+def _render_sql(node, constants):
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.JoinedStr):
+        parts = []
+        for value in node.values:
+            if isinstance(value, ast.Constant):
+                parts.append(value.value)
+            elif isinstance(value.value, ast.Name) and value.value.id in constants:
+                parts.append(constants[value.value.id])
+            else:
+                return None
+        return "".join(parts)
+    return None
+
+
+def collect_statements():
+    """(file, line, function, sql or None, argument sources) for every query call in the API."""
+    constants = _module_constants()
+    statements = []
+    for path in sorted(API_DIR.glob("*.py")):
+        if path.name in SKIP_FILES:
+            continue
+        tree = ast.parse(path.read_text(encoding="utf-8"))
+        for function in ast.walk(tree):
+            if not isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            for node in ast.walk(function):
+                if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                        and node.func.attr in QUERY_METHODS and node.args):
+                    continue
+                sql = _render_sql(node.args[0], constants)
+                if sql is not None and "cicada." not in sql:
+                    continue
+                if any(isinstance(a, ast.Starred) for a in node.args[1:]):
+                    sql = None  # parameters built at run time
+                statements.append((path.name, node.lineno, function.name, sql, [ast.unparse(a) for a in node.args[1:]]))
+    # Nested functions are walked twice; keep one copy
+    unique = {}
+    for statement in statements:
+        unique.setdefault((statement[0], statement[1]), statement)
+    return sorted(unique.values(), key=lambda s: (s[0], s[1]))
+
+
+# --- Seeding ---
+
+async def seed(conn, users, messages_per_session):
+    from catalog_tool import import_catalog, parse_objectives
+    from schema import ensure_schema
+    from seed_objectives import learning_objectives
+
+    await ensure_schema(conn)
+    await import_catalog(conn, parse_objectives(learning_objectives))
+    seeded = await conn.fetchval("SELECT COUNT(*) FROM cicada.users WHERE email LIKE $1", f"%@{SEED_DOMAIN}")
+    if seeded >= users:
+        return False
+
+    started = time.perf_counter()
+    async with conn.transaction():
+        await conn.execute("""
+            CREATE TEMP TABLE seed_los ON COMMIT DROP AS
+            SELECT id, row_number() OVER (ORDER BY id) - 1 AS n FROM cicada.learning_objectives
+        """)
+        los = await conn.fetchval("SELECT COUNT(*) FROM seed_los")
+        await conn.execute(f"""
+            INSERT INTO cicada.users (id, name, email, password_hash, python_level)
+            SELECT gen_random_uuid(), 'Learner ' || i, 'u' || i || '@{SEED_DOMAIN}', 'x', i % 5
+            FROM generate_series($1::int, $2::int) i
+        """, seeded + 1, users)
+        new_users = f"SELECT id, row_number() OVER (ORDER BY email) AS i FROM cicada.users WHERE email LIKE '%@{SEED_DOMAIN}' AND password_hash = 'x'"
+
+        # Three sessions per learner: the active tutor session, a closed one and a browse session
+        await conn.execute(f"""
+            INSERT INTO cicada.sessions (id, user_id, mode, status, lo_id, created_at)
+            SELECT gen_random_uuid(), u.id, v.mode, v.status, lo.id, NOW() - (v.age || ' days')::interval
+            FROM ({new_users}) u
+            CROSS JOIN (VALUES ('tutor', 'active', 0), ('tutor', 'closed', 7), ('browse', 'closed', 3)) v(mode, status, age)
+            JOIN seed_los lo ON lo.n = (u.i + v.age) % {los}
+            WHERE NOT EXISTS (SELECT 1 FROM cicada.sessions s WHERE s.user_id = u.id)
+        """)
+        await conn.execute(f"""
+            INSERT INTO cicada.session_messages (session_id, lo_id, role, text, activity_type, timestamp)
+            SELECT s.id, s.lo_id, CASE WHEN m % 2 = 0 THEN 'tutor' ELSE 'user' END,
+                   repeat('Some tutoring text about loops and functions. ', 1 + m % 4), 'chat',
+                   s.created_at + (m || ' minutes')::interval
+            FROM cicada.sessions s
+            CROSS JOIN generate_series(1, {messages_per_session}) m
+            WHERE NOT EXISTS (SELECT 1 FROM cicada.session_messages x WHERE x.session_id = s.id)
+        """)
+        await conn.execute(f"""
+            INSERT INTO cicada.learner_models (user_id, lo_id, proficiency, feedback, updated_at)
+            SELECT u.id, lo.id, CASE WHEN lo.n < u.i % {los} THEN 1 ELSE 0.5 END, 'ok', NOW()
+            FROM ({new_users}) u
+            JOIN seed_los lo ON lo.n <= u.i % {los} AND lo.n < 15
+            ON CONFLICT DO NOTHING
+        """)
+        await conn.execute("""
+            INSERT INTO cicada.question_bank (lo_id, question, source)
+            SELECT lo.id, 'Question ' || q || ' for objective ' || lo.id, 'seed'
+            FROM seed_los lo CROSS JOIN generate_series(1, 20) q
+            ON CONFLICT DO NOTHING
+        """)
+        await conn.execute(f"""
+            INSERT INTO cicada.question_bank_served (user_id, question_id)
+            SELECT u.id, q.id
+            FROM ({new_users}) u
+            JOIN cicada.question_bank q ON q.id % 97 = u.i % 97
+            ON CONFLICT DO NOTHING
+        """)
+        await conn.execute("""
+            INSERT INTO cicada.evaluation_cache (key, lo_id, score, feedback, tokens, created_at, last_hit_at, expires_at)
+            SELECT md5(i::text), 1 + i % 60, i % 2, 'feedback', 100,
+                   NOW() - (i % 1000 || ' minutes')::interval, NOW() - (i % 1000 || ' minutes')::interval,
+                   NOW() + ((i % 48) - 4 || ' hours')::interval
+            FROM generate_series(1, $1::int) i
+            ON CONFLICT DO NOTHING
+        """, users * 2)
+        await conn.execute(f"""
+            INSERT INTO cicada.evaluation_evidence (user_id, lo_id, observable, objective, score, importance, feedback, created_at)
+            SELECT u.id, lo.id, 'Observable ' || e, 'objective', e % 2, 1 + e % 3, 'ok', NOW() - (e || ' hours')::interval
+            FROM ({new_users}) u
+            JOIN seed_los lo ON lo.n <= u.i % {los} AND lo.n < 5
+            CROSS JOIN generate_series(1, 3) e
+        """)
+        await conn.execute(f"""
+            INSERT INTO cicada.llm_jobs (kind, user_id, payload, status, result, attempts, created_at, finished_at)
+            SELECT 'evaluation', u.id, '{{}}', 'done', '{{}}', 1, NOW() - interval '1 hour', NOW() - interval '1 hour'
+            FROM ({new_users}) u CROSS JOIN generate_series(1, 5)
+        """)
+        await conn.execute(f"""
+            INSERT INTO cicada.idempotency_keys (user_id, key, fingerprint, response)
+            SELECT u.id, 'key-' || k, md5(k::text), '{{}}'
+            FROM ({new_users}) u CROSS JOIN generate_series(1, 3) k
+            ON CONFLICT DO NOTHING
+        """)
+        await conn.execute("""
+            INSERT INTO cicada.session_summaries (session_id, summary, summarized_through_id)
+            SELECT s.id, 'summary', 0 FROM cicada.sessions s WHERE s.mode = 'tutor'
+            ON CONFLICT DO NOTHING
+        """)
+        await conn.execute(f"""
+            INSERT INTO cicada.proficiency_snapshots (user_id, version, payload, complete)
+            SELECT u.id, 1, COALESCE((
+                SELECT jsonb_object_agg(lm.lo_id::text, jsonb_build_object('score', lm.proficiency, 'feedback', lm.feedback))
+                FROM cicada.learner_models lm WHERE lm.user_id = u.id
+            ), '{{}}'::jsonb), TRUE
+            FROM ({new_users}) u
+            ON CONFLICT DO NOTHING
+        """)
+        await conn.execute(f"UPDATE cicada.users SET password_hash = 'seeded' WHERE email LIKE '%@{SEED_DOMAIN}'")
+    await conn.execute("ANALYZE")
+    print(f"Seeded {users} learners in {time.perf_counter() - started:.1f}s")
+    return True
+
+
+# --- Sample parameters ---
+
+async def pick_samples(conn):
+    """Ids of one realistic learner and the rows around them."""
+    row = await conn.fetchrow(f"""
+        SELECT u.id AS user_id, u.email, s.id AS session_id, s.lo_id
+        FROM cicada.users u
+        JOIN cicada.sessions s ON s.user_id = u.id AND s.mode = 'tutor' AND s.status = 'active'
+        WHERE u.email LIKE '%@{SEED_DOMAIN}'
+        ORDER BY u.email LIMIT 1
+    """)
+    message = await conn.fetchrow("""
+        SELECT id, timestamp FROM cicada.session_messages WHERE session_id = $1 ORDER BY id LIMIT 1 OFFSET 2
+    """, row["session_id"])
+    return {
+        **dict(row),
+        "message_id": message["id"],
+        "message_ids": [message["id"], message["id"] + 1],
+        "timestamp": message["timestamp"],
+        "question_id": await conn.fetchval("SELECT MIN(id) FROM cicada.question_bank WHERE lo_id = $1", row["lo_id"]),
+        "job_id": await conn.fetchval("SELECT MAX(id) FROM cicada.llm_jobs"),
+        "cache_key": await conn.fetchval("SELECT key FROM cicada.evaluation_cache LIMIT 1"),
+    }
+
+
+def sample_value(type_name, hint, samples):
+    hint = hint.lower()
+    if type_name == "uuid":
+        return samples["session_id"] if "session" in hint else samples["user_id"]
+    if type_name in ("int2", "int4", "int8"):
+        if "question" in hint:
+            return samples["question_id"]
+        if "job" in hint:
+            return samples["job_id"]
+        if "lo" in hint:
+            return samples["lo_id"]
+        if any(word in hint for word in ("limit", "max", "recent", "offset", "free", "size")):
+            return 50
+        if "id" in hint:
+            return samples["message_id"]
+        return 1
+    if type_name in ("int4[]", "int8[]"):
+        if "score" in hint or "importance" in hint:
+            return [1, 1]  # evidence rows, paired with the two-element text[] samples
+        return samples["message_ids"]
+    if type_name in ("text", "varchar", "bpchar"):
+        if "email" in hint:
+            return samples["email"]
+        if "key" in hint:
+            return samples["cache_key"]
+        return "x"
+    if type_name == "timestamp":
+        return samples["timestamp"]
+    if type_name == "timestamptz":
+        return datetime.now(timezone.utc)
+    if type_name in ("float4", "float8", "numeric"):
+        return 86400.0  # durations in seconds (retention, leases)
+    if type_name == "bool":
+        return True
+    if type_name in ("json", "jsonb"):
+        return "{}"
+    if type_name == "text[]":
+        return ["x", "x"]
+    raise ValueError(f"no sample for parameter type {type_name}")
+
+
+# --- Queries built at run time ---
+
+class RecordingConnection:
+    """Stands in for a connection and records the statements a function runs."""
+
+    def __init__(self):
+        self.statements = []
+
+    async def _record(self, sql, *args):
+        self.statements.append((sql, args))
+        return None
+
+    async def fetch(self, sql, *args):
+        self.statements.append((sql, args))
+        return []
+
+    fetchrow = fetchval = execute = _record
+
+
+async def dynamic_cases(samples):
+    from messages import encode_cursor, fetch_message_page
+
+    cursor = encode_cursor({"id": samples["message_id"]})
+    session_id, lo_id = samples["session_id"], samples["lo_id"]
+    variants = {
+        "latest page": dict(),
+        "latest page for one LO": dict(lo_id=lo_id),
+        "older page (before)": dict(before=cursor),
+        "sync (since), one LO": dict(lo_id=lo_id, since=cursor),
+    }
+    cases = []
+    for label, kwargs in variants.items():
+        recorder = RecordingConnection()
+        kwargs.setdefault("lo_id", None)
+        await fetch_message_page(recorder, session_id, kwargs.pop("lo_id"), limit=100, **kwargs)
+        sql, args = recorder.statements[0]
+        cases.append((f"messages.py fetch_message_page: {label}", sql, args))
+    return cases
+
+
+# --- Checking plans ---
+
+def _scan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _scan_nodes(child)
+
+
+async def explain(conn, sql, args):
+    transaction = conn.transaction()
+    await transaction.start()
+    try:
+        raw = await conn.fetchval(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}", *args)
+    finally:
+        await transaction.rollback()
+    plan = json.loads(raw)[0]
+    return plan["Plan"], plan["Execution Time"]
+
+
+async def main(args):
+    conn = await asyncpg.connect(args.database_url)
+    try:
+        await seed(conn, args.users, args.messages)
+        samples = await pick_samples(conn)
+        table_rows = {
+            r["relname"]: r["reltuples"] for r in await conn.fetch("""
+                SELECT c.relname, c.reltuples FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = 'cicada' AND c.relkind = 'r'
+            """)
+        }
+
+        cases = []
+        skipped = []
+        for file, line, function, sql, arg_sources in collect_statements():
+            label = f"{file}:{line} {function}"
+            if sql is None:
+                skipped.append((label, "built at run time"))
+                continue
+            if sql.lstrip().upper().startswith("INSERT") and "SELECT" not in sql.upper():
+                continue  # single-row inserts; conflicts go through unique indexes
+            try:
+                statement = await conn.prepare(sql)
+                args_ = [
+                    sample_value(p.name, arg_sources[i] if i < len(arg_sources) else "", samples)
+                    for i, p in enumerate(statement.get_parameters())
+                ]
+            except Exception as e:
+                skipped.append((label, f"{type(e).__name__}: {e}"))
+                continue
+            cases.append((label, sql, args_, (file, function)))
+        cases.extend((label, sql, args_, None) for label, sql, args_ in await dynamic_cases(samples))
+
+        failures = 0
+        errors = 0
+        for label, sql, args_, key in cases:
+            try:
+                plan, elapsed = await explain(conn, sql, args_)
+            except Exception as e:
+                # A statement that can't run against the schema is broken, not unplannable
+                print(f"{label:60} {'':9}     ERROR {type(e).__name__}: {e}")
+                errors += 1
+                continue
+            scans = [
+                node["Relation Name"] for node in _scan_nodes(plan)
+                if node["Node Type"] == "Seq Scan" and table_rows.get(node.get("Relation Name"), 0) >= args.min_rows
+            ]
+            if scans and key in ALLOWED_SCANS:
+                status = f"allowed ({ALLOWED_SCANS[key]})"
+            elif scans:
+                status = f"SEQ SCAN on {', '.join(sorted(set(scans)))}"
+                failures += 1
+            else:
+                status = "ok"
+            if args.verbose or status != "ok":
+                print(f"{label:60} {elapsed:9.2f} ms  {status}")
+
+        for label, reason in skipped:
+            print(f"{label:60} {'':9}     skipped: {reason}")
+        print(f"\n{len(cases)} statements checked, {failures} sequential scan(s) on tables over {args.min_rows} rows, "
+              f"{errors} error(s), {len(skipped)} skipped")
+        return 1 if failures or errors else 0
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail on sequential scans in the API's queries.")
+    parser.add_argument("--database-url", required=True, help="scratch database; it will be seeded")
+    parser.add_argument("--users", type=int, default=20000, help="seeded learners")
+    parser.add_argument("--messages", type=int, default=10, help="messages per seeded session")
+    parser.add_argument("--min-rows", type=int, default=10000, help="ignore tables smaller than this")
+    parser.add_argument("--verbose", action="store_true", help="list every statement, not just failures")
+    sys.exit(asyncio.run(main(parser.parse_args())))
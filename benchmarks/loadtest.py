@@ -0,0 +1,302 @@
+# loadtest.py
+# Load test for mycicada_api: starts the API against a local Postgres with the
+# fake LLM backend, drives simulated learners through the tutor flow at rising
+# concurrency, and reports per-endpoint latency percentiles, throughput, DB
+# connection counts and event-loop lag. Results are saved as JSON so runs from
+# different commits can be compared.
+#
+#   python benchmarks/loadtest.py --database-url postgresql://postgres@localhost/cicada_bench
+#   python benchmarks/loadtest.py --levels 1,10,50 --duration 30 --llm-latency-ms 1500
+#   python benchmarks/loadtest.py --compare benchmarks/results/<earlier run>.json
+#
+# Requires httpx and uvicorn (installed with the API's dependencies).
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import asyncpg
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+API_DIR = ROOT / "mycicada_api"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+sys.path.insert(0, str(API_DIR))
+sys.path.insert(0, str(ROOT))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def prepare_database(database_url):
+    from schema import ensure_schema
+    from seed_objectives import learning_objectives
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        await ensure_schema(conn)
+        if not await conn.fetchval("SELECT COUNT(*) FROM cicada.learning_objectives"):
+            await conn.executemany(
+                "INSERT INTO cicada.learning_objectives (topic, objective) VALUES ($1, $2)",
+                [(group["topic"], objective) for group in learning_objectives for objective in group["objectives"]],
+            )
+    finally:
+        await conn.close()
+
+
+def start_api(args):
+    env = {
+        **os.environ,
+        "DATABASE_URL": args.database_url,
+        "SECRET_KEY": os.environ.get("SECRET_KEY", "bench-secret"),
+        "LLM_BACKEND": "fake",
+        "LLM_FAKE_LATENCY_MS": str(args.llm_latency_ms),
+        "LLM_FAKE_PASS_RATE": str(args.pass_rate),
+        "LLM_FAKE_GARBLE_RATE": str(args.garble_rate),
+        "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+        # Per-request access logs would dominate the output
+        "LOG_LEVEL": "WARNING",
+        # Every simulated learner logs in from the same address
+        "LOGIN_MAX_ATTEMPTS_PER_IP": "1000000",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=API_DIR,
+        env=env,
+    )
+
+
+async def wait_until_up(client, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/api/stats")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError("API did not start")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    async def call(self, client, name, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            raise
+        self.latencies.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            response.raise_for_status()
+        return response.json()
+
+
+async def learner(client, recorder, deadline):
+    """One simulated learner: sign up, then work through tutor mode until the deadline."""
+    email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+    password = "bench-password"
+    await recorder.call(client, "POST /auth/register", "POST", "/auth/register",
+                        data={"name": "Bench Learner", "email": email, "password": password})
+    token = (await recorder.call(client, "POST /auth/login", "POST", "/auth/login",
+                                 data={"email": email, "password": password}))["access_token"]
+    auth = {"Authorization": f"Bearer {token}"}
+
+    me = await recorder.call(client, "GET /api/me", "GET", "/api/me", headers=auth)
+    session = await recorder.call(client, "POST /api/session/start", "POST", "/api/session/start",
+                                  json={"user_id": me["id"], "mode": "tutor"})
+    session_id, lo_id = session["session_id"], session["lo_id"]
+
+    while lo_id and time.monotonic() < deadline:
+        question = await recorder.call(client, "POST /api/assessment_question", "POST", "/api/assessment_question",
+                                       headers=auth, json={"lo_id": lo_id})
+        await recorder.call(client, "POST /api/session/{id}/messages", "POST", f"/api/session/{session_id}/messages",
+                            headers=auth, json=[
+                                {"lo_id": lo_id, "role": "tutor", "text": "🧠 **New Learning Objective**"},
+                                {"lo_id": lo_id, "role": "tutor", "text": question["question"]},
+                            ])
+
+        passed = False
+        while not passed and time.monotonic() < deadline:
+            # Varied names so answers aren't all served from the evaluation cache
+            answer = random.choice([
+                "def {}(xs):\n    return sum(xs)",
+                "def {}(xs):\n    t = 0\n    for x in xs:\n        t += x\n    return t",
+                "def {}(xs)\n    return sum(xs)",
+            ]).format(f"total_{random.randrange(50)}")
+            result = await recorder.call(client, "POST /api/evaluate_response", "POST", "/api/evaluate_response",
+                                         headers=auth, json={
+                                             "session_id": session_id, "lo_id": lo_id,
+                                             "question": question["question"], "question_id": question.get("question_id"),
+                                             "user_input": answer, "persist": True,
+                                         })
+            passed = result["score"] == 1
+
+        await recorder.call(client, "GET /api/session/{id}/messages", "GET", f"/api/session/{session_id}/messages",
+                            headers=auth, params={"limit": 50})
+        if passed:
+            lo_id = (await recorder.call(client, "GET /api/session/{lo}/next_lo", "GET", f"/api/session/{lo_id}/next_lo",
+                                         headers=auth))["next_lo_id"]
+
+
+async def sample_connections(database_url, stop, samples):
+    conn = await asyncpg.connect(database_url)
+    try:
+        while not stop.is_set():
+            samples.append(await conn.fetchval(
+                "SELECT COUNT(*) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()"
+            ))
+            await asyncio.sleep(1)
+    finally:
+        await conn.close()
+
+
+async def run_level(args, concurrency):
+    recorder = Recorder()
+    stop = asyncio.Event()
+    connections = []
+    limits = httpx.Limits(max_connections=concurrency * 2)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=120, limits=limits) as client:
+        sampler = asyncio.create_task(sample_connections(args.database_url, stop, connections))
+        started = time.monotonic()
+        deadline = started + args.duration
+        outcomes = await asyncio.gather(*(learner(client, recorder, deadline) for _ in range(concurrency)),
+                                        return_exceptions=True)
+        elapsed = time.monotonic() - started
+        stop.set()
+        await sampler
+        server = await recorder.call(client, "stats", "GET", "/api/stats")
+
+    requests = sum(len(v) for v in recorder.latencies.values())
+    return {
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "requests": requests,
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+        "failed_learners": sum(1 for o in outcomes if isinstance(o, Exception)),
+        "db_connections": {
+            "max": max(connections, default=0),
+            "avg": round(sum(connections) / len(connections), 1) if connections else 0.0,
+        },
+        "event_loop_lag_ms": server.get("event_loop_lag", {}),
+        "db_pool": server.get("db_pool", {}),
+        # Cumulative since the server started
+        "llm_routing": server.get("llm_routing", {}).get("tasks", {}),
+        "endpoints": {
+            name: {
+                "count": len(values),
+                "errors": recorder.errors.get(name, 0),
+                "p50_ms": round(percentile(values, 50), 2),
+                "p95_ms": round(percentile(values, 95), 2),
+                "p99_ms": round(percentile(values, 99), 2),
+            }
+            for name, values in sorted(recorder.latencies.items()) if name != "stats"
+        },
+    }
+
+
+def print_level(level):
+    print(f"\n=== concurrency {level['concurrency']}: {level['requests']} requests in {level['elapsed_s']}s "
+          f"({level['throughput_rps']} req/s), failed learners {level['failed_learners']}, "
+          f"db connections max {level['db_connections']['max']}, "
+          f"loop lag max {level['event_loop_lag_ms'].get('max_ms', 0)} ms")
+    print(f"{'endpoint':40} {'count':>7} {'errors':>7} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, e in level["endpoints"].items():
+        print(f"{name:40} {e['count']:>7} {e['errors']:>7} {e['p50_ms']:>9} {e['p95_ms']:>9} {e['p99_ms']:>9}")
+    for task, t in level.get("llm_routing", {}).items():
+        spend = sum(m["cost_usd"] for m in t["models"].values())
+        print(f"llm {task}: {t['calls']} calls, escalation rate {t['escalation_rate']}, est. ${spend:.4f}")
+
+
+def compare(current, baseline_path):
+    baseline = json.loads(Path(baseline_path).read_text())
+    by_level = {level["concurrency"]: level for level in baseline["levels"]}
+    print(f"\n=== p95 change vs {baseline_path} ({baseline.get('commit', '?')})")
+    for level in current["levels"]:
+        old = by_level.get(level["concurrency"])
+        if not old:
+            continue
+        print(f"-- concurrency {level['concurrency']}: throughput {old['throughput_rps']} -> {level['throughput_rps']} req/s")
+        for name, e in level["endpoints"].items():
+            before = old["endpoints"].get(name)
+            if before and before["p95_ms"]:
+                change = (e["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+                print(f"   {name:40} {before['p95_ms']:>9} -> {e['p95_ms']:>9} ms ({change:+.1f}%)")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def main(args):
+    await prepare_database(args.database_url)
+    server = start_api(args)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}") as client:
+            await wait_until_up(client)
+
+        levels = []
+        for concurrency in args.levels:
+            level = await run_level(args, concurrency)
+            print_level(level)
+            levels.append(level)
+    finally:
+        server.terminate()
+        server.wait()
+
+    result = {
+        "commit": git_commit(),
+        "started_at": datetime.utcnow().isoformat(),
+        "config": {
+            "duration_s": args.duration,
+            "llm_latency_ms": args.llm_latency_ms,
+            "pass_rate": args.pass_rate,
+            "garble_rate": args.garble_rate,
+            "bcrypt_rounds": args.bcrypt_rounds,
+        },
+        "levels": levels,
+    }
+    RESULTS_DIR.mkdir(exist_ok=True)
+    path = RESULTS_DIR / f"{datetime.utcnow():%Y%m%dT%H%M%S}-{result['commit']}.json"
+    path.write_text(json.dumps(result, indent=2))
+    print(f"\nSaved {path}")
+
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test mycicada_api with a fake LLM and a local Postgres.")
+    parser.add_argument("--database-url", default=os.environ.get("BENCH_DATABASE_URL", "postgresql://postgres@localhost:5432/cicada_bench"))
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--levels", type=lambda s: [int(x) for x in s.split(",")], default=[1, 5, 10, 25, 50],
+                        help="comma-separated concurrency levels (simulated learners)")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per level")
+    parser.add_argument("--llm-latency-ms", type=float, default=800, help="fake LLM latency")
+    parser.add_argument("--pass-rate", type=float, default=0.5, help="share of evaluations the fake LLM passes")
+    parser.add_argument("--garble-rate", type=float, default=0.0,
+                        help="share of small-model answers the fake LLM garbles, forcing escalation")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--compare", help="earlier results file to compare p95 latencies against")
+    asyncio.run(main(parser.parse_args()))
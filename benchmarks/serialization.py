@@ -0,0 +1,150 @@
+# serialization.py
+# CPU time and payload size for a long session's message history, encoded the
+# ways the API can send it: FastAPI's default path (response_model validation +
+# jsonable_encoder + json), orjson objects, and orjson compact rows
+# (?format=compact). Sizes are shown raw, gzipped and brotli-compressed.
+#
+#   python benchmarks/serialization.py
+#   python benchmarks/serialization.py --messages 5000 --repeat 20
+#
+# Needs no database; orjson and brotli are optional and skipped when missing.
+import argparse
+import gzip
+import json
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+API_DIR = Path(__file__).resolve().parent.parent / "mycicada_api"
+sys.path.insert(0, str(API_DIR))
+
+from messages import MESSAGE_FIELDS  # noqa: E402
+from responses import FastJSONResponse, orjson  # noqa: E402
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Same shape as main.SessionMessagePage, without importing the whole app
+class SessionMessage(BaseModel):
+    id: Optional[int] = None
+    session_id: uuid.UUID
+    lo_id: int
+    role: str
+    text: str
+    activity_type: Optional[str] = "chat"
+    timestamp: Optional[datetime] = None
+
+
+class SessionMessagePage(BaseModel):
+    messages: List[SessionMessage]
+    has_more: bool
+    before_cursor: Optional[str] = None
+    sync_cursor: Optional[str] = None
+
+
+TUTOR_REPLY = """**Score:** {score}
+
+| Test | Expected | Got |
+|------|----------|-----|
+| `total([1, 2, 3])` | `6` | `{got}` |
+| `total([])` | `0` | `0` |
+
+💡 **Hint:** think about what happens when the list is empty.
+```python
+def total(xs):
+    return sum(xs)
+```"""
+
+
+def make_rows(count):
+    session_id = uuid.uuid4()
+    start = datetime(2024, 1, 1, 9, 0)
+    rows = []
+    for i in range(count):
+        if i % 2:
+            role, text = "tutor", TUTOR_REPLY.format(score=random.randint(0, 1), got=random.randint(0, 9))
+        else:
+            role, text = "user", f"def total(xs):\n    t = 0\n    for x in xs:\n        t += x\n    return t  # try {i}"
+        rows.append({
+            "id": i + 1,
+            "session_id": session_id,
+            "lo_id": random.randint(1, 40),
+            "role": role,
+            "text": text,
+            "activity_type": "chat",
+            "timestamp": start + timedelta(seconds=i * 7),
+        })
+    return rows
+
+
+def page(messages):
+    return {"messages": messages, "has_more": False, "before_cursor": "abc", "sync_cursor": "def"}
+
+
+def default_path(rows):
+    # What get_lo_messages did with response_model=SessionMessagePage
+    model = SessionMessagePage.model_validate(page(rows))
+    return json.dumps(jsonable_encoder(model), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def encoder_only(rows):
+    return json.dumps(jsonable_encoder(page(rows)), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def fast_objects(rows):
+    return FastJSONResponse(page(rows)).body
+
+
+def fast_compact(rows):
+    content = {"columns": MESSAGE_FIELDS, "rows": [tuple(r.values()) for r in rows],
+               "has_more": False, "before_cursor": "abc", "sync_cursor": "def"}
+    return FastJSONResponse(content).body
+
+
+def measure(fn, rows, repeat):
+    body = fn(rows)
+    started = time.process_time()
+    for _ in range(repeat):
+        fn(rows)
+    cpu_ms = (time.process_time() - started) / repeat * 1000
+    sizes = {"raw": len(body), "gzip": len(gzip.compress(body, 6))}
+    if brotli is not None:
+        sizes["br"] = len(brotli.compress(body, quality=4))
+    return cpu_ms, sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare message history encodings.")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    random.seed(1)
+    rows = make_rows(args.messages)
+    cases = [
+        ("model + jsonable_encoder + json", default_path),
+        ("jsonable_encoder + json", encoder_only),
+        ("FastJSONResponse objects", fast_objects),
+        ("FastJSONResponse compact", fast_compact),
+    ]
+    print(f"{args.messages} messages, {args.repeat} runs, orjson={'yes' if orjson else 'no'}, "
+          f"brotli={'yes' if brotli else 'no'}")
+    print(f"{'encoding':34} {'cpu ms':>8} {'raw KB':>8} {'gzip KB':>8} {'br KB':>8}")
+    for name, fn in cases:
+        cpu_ms, sizes = measure(fn, rows, args.repeat)
+        br = f"{sizes['br'] / 1024:8.1f}" if "br" in sizes else f"{'-':>8}"
+        print(f"{name:34} {cpu_ms:8.2f} {sizes['raw'] / 1024:8.1f} {sizes['gzip'] / 1024:8.1f} {br}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+# assessment.py
+# Evaluation prompt, result parsing and mastery updates shared by the plain and
+# streaming evaluate_response routes and the job worker.
+#
+# The model answers by calling the submit_evaluation tool, whose arguments are
+# validated once against EvaluationResult. The evidence rows are stored in
+# cicada.evaluation_evidence alongside the mastery update.
+import re
+from typing import List, Literal
+
+from fastapi import HTTPException
+from pydantic import BaseModel, Field, ValidationError
+
+import eval_cache
+import routing
+from cache import TTLCache
+from code_check import precheck
+from db import acquire
+from eval_cache import EVALUATION_TEMPERATURE
+from mastery import mark_mastery
+from messages import insert_messages
+from proficiency import record_proficiency
+
+question_tests_cache = TTLCache(maxsize=4096, ttl=300)
+
+
+class EvidenceRow(BaseModel):
+    observable: str = Field(min_length=1)
+    objective: str
+    score: Literal[0, 1]
+    importance: int = Field(ge=1, le=3)
+    feedback: str = ""
+
+
+class EvaluationResult(BaseModel):
+    score: Literal[0, 1]
+    feedback: str = Field(min_length=1)
+    followup: str = ""
+    evidence: List[EvidenceRow] = []
+    # Only used for routing; not returned, stored or cached
+    confidence: float = Field(1.0, ge=0, le=1)
+
+
+# Written out by hand: function parameters don't need pydantic's titles and $defs
+EVALUATION_TOOL = {
+    "name": "submit_evaluation",
+    "description": "Submit the evaluation of the learner's response.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "score": { "type": "integer", "enum": [0, 1] },
+            "feedback": { "type": "string" },
+            "followup": { "type": "string" },
+            "evidence": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "observable": { "type": "string" },
+                        "objective": { "type": "string" },
+                        "score": { "type": "integer", "enum": [0, 1] },
+                        "importance": { "type": "integer", "minimum": 1, "maximum": 3 },
+                        "feedback": { "type": "string" }
+                    },
+                    "required": ["observable", "objective", "score", "importance", "feedback"]
+                }
+            },
+            "confidence": {
+                "type": "number",
+                "minimum": 0,
+                "maximum": 1,
+                "description": "How sure you are of the score, from 0 to 1"
+            }
+        },
+        "required": ["score", "feedback", "followup", "evidence", "confidence"]
+    }
+}
+
+_FEEDBACK_START = re.compile(r'"feedback"\s*:\s*"')
+_ESCAPES = { "n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f" }
+
+
+def build_evaluation_prompt(lo, question, user_input):
+    return f"""
+You are an AI Python tutor evaluating a learner's response to a Python question based on the following learning objective:
+
+"{lo['objective']}"
+
+### Question Asked:
+{question}
+
+### Learner Response:
+{user_input}
+
+---
+
+### Scoring Instructions:
+
+- **Score 1** only if the response is:
+  - Fully correct in logic
+  - Properly **indented**
+  - Free of **syntax or runtime errors**
+
+- **Score 0** if:
+  - Any required concept is missing
+  - The response is ambiguous, poorly formatted, or syntactically incorrect
+  - Indentation or formatting issues would cause an execution or readability problem
+
+- **Do NOT** assume intent or fix mistakes silently — only score what is written explicitly.
+
+---
+
+### Output:
+
+Call `submit_evaluation` exactly once with:
+- "score": 0 or 1
+- "feedback": for 0, explain the mistake (e.g. indentation, syntax, logic); for 1, summarize strengths and improvements
+- "followup": for 0, a guiding question that prompts correction; for 1, an empty string
+- "evidence": one row per observable in the response, each with "observable", "objective" (the
+  objective it maps to), "score" (0 or 1), "importance" (1-3) and "feedback"
+- "confidence": how sure you are of the score, from 0 (guessing) to 1 (certain)
+""".strip()
+
+
+def build_help_prompt(lo):
+    return f"""
+You are an encouraging AI Python tutor. The learner is working on the learning objective:
+
+"{lo['objective']}" (topic: "{lo['topic']}")
+
+They have asked for help. Give a short, targeted hint that moves them forward
+without giving away the full answer. Refer to their earlier attempts if relevant.
+""".strip()
+
+
+def evaluation_messages(lo, question, user_input):
+    return [
+        { "role": "system", "content": build_evaluation_prompt(lo, question, user_input) },
+        { "role": "user", "content": user_input }
+    ]
+
+
+def parse_evaluation(content):
+    """The validated submit_evaluation arguments as a plain dict. Invalid output is an error, never a score."""
+    try:
+        result = EvaluationResult.model_validate_json(content)
+    except ValidationError:
+        raise HTTPException(status_code=502, detail="LLM returned an invalid evaluation")
+    return result.model_dump(exclude={"confidence"})
+
+
+def evaluation_accepted(content):
+    """True when the output validates with enough confidence; anything else is escalated by routing."""
+    try:
+        result = EvaluationResult.model_validate_json(content)
+    except ValidationError:
+        return False
+    return result.confidence >= routing.LLM_ESCALATE_CONFIDENCE
+
+
+class FeedbackStream:
+    """
+    Pulls the top-level "feedback" string out of streamed submit_evaluation
+    arguments, so the learner sees the feedback text arrive instead of JSON.
+    feed() returns whatever new feedback text the delta completed.
+    """
+
+    def __init__(self):
+        self.raw = ""
+        self.pos = None  # index into raw of the next undecoded feedback character
+        self.done = False
+
+    def feed(self, delta):
+        self.raw += delta
+        if self.done:
+            return ""
+        if self.pos is None:
+            # "feedback" comes before "evidence" (whose rows have their own feedback) in the schema
+            match = _FEEDBACK_START.search(self.raw)
+            if not match:
+                return ""
+            self.pos = match.end()
+
+        out, raw, i = [], self.raw, self.pos
+        while i < len(raw):
+            char = raw[i]
+            if char == '"':
+                self.done = True
+                break
+            if char != "\\":
+                out.append(char)
+                i += 1
+                continue
+            # Escapes may be split across deltas; wait for the rest
+            if i + 1 >= len(raw) or (raw[i + 1] == "u" and i + 6 > len(raw)):
+                break
+            if raw[i + 1] == "u":
+                code = int(raw[i + 2:i + 6], 16)
+                # Characters outside the BMP (emoji) come as a \uD8xx\uDCxx surrogate pair
+                if 0xD800 <= code < 0xDC00:
+                    low = raw[i + 6:i + 12]
+                    if len(low) < 6 and "\\u".startswith(low[:2]):
+                        break
+                    if low.startswith("\\u") and 0xDC00 <= int(low[2:], 16) < 0xE000:
+                        code = 0x10000 + ((code - 0xD800) << 10) + (int(low[2:], 16) - 0xDC00)
+                        i += 6
+                out.append(chr(code))
+                i += 6
+            else:
+                out.append(_ESCAPES.get(raw[i + 1], raw[i + 1]))
+                i += 2
+        self.pos = i
+        return "".join(out)
+
+
+async def record_mastery(db, user_id, lo_id, feedback):
+    await db.execute("""
+        INSERT INTO cicada.learner_models (user_id, lo_id, proficiency, feedback, updated_at)
+        VALUES ($1, $2, 1, $3, NOW())
+        ON CONFLICT (user_id, lo_id)
+        DO UPDATE SET proficiency = 1, feedback = $3, updated_at = NOW()
+    """, user_id, lo_id, feedback)
+    await record_proficiency(db, user_id, lo_id, 1, feedback)
+    await mark_mastery(db, user_id, lo_id, True)
+
+
+def turn_messages(lo_id, user_input, result):
+    """Messages a learner turn leaves in the chat: the answer, then the tutor's reply."""
+    if result["score"] == 1:
+        tutor = [
+            "🎉 Objective complete! You’ve mastered this topic.",
+            result["feedback"]
+        ]
+    else:
+        tutor = [result["feedback"], result["followup"]]
+    return [(lo_id, "user", user_input, "chat")] + [
+        (lo_id, "tutor", text, "chat") for text in tutor if text
+    ]
+
+
+async def record_evidence(db, user_id, session_id, lo_id, evidence):
+    if not evidence:
+        return
+    await db.execute("""
+        INSERT INTO cicada.evaluation_evidence
+            (user_id, lo_id, session_id, observable, objective, score, importance, feedback)
+        SELECT $1, $2, $3, e.observable, e.objective, e.score, e.importance, e.feedback
+        FROM unnest($4::text[], $5::text[], $6::int[], $7::int[], $8::text[])
+             AS e(observable, objective, score, importance, feedback)
+    """, user_id, lo_id, session_id,
+        [row["observable"] for row in evidence],
+        [row["objective"] for row in evidence],
+        [row["score"] for row in evidence],
+        [row["importance"] for row in evidence],
+        [row["feedback"] for row in evidence])
+
+
+async def persist_turn(db, session_id, user_id, lo_id, user_input, result):
+    """Write the learner's answer, the evaluation and the mastery update atomically."""
+    async with db.transaction():
+        message_ids = await insert_messages(db, session_id, turn_messages(lo_id, user_input, result))
+        await record_evidence(db, user_id, session_id, lo_id, result.get("evidence"))
+        if result["score"] == 1:
+            await record_mastery(db, user_id, lo_id, result["feedback"])
+    return message_ids
+
+
+async def local_precheck(question_id, user_input):
+    tests = None
+    if question_id is not None:
+        tests = question_tests_cache.get(question_id)
+        if tests is None:
+            async with acquire() as db:
+                tests = await db.fetchval("SELECT tests FROM cicada.question_bank WHERE id = $1", question_id) or ""
+            question_tests_cache.set(question_id, tests)
+    return await precheck(user_input, tests or None)
+
+
+async def save_evaluation(db, user_id, session_id, lo_id, user_input, result, persist):
+    if persist:
+        result["message_ids"] = await persist_turn(db, session_id, user_id, lo_id, user_input, result)
+        return
+    async with db.transaction():
+        await record_evidence(db, user_id, session_id, lo_id, result.get("evidence"))
+        if result["score"] == 1:
+            await record_mastery(db, user_id, lo_id, result["feedback"])
+
+
+async def evaluate_answer(lo, user_id, session_id, question, user_input, question_id=None, persist=False):
+    """Local pre-check, then the shared cache, then the LLM. Saves the outcome and returns the result."""
+    # ✅ Answers that fail to compile or fail their tests never reach the LLM
+    result = await local_precheck(question_id, user_input)
+    if result:
+        async with acquire() as db:
+            await save_evaluation(db, user_id, session_id, lo["id"], user_input, result, persist)
+        return { **result, "cached": False }
+
+    key = eval_cache.cache_key(lo["id"], question, user_input)
+    async with acquire() as db:
+        result = await eval_cache.lookup(db, key)
+    cached = result is not None
+
+    # Connections are only held around queries, never across the LLM call
+    if not cached:
+        response = await routing.complete(
+            "evaluation",
+            evaluation_messages(lo, question, user_input),
+            lo=lo,
+            accept=evaluation_accepted,
+            tool=EVALUATION_TOOL,
+            temperature=EVALUATION_TEMPERATURE,
+            max_tokens=600
+        )
+        result = parse_evaluation(response.content)
+
+    async with acquire() as db:
+        if not cached:
+            await eval_cache.store(db, key, lo["id"], result, response.prompt_tokens + response.completion_tokens)
+        await save_evaluation(db, user_id, session_id, lo["id"], user_input, result, persist)
+
+    return { **result, "cached": cached }
@@ -4,7 +4,10 @@ from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from uuid import UUID
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import os
+import time
 
 
 load_dotenv()
@@ -13,7 +16,22 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256") 
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor. Hashes made with a different cost are flagged by
+# needs_update and transparently rehashed on the next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the event loop
+# and bounds how many CPU-heavy hashes run at once.
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -21,8 +39,68 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     return pwd_context.verify(password, hashed)
 
+async def hash_password_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, hash_password, password)
+
+async def verify_and_update_async(password: str, hashed: str):
+    """Returns (valid, new_hash); new_hash is set when the stored hash should be replaced."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, pwd_context.verify_and_update, password, hashed)
+
 def create_access_token(data: dict, expires_delta=None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
     to_encode.update({ "exp": expire })
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+class AttemptLimiter:
+    """Sliding-window attempt counter per key (an email or a client IP), kept in
+    cicada.login_attempts so every worker shares one count."""
+
+    def __init__(self, scope: str, max_attempts: int, window_seconds: float, prune_every: int = 500):
+        self.scope = scope
+        self.max_attempts = max_attempts
+        self.window_seconds = window_seconds
+        self.prune_every = prune_every
+        self.hits = 0
+        self.rejected = 0
+
+    async def hit(self, db, key: str) -> float:
+        """Record an attempt. Returns 0 if allowed, else seconds until the next attempt is allowed."""
+        # The insert runs only while the window has room; concurrent attempts can
+        # overshoot the limit by a few, which is fine for throttling guesses
+        row = await db.fetchrow("""
+            WITH recent AS (
+                SELECT attempted_at FROM cicada.login_attempts
+                WHERE scope = $1 AND key = $2 AND attempted_at > NOW() - make_interval(secs => $3::float8)
+            ), attempt AS (
+                INSERT INTO cicada.login_attempts (scope, key)
+                SELECT $1, $2 WHERE (SELECT COUNT(*) FROM recent) < $4
+            )
+            SELECT COUNT(*) AS attempts,
+                   EXTRACT(EPOCH FROM MIN(attempted_at) + make_interval(secs => $3::float8) - NOW())::float8 AS retry_after
+            FROM recent
+        """, self.scope, key, self.window_seconds, self.max_attempts)
+
+        self.hits += 1
+        if self.hits % self.prune_every == 0:
+            await db.execute("""
+                DELETE FROM cicada.login_attempts
+                WHERE scope = $1 AND attempted_at < NOW() - make_interval(secs => $2::float8)
+            """, self.scope, self.window_seconds)
+
+        if row["attempts"] >= self.max_attempts:
+            self.rejected += 1
+            return max(row["retry_after"], 0.001)
+        return 0
+
+    async def reset(self, db, key: str):
+        await db.execute("DELETE FROM cicada.login_attempts WHERE scope = $1 AND key = $2", self.scope, key)
+
+
+LOGIN_WINDOW_SECONDS = float(os.getenv("LOGIN_WINDOW_SECONDS", "60"))
+# A whole classroom can sit behind one NAT address, so the IP limit is much looser
+email_limiter = AttemptLimiter("email", int(os.getenv("LOGIN_MAX_ATTEMPTS_PER_EMAIL", "5")), LOGIN_WINDOW_SECONDS)
+ip_limiter = AttemptLimiter("ip", int(os.getenv("LOGIN_MAX_ATTEMPTS_PER_IP", "100")), LOGIN_WINDOW_SECONDS)
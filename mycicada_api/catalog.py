@@ -0,0 +1,109 @@
+# catalog.py
+# Process-level copy of cicada.learning_objectives. Loaded on startup, reloaded
+# when a trigger fires NOTIFY on the table (with a periodic reload as a safety
+# net), and served from memory.
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+from db import acquire
+from listener import subscribe
+
+logger = logging.getLogger(__name__)
+
+CATALOG_CHANNEL = "learning_objectives_changed"
+CATALOG_REFRESH_SECONDS = float(os.getenv("CATALOG_REFRESH_SECONDS", "300"))
+
+
+class Catalog:
+    def __init__(self):
+        self.objectives = []   # ordered by id
+        self.by_id = {}        # id -> row
+        self.by_topic = {}     # topic -> [rows], in id order
+        self.ids = []          # sorted ids, for bisecting "objectives after X"
+        self.position = {}     # id -> index into objectives
+        self.etag = None
+        self.reloads = 0
+
+    async def load(self, db):
+        rows = [dict(r) for r in await db.fetch("SELECT * FROM cicada.learning_objectives ORDER BY id")]
+        by_topic = {}
+        for row in rows:
+            by_topic.setdefault(row["topic"], []).append(row)
+
+        digest = hashlib.sha1(json.dumps(rows, default=str, sort_keys=True).encode()).hexdigest()
+        # Swap everything at once so readers never see a half-built catalog
+        self.objectives = rows
+        self.by_id = {row["id"]: row for row in rows}
+        self.by_topic = by_topic
+        self.ids = [row["id"] for row in rows]
+        self.position = {row["id"]: i for i, row in enumerate(rows)}
+        self.etag = f'"{digest[:16]}"'
+        self.reloads += 1
+
+    def get(self, lo_id):
+        return self.by_id.get(lo_id)
+
+    def stats(self):
+        return {
+            "objectives": len(self.objectives),
+            "topics": len(self.by_topic),
+            "etag": self.etag,
+            "reloads": self.reloads,
+        }
+
+
+catalog = Catalog()
+
+_refresh_task = None
+_reload_pending = False
+
+
+async def reload_catalog():
+    async with acquire() as db:
+        await catalog.load(db)
+
+
+def _on_notify(payload):
+    global _reload_pending
+    # Bulk edits fire one notification per statement; coalesce them into one reload
+    if not _reload_pending:
+        _reload_pending = True
+        asyncio.get_running_loop().create_task(_reload_from_notify())
+
+
+async def _reload_from_notify():
+    global _reload_pending
+    try:
+        await asyncio.sleep(0.2)
+        _reload_pending = False
+        await reload_catalog()
+    except Exception:
+        _reload_pending = False
+        logger.exception("Catalog reload failed")
+
+
+async def _refresh_loop():
+    while True:
+        await asyncio.sleep(CATALOG_REFRESH_SECONDS)
+        try:
+            await reload_catalog()
+        except Exception:
+            logger.exception("Periodic catalog refresh failed")
+
+
+async def start_catalog():
+    """Load the catalog and subscribe to changes. Call before listener.start_listener()."""
+    global _refresh_task
+    await reload_catalog()
+    subscribe(CATALOG_CHANNEL, _on_notify, on_reconnect=reload_catalog)
+    _refresh_task = asyncio.create_task(_refresh_loop())
+
+
+async def stop_catalog():
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        _refresh_task = None
@@ -0,0 +1,227 @@
+# catalog_tool.py
+# Bulk import/export of learning objectives and question-bank entries.
+#
+# Imports COPY the file into a temporary staging table and merge it with one
+# INSERT ... ON CONFLICT on the natural key: (topic, objective) for objectives,
+# (objective, question) for questions. Re-running the same file changes nothing.
+#
+#   python catalog_tool.py import objectives.json
+#   python catalog_tool.py import objectives.csv --questions questions.csv
+#   python catalog_tool.py export objectives.csv --questions questions.csv
+#
+# Objective files are CSV with topic,objective[,difficulty] columns, or JSON:
+# either a flat list of {"topic", "objective", "difficulty"} objects or the
+# grouped [{"topic": ..., "objectives": [...]}] form seed_objectives.py uses.
+# Question files are CSV/JSON with topic,objective,question[,tests].
+import argparse
+import asyncio
+import csv
+import json
+import time
+from pathlib import Path
+
+from db import init_pool, close_pool, acquire
+from schema import ensure_schema
+
+
+def _clean(value):
+    if isinstance(value, str):
+        value = value.strip() or None
+    return value
+
+
+def _read_records(path):
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            return list(csv.DictReader(f))
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_objectives(path):
+    return parse_objectives(_read_records(path), source=path)
+
+
+def parse_objectives(records, source="objectives"):
+    """(topic, objective, difficulty) tuples, in order, from flat or grouped records."""
+    rows = []
+    for record in records:
+        if "objectives" in record:
+            # Grouped form; entries are plain strings or {"objective", "difficulty"}
+            for entry in record["objectives"]:
+                if isinstance(entry, str):
+                    entry = { "objective": entry }
+                rows.append({ "topic": record["topic"], **entry })
+        else:
+            rows.append(record)
+
+    objectives = []
+    for row in rows:
+        topic, objective = _clean(row.get("topic")), _clean(row.get("objective"))
+        if not topic or not objective:
+            raise ValueError(f"{source}: every objective needs a topic and an objective ({row})")
+        difficulty = _clean(row.get("difficulty"))
+        objectives.append((topic, objective, int(difficulty) if difficulty is not None else None))
+    return objectives
+
+
+def read_questions(path):
+    """(topic, objective, question, tests) tuples in file order."""
+    questions = []
+    for row in _read_records(path):
+        topic, objective, question = (_clean(row.get(k)) for k in ("topic", "objective", "question"))
+        if not topic or not objective or not question:
+            raise ValueError(f"{path}: every question needs a topic, objective and question ({row})")
+        questions.append((topic, objective, question, _clean(row.get("tests"))))
+    return questions
+
+
+async def merge_objectives(db, objectives):
+    """Upsert objectives by (topic, objective). Call inside a transaction."""
+    await db.execute("""
+        CREATE TEMP TABLE objectives_import (
+            ord INT, topic TEXT, objective TEXT, difficulty INT
+        ) ON COMMIT DROP
+    """)
+    await db.copy_records_to_table(
+        "objectives_import", records=[(i, *row) for i, row in enumerate(objectives)]
+    )
+    # A difficulty left blank keeps whatever the catalog already has.
+    # xmax = 0 only for freshly inserted rows.
+    row = await db.fetchrow("""
+        WITH source AS (
+            SELECT DISTINCT ON (topic, objective) ord, topic, objective, difficulty
+            FROM objectives_import
+            ORDER BY topic, objective, ord DESC
+        ), merged AS (
+            INSERT INTO cicada.learning_objectives (topic, objective, difficulty)
+            SELECT topic, objective, difficulty FROM source ORDER BY ord
+            ON CONFLICT (topic, objective) DO UPDATE
+            SET difficulty = EXCLUDED.difficulty
+            WHERE EXCLUDED.difficulty IS NOT NULL
+              AND learning_objectives.difficulty IS DISTINCT FROM EXCLUDED.difficulty
+            RETURNING xmax = 0 AS inserted
+        )
+        SELECT (SELECT COUNT(*) FROM source) AS total,
+               COUNT(*) FILTER (WHERE inserted) AS inserted,
+               COUNT(*) FILTER (WHERE NOT inserted) AS updated
+        FROM merged
+    """)
+    return _counts(row)
+
+
+async def merge_questions(db, questions):
+    """Upsert questions by (objective, question). Questions for unknown objectives are skipped."""
+    await db.execute("""
+        CREATE TEMP TABLE questions_import (
+            ord INT, topic TEXT, objective TEXT, question TEXT, tests TEXT
+        ) ON COMMIT DROP
+    """)
+    await db.copy_records_to_table(
+        "questions_import", records=[(i, *row) for i, row in enumerate(questions)]
+    )
+    row = await db.fetchrow("""
+        WITH source AS (
+            SELECT DISTINCT ON (lo.id, md5(q.question)) q.ord, lo.id AS lo_id, q.question, q.tests
+            FROM questions_import q
+            JOIN cicada.learning_objectives lo ON lo.topic = q.topic AND lo.objective = q.objective
+            ORDER BY lo.id, md5(q.question), q.ord DESC
+        ), merged AS (
+            INSERT INTO cicada.question_bank (lo_id, question, tests, source)
+            SELECT lo_id, question, tests, 'import' FROM source ORDER BY ord
+            ON CONFLICT (lo_id, md5(question)) DO UPDATE
+            SET tests = EXCLUDED.tests
+            WHERE EXCLUDED.tests IS NOT NULL
+              AND question_bank.tests IS DISTINCT FROM EXCLUDED.tests
+            RETURNING xmax = 0 AS inserted
+        )
+        SELECT (SELECT COUNT(*) FROM source) AS total,
+               COUNT(*) FILTER (WHERE inserted) AS inserted,
+               COUNT(*) FILTER (WHERE NOT inserted) AS updated,
+               (SELECT COUNT(*) FROM questions_import) - (SELECT COUNT(*) FROM source) AS skipped
+        FROM merged
+    """)
+    return _counts(row)
+
+
+def _counts(row):
+    counts = dict(row)
+    counts["unchanged"] = counts["total"] - counts["inserted"] - counts["updated"]
+    return counts
+
+
+async def import_catalog(db, objectives, questions=()):
+    """Merge objectives, then questions, in one transaction. Returns counts per kind."""
+    result = {}
+    async with db.transaction():
+        if objectives:
+            result["objectives"] = await merge_objectives(db, objectives)
+        if questions:
+            result["questions"] = await merge_questions(db, questions)
+    return result
+
+
+OBJECTIVES_QUERY = "SELECT topic, objective, difficulty FROM cicada.learning_objectives ORDER BY id"
+QUESTIONS_QUERY = """
+    SELECT lo.topic, lo.objective, q.question, q.tests
+    FROM cicada.question_bank q
+    JOIN cicada.learning_objectives lo ON lo.id = q.lo_id
+    ORDER BY lo.id, q.id
+"""
+
+
+async def export_table(db, query, path):
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        # Postgres formats the CSV (COPY ... TO STDOUT) and asyncpg streams it into the local file
+        await db.copy_from_query(query, output=str(path), format="csv", header=True)
+        return await db.fetchval(f"SELECT COUNT(*) FROM ({query}) q")
+    rows = [dict(r) for r in await db.fetch(query)]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(rows, f, indent=2, ensure_ascii=False)
+    return len(rows)
+
+
+def _report(kind, counts):
+    line = f"{kind}: {counts['inserted']} inserted, {counts['updated']} updated, {counts['unchanged']} unchanged"
+    if counts.get("skipped"):
+        line += f", {counts['skipped']} skipped (unknown objective)"
+    print(line)
+
+
+async def main(args):
+    await init_pool()
+    try:
+        async with acquire() as db:
+            await ensure_schema(db)
+            started = time.perf_counter()
+
+            if args.command == "import":
+                objectives = read_objectives(args.objectives) if args.objectives else []
+                questions = read_questions(args.questions) if args.questions else []
+                result = await import_catalog(db, objectives, questions)
+                for kind, counts in result.items():
+                    _report(kind, counts)
+            else:
+                if args.objectives:
+                    count = await export_table(db, OBJECTIVES_QUERY, args.objectives)
+                    print(f"objectives: {count} exported to {args.objectives}")
+                if args.questions:
+                    count = await export_table(db, QUESTIONS_QUERY, args.questions)
+                    print(f"questions: {count} exported to {args.questions}")
+
+            print(f"✅ Done in {time.perf_counter() - started:.2f}s")
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import or export the learning-objective catalog.")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("objectives", nargs="?", help="objectives file (.json or .csv)")
+    parser.add_argument("--questions", help="question-bank file (.json or .csv)")
+    args = parser.parse_args()
+    if not args.objectives and not args.questions:
+        parser.error("give an objectives file, --questions, or both")
+    asyncio.run(main(args))
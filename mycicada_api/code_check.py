@@ -0,0 +1,197 @@
+# code_check.py
+# Local pre-evaluation of code answers. Fenced or multi-line code that doesn't
+# compile is scored 0 with the exact error (function-body fragments such as
+# "return a + b" are compiled inside a function), and answers to bank questions
+# with attached tests can be run in a resource-limited subprocess. Everything
+# else, prose and one-liners included, goes to the LLM.
+#
+# The subprocess limits (CPU, memory, file size, no socket module, empty env) are
+# a guard against runaway learner code, not a security boundary; run the API
+# inside a container if untrusted users can submit code.
+import asyncio
+import os
+import re
+import sys
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CODE_PRECHECK_ENABLED = os.getenv("CODE_PRECHECK_ENABLED", "true").lower() == "true"
+CODE_EXEC_ENABLED = os.getenv("CODE_EXEC_ENABLED", "false").lower() == "true"
+CODE_EXEC_CONCURRENCY = int(os.getenv("CODE_EXEC_CONCURRENCY", "2"))
+CODE_EXEC_TIMEOUT = float(os.getenv("CODE_EXEC_TIMEOUT", "3"))
+CODE_EXEC_CPU_SECONDS = int(os.getenv("CODE_EXEC_CPU_SECONDS", "2"))
+CODE_EXEC_MEMORY_MB = int(os.getenv("CODE_EXEC_MEMORY_MB", "256"))
+CODE_MAX_CHARS = 20000
+
+_FENCE = re.compile(r"```[\w+-]*\s*\n(.*?)```", re.DOTALL)
+_CODE_HINT = re.compile(
+    r"^\s*(def |class |import |from \w+ import |for .+:|while .+:|if .+:|elif .+:|else:|try:|except\b.*:|finally:|with .+:"
+    r"|print\(|return\b|#|[\])}]|[\w.]+\(.*\)\s*$|\w+(\[.*\])?\s*[+\-*/]?=\s*\S)",
+    re.MULTILINE,
+)
+# Fragments like "return a + b" are fine answers; these only mean the code needs a function around it
+_OUTSIDE_FUNCTION = ("outside function", "outside async function")
+
+_exec_slots = None
+_stats = {"checked": 0, "syntax_errors": 0, "executed": 0, "exec_failures": 0}
+
+# Runs inside the child: block network access, then exec the answer and the tests
+_RUNNER = r"""
+import sys
+sys.modules["socket"] = None
+sys.modules["_socket"] = None
+source = sys.stdin.read()
+answer, _, tests = source.partition("\n# --- tests ---\n")
+scope = {"__name__": "__main__"}
+exec(compile(answer, "<answer>", "exec"), scope)
+if tests:
+    exec(compile(tests, "<tests>", "exec"), scope)
+"""
+
+
+def extract_code(text):
+    fenced = _FENCE.findall(text)
+    return "\n".join(fenced) if fenced else text
+
+
+def looks_like_code(text):
+    if _FENCE.search(text):
+        return True
+    # Unfenced: several lines, every one of them a statement. One-liners like
+    # "x = 5 is an assignment" or "if x > 3: it prints big" are left to the LLM.
+    lines = [line for line in text.splitlines() if line.strip()]
+    return len(lines) >= 2 and all(_CODE_HINT.match(line) or line[:1].isspace() for line in lines)
+
+
+def _failure(feedback, followup):
+    return {
+        "score": 0,
+        "feedback": feedback,
+        "followup": followup
+    }
+
+
+def _syntax_error(code):
+    try:
+        compile(code, "<answer>", "exec")
+    except SyntaxError as e:
+        if not any(reason in e.msg for reason in _OUTSIDE_FUNCTION):
+            return e
+        header = "async def" if "await" in e.msg else "def"
+    else:
+        return None
+    # A function body fragment: compile it inside one, keeping line numbers
+    wrapped = f"{header} _answer():\n" + "\n".join("    " + line for line in code.splitlines())
+    try:
+        compile(wrapped, "<answer>", "exec")
+    except SyntaxError as e:
+        if e.lineno:
+            e.lineno -= 1
+        if e.text and e.text.startswith("    "):
+            e.text = e.text[4:]
+        return e
+    return None
+
+
+def check_syntax(code):
+    e = _syntax_error(code)
+    if e is not None:
+        kind = type(e).__name__  # SyntaxError, IndentationError or TabError
+        line = (e.text or "").rstrip()
+        where = f" on line {e.lineno}" if e.lineno else ""
+        snippet = f"\n\n    {line}" if line else ""
+        return _failure(
+            f"Your code doesn't run: {kind}{where}: {e.msg}.{snippet}",
+            f"Can you fix the {kind.replace('Error', '').lower() or 'syntax'} problem{where} and try again?"
+        )
+    return None
+
+
+def _limit_resources():
+    import resource
+
+    resource.setrlimit(resource.RLIMIT_CPU, (CODE_EXEC_CPU_SECONDS, CODE_EXEC_CPU_SECONDS))
+    memory = CODE_EXEC_MEMORY_MB * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (0, 0))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (16, 16))
+    os.setsid()
+
+
+async def run_with_tests(code, tests):
+    global _exec_slots
+    if _exec_slots is None:
+        _exec_slots = asyncio.Semaphore(CODE_EXEC_CONCURRENCY)
+
+    async with _exec_slots:
+        _stats["executed"] += 1
+        with tempfile.TemporaryDirectory() as workdir:
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, "-I", "-S", "-c", _RUNNER,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=workdir,
+                env={},
+                preexec_fn=_limit_resources,
+            )
+            try:
+                _, stderr = await asyncio.wait_for(
+                    proc.communicate(f"{code}\n# --- tests ---\n{tests or ''}".encode()),
+                    timeout=CODE_EXEC_TIMEOUT,
+                )
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                _stats["exec_failures"] += 1
+                return _failure(
+                    f"Your code did not finish within {CODE_EXEC_TIMEOUT:g} seconds. Is there a loop that never ends?",
+                    "Can you check your loop conditions and try again?"
+                )
+
+    if proc.returncode == 0:
+        return None
+
+    _stats["exec_failures"] += 1
+    if proc.returncode < 0:
+        # Killed by a signal: the CPU or memory limit was hit
+        return _failure(
+            "Your code used too much CPU time or memory. Is there a loop that never ends, or a very large data structure?",
+            "Can you check your loops and data sizes and try again?"
+        )
+    lines = stderr.decode(errors="replace").strip().splitlines()
+    error = lines[-1] if lines else f"exit code {proc.returncode}"
+    if error.startswith("AssertionError"):
+        return _failure(
+            f"Your code runs, but it doesn't produce the expected result ({error}).",
+            "Can you trace through your code with the example inputs and see where it differs?"
+        )
+    return _failure(
+        f"Your code raised an error when it ran: {error}",
+        "Can you find what causes this error and fix it?"
+    )
+
+
+async def precheck(answer, tests=None):
+    """Returns a score-0 result if the answer fails locally, or None to continue to the LLM."""
+    if not CODE_PRECHECK_ENABLED or len(answer) > CODE_MAX_CHARS:
+        return None
+    if not (tests or looks_like_code(answer)):
+        return None
+
+    _stats["checked"] += 1
+    code = extract_code(answer)
+    failure = check_syntax(code)
+    if failure:
+        _stats["syntax_errors"] += 1
+        return failure
+    if CODE_EXEC_ENABLED and tests:
+        return await run_with_tests(code, tests)
+    return None
+
+
+def precheck_stats():
+    return dict(_stats)
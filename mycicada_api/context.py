@@ -0,0 +1,147 @@
+# context.py
+# Builds bounded LLM prompts for conversational turns in a session: the last few
+# messages for the current objective, plus a stored running summary of everything
+# older. The summary is extended in the background once the unsummarized backlog
+# passes a token budget, so prompt size stays flat however long the session gets.
+import asyncio
+import logging
+import os
+
+import routing
+from db import acquire
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_RECENT_MESSAGES = int(os.getenv("CONTEXT_RECENT_MESSAGES", "12"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_SUMMARY_TRIGGER_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TRIGGER_TOKENS", "2000"))
+CONTEXT_SUMMARY_BATCH = 200
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count_tokens(text):
+        return len(_encoding.encode(text))
+except ImportError:
+    def count_tokens(text):
+        # Close enough for English and code when tiktoken isn't installed
+        return len(text) // 4 + 1
+
+_summarizing = set()  # session ids with a summary update in flight
+_tasks = set()
+_stats = {"built": 0, "prompt_tokens": 0, "summaries": 0}
+
+
+async def build_context(db, session_id, lo_id, system_prompt):
+    """Prompt messages: system prompt, running summary, then recent turns within the budget."""
+    summary = await db.fetchrow("""
+        SELECT summary, summarized_through_id FROM cicada.session_summaries WHERE session_id = $1
+    """, session_id)
+    rows = await db.fetch("""
+        SELECT id, role, text FROM cicada.session_messages
+        WHERE session_id = $1 AND lo_id = $2
+        ORDER BY id DESC
+        LIMIT $3
+    """, session_id, lo_id, CONTEXT_RECENT_MESSAGES)
+
+    budget = CONTEXT_TOKEN_BUDGET - count_tokens(system_prompt)
+    messages = [{"role": "system", "content": system_prompt}]
+    if summary and summary["summary"]:
+        note = f"Summary of the earlier conversation:\n{summary['summary']}"
+        budget -= count_tokens(note)
+        messages.append({"role": "system", "content": note})
+
+    # Newest first, keep as many as fit, then restore chronological order
+    recent = []
+    for row in rows:
+        cost = count_tokens(row["text"])
+        if cost > budget:
+            break
+        budget -= cost
+        recent.append({"role": "user" if row["role"] == "user" else "assistant", "content": row["text"]})
+    messages.extend(reversed(recent))
+
+    _stats["built"] += 1
+    _stats["prompt_tokens"] += CONTEXT_TOKEN_BUDGET - budget
+
+    oldest_recent_id = rows[-1]["id"] if rows else None
+    through_id = summary["summarized_through_id"] if summary else 0
+    await _maybe_summarize(db, session_id, through_id, oldest_recent_id)
+    return messages
+
+
+async def _maybe_summarize(db, session_id, through_id, before_id):
+    if session_id in _summarizing or before_id is None:
+        return
+    backlog_chars = await db.fetchval("""
+        SELECT COALESCE(SUM(length(text)), 0) FROM cicada.session_messages
+        WHERE session_id = $1 AND id > $2 AND id < $3
+    """, session_id, through_id, before_id)
+    if backlog_chars // 4 < CONTEXT_SUMMARY_TRIGGER_TOKENS:
+        return
+
+    _summarizing.add(session_id)
+    task = asyncio.create_task(_summarize(session_id, before_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def _summarize(session_id, before_id):
+    try:
+        async with acquire() as db:
+            summary = await db.fetchrow("""
+                SELECT summary, summarized_through_id FROM cicada.session_summaries WHERE session_id = $1
+            """, session_id)
+            rows = await db.fetch("""
+                SELECT id, role, text FROM cicada.session_messages
+                WHERE session_id = $1 AND id > $2 AND id < $3
+                ORDER BY id
+                LIMIT $4
+            """, session_id, summary["summarized_through_id"] if summary else 0, before_id, CONTEXT_SUMMARY_BATCH)
+        if not rows:
+            return
+
+        transcript = "\n".join(f"{r['role']}: {r['text']}" for r in rows)
+        prompt = f"""
+You maintain a running summary of a Python tutoring chat. Update the summary with the new messages.
+Keep what the learner has mastered, what they struggled with, and any misconceptions. At most 200 words.
+
+### Current summary:
+{summary['summary'] if summary else '(none yet)'}
+
+### New messages:
+{transcript}
+
+Only output the updated summary.
+""".strip()
+        response = await routing.complete(
+            "summary",
+            [{"role": "system", "content": prompt}],
+            max_tokens=400,
+            temperature=0.2
+        )
+
+        async with acquire() as db:
+            await db.execute("""
+                INSERT INTO cicada.session_summaries (session_id, summary, summarized_through_id, updated_at)
+                VALUES ($1, $2, $3, NOW())
+                ON CONFLICT (session_id)
+                DO UPDATE SET summary = $2, summarized_through_id = $3, updated_at = NOW()
+            """, session_id, response.content, rows[-1]["id"])
+        _stats["summaries"] += 1
+    except Exception:
+        logger.exception("Summarizing session %s failed", session_id)
+    finally:
+        _summarizing.discard(session_id)
+
+
+def context_stats():
+    built = _stats["built"]
+    return {
+        "built": built,
+        "avg_prompt_tokens": round(_stats["prompt_tokens"] / built, 1) if built else 0.0,
+        "summaries": _stats["summaries"],
+        "summaries_in_flight": len(_summarizing),
+    }
@@ -0,0 +1,109 @@
+# db.py
+# App-wide asyncpg connection pool, created on startup and closed on shutdown.
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from metrics import log_query
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "5"))
+
+_pool = None
+
+# Acquire wait-time counters, reported by pool_stats()
+_stats = {
+    "acquired": 0,
+    "timeouts": 0,
+    "wait_total_ms": 0.0,
+    "wait_max_ms": 0.0,
+}
+
+
+async def _setup_connection(conn):
+    # Times every query by statement for /metrics (asyncpg >= 0.29)
+    if hasattr(conn, "add_query_logger"):
+        conn.add_query_logger(log_query)
+
+
+async def init_pool():
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(
+            DATABASE_URL,
+            min_size=POOL_MIN_SIZE,
+            max_size=POOL_MAX_SIZE,
+            statement_cache_size=STATEMENT_CACHE_SIZE,
+            init=_setup_connection,
+        )
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def get_pool():
+    if _pool is None:
+        raise RuntimeError("Database pool is not initialized")
+    return _pool
+
+
+@asynccontextmanager
+async def acquire():
+    pool = get_pool()
+    start = time.perf_counter()
+    try:
+        conn = await pool.acquire(timeout=ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        _stats["timeouts"] += 1
+        raise HTTPException(status_code=503, detail="Database busy, try again")
+
+    waited = (time.perf_counter() - start) * 1000
+    _stats["acquired"] += 1
+    _stats["wait_total_ms"] += waited
+    _stats["wait_max_ms"] = max(_stats["wait_max_ms"], waited)
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+
+async def get_db():
+    """FastAPI dependency: one pooled connection per request, always released."""
+    async with acquire() as conn:
+        yield conn
+
+
+def pool_stats():
+    acquired = _stats["acquired"]
+    stats = {
+        "acquired": acquired,
+        "timeouts": _stats["timeouts"],
+        "wait_avg_ms": round(_stats["wait_total_ms"] / acquired, 3) if acquired else 0.0,
+        "wait_max_ms": round(_stats["wait_max_ms"], 3),
+    }
+    if _pool is not None:
+        size = _pool.get_size()
+        idle = _pool.get_idle_size()
+        stats.update({
+            "size": size,
+            "idle": idle,
+            "in_use": size - idle,
+            "min_size": _pool.get_min_size(),
+            "max_size": _pool.get_max_size(),
+        })
+    return stats
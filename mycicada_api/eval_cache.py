@@ -0,0 +1,109 @@
+# eval_cache.py
+# Postgres-backed cache of evaluation results, shared by all workers and kept
+# across restarts. Keys are (lo_id, normalized question, normalized answer):
+# code answers are normalized through their AST, so formatting and comments
+# don't matter; prose is case- and whitespace-folded.
+import ast
+import hashlib
+import json
+import os
+import re
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EVAL_CACHE_ENABLED = os.getenv("EVAL_CACHE_ENABLED", "true").lower() == "true"
+EVAL_CACHE_TTL_HOURS = float(os.getenv("EVAL_CACHE_TTL_HOURS", "168"))
+EVAL_CACHE_MAX_ENTRIES = int(os.getenv("EVAL_CACHE_MAX_ENTRIES", "50000"))
+EVAL_CACHE_PRUNE_EVERY = int(os.getenv("EVAL_CACHE_PRUNE_EVERY", "200"))
+
+# Cached results are replayed to other learners, so evaluations run close to
+# deterministic while caching is on.
+EVALUATION_TEMPERATURE = float(os.getenv("EVAL_CACHE_TEMPERATURE", "0")) if EVAL_CACHE_ENABLED else 0.7
+
+_FENCE = re.compile(r"^```[\w+-]*\s*\n?|\n?```\s*$")
+
+_stats = {"hits": 0, "misses": 0, "stores": 0, "saved_tokens": 0}
+
+
+def _fold(text):
+    return " ".join(text.casefold().split())
+
+
+def normalize_answer(text):
+    code = _FENCE.sub("", text.strip())
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return "text:" + _fold(text)
+    # A lone name or constant is more likely a prose answer ("yes", "True")
+    if len(tree.body) == 1 and isinstance(tree.body[0], ast.Expr) and isinstance(tree.body[0].value, (ast.Name, ast.Constant)):
+        return "text:" + _fold(text)
+    return "code:" + ast.dump(tree, annotate_fields=False, include_attributes=False)
+
+
+def cache_key(lo_id, question, answer):
+    raw = "\x00".join([str(lo_id), _fold(question), normalize_answer(answer)])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+async def lookup(db, key):
+    if not EVAL_CACHE_ENABLED:
+        return None
+    # Bumping last_hit_at in the same statement keeps eviction least-recently-used
+    row = await db.fetchrow("""
+        UPDATE cicada.evaluation_cache
+        SET hits = hits + 1, last_hit_at = NOW()
+        WHERE key = $1 AND expires_at > NOW()
+        RETURNING score, feedback, followup, evidence, tokens
+    """, key)
+    if row is None:
+        _stats["misses"] += 1
+        return None
+    _stats["hits"] += 1
+    _stats["saved_tokens"] += row["tokens"]
+    return {
+        "score": row["score"],
+        "feedback": row["feedback"],
+        "followup": row["followup"],
+        "evidence": json.loads(row["evidence"])
+    }
+
+
+async def store(db, key, lo_id, result, tokens):
+    if not EVAL_CACHE_ENABLED:
+        return
+    await db.execute("""
+        INSERT INTO cicada.evaluation_cache (key, lo_id, score, feedback, followup, evidence, tokens, expires_at)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, NOW() + make_interval(secs => $8))
+        ON CONFLICT (key) DO UPDATE
+        SET score = $3, feedback = $4, followup = $5, evidence = $6, tokens = $7,
+            expires_at = NOW() + make_interval(secs => $8), last_hit_at = NOW()
+    """, key, lo_id, result["score"], result["feedback"], result["followup"],
+        json.dumps(result.get("evidence", [])), tokens, EVAL_CACHE_TTL_HOURS * 3600)
+    _stats["stores"] += 1
+    if _stats["stores"] % EVAL_CACHE_PRUNE_EVERY == 0:
+        await prune(db)
+
+
+async def prune(db):
+    """Drop expired entries, then the least recently used beyond the size cap."""
+    await db.execute("DELETE FROM cicada.evaluation_cache WHERE expires_at <= NOW()")
+    await db.execute("""
+        DELETE FROM cicada.evaluation_cache
+        WHERE last_hit_at < (
+            SELECT last_hit_at FROM cicada.evaluation_cache
+            ORDER BY last_hit_at DESC
+            OFFSET $1 LIMIT 1
+        )
+    """, EVAL_CACHE_MAX_ENTRIES)
+
+
+def eval_cache_stats():
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        "enabled": EVAL_CACHE_ENABLED,
+        **_stats,
+        "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+    }
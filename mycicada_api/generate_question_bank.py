@@ -0,0 +1,67 @@
+# generate_question_bank.py
+# Offline job that tops up cicada.question_bank so every learning objective has
+# at least --per-lo questions. Safe to re-run; duplicates are skipped.
+#
+#   python generate_question_bank.py --per-lo 20 --concurrency 4
+import argparse
+import asyncio
+
+from db import init_pool, close_pool, acquire
+import routing
+from llm import init_gateway, close_gateway
+from question_bank import build_question_prompt, add_question, question_ok
+from schema import ensure_schema
+
+
+async def fill_objective(lo, per_lo, semaphore):
+    async with acquire() as db:
+        have = await db.fetchval("SELECT COUNT(*) FROM cicada.question_bank WHERE lo_id = $1", lo["id"])
+
+    added = 0
+    attempts = 0
+    # Cap attempts so a model that keeps repeating itself can't loop forever
+    while have + added < per_lo and attempts < per_lo * 2:
+        attempts += 1
+        async with semaphore:
+            response = await routing.complete(
+                "question",
+                [{"role": "system", "content": build_question_prompt(lo)}],
+                lo=lo,
+                accept=question_ok,
+                max_tokens=300,
+                temperature=0.9,
+            )
+        async with acquire() as db:
+            if await add_question(db, lo["id"], response.content):
+                added += 1
+
+    print(f"LO {lo['id']}: {have} existing, {added} added")
+    return added
+
+
+async def main(per_lo, concurrency, lo_id=None):
+    await init_pool()
+    init_gateway()
+    try:
+        async with acquire() as db:
+            await ensure_schema(db)
+            if lo_id:
+                los = await db.fetch("SELECT id, topic, objective, difficulty FROM cicada.learning_objectives WHERE id = $1", lo_id)
+            else:
+                los = await db.fetch("SELECT id, topic, objective, difficulty FROM cicada.learning_objectives ORDER BY id")
+
+        semaphore = asyncio.Semaphore(concurrency)
+        results = await asyncio.gather(*(fill_objective(lo, per_lo, semaphore) for lo in los))
+        print(f"✅ Question bank updated: {sum(results)} questions added across {len(los)} objectives.")
+    finally:
+        await close_gateway()
+        await close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate assessment questions per learning objective.")
+    parser.add_argument("--per-lo", type=int, default=20, help="target number of questions per objective")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel LLM calls")
+    parser.add_argument("--lo-id", type=int, help="only fill this objective")
+    args = parser.parse_args()
+    asyncio.run(main(args.per_lo, args.concurrency, args.lo_id))
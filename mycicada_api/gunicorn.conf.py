@@ -0,0 +1,45 @@
+# gunicorn.conf.py
+# Production profile: several uvicorn workers behind one gunicorn master.
+#
+#   gunicorn -c gunicorn.conf.py
+#
+# The app is imported once in the master (preload_app) and forked, so workers
+# start fast and share imported code. Pools, the LLM gateway, the catalog and
+# the LISTEN connection are created per worker in main.py's startup hook,
+# never at import time, so nothing crosses the fork. Queued LLM jobs run
+# separately in worker.py.
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+wsgi_app = "main:app"
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+try:
+    import uvicorn_worker  # noqa: F401
+    worker_class = "uvicorn_worker.UvicornWorker"
+except ImportError:
+    worker_class = "uvicorn.workers.UvicornWorker"
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# SIGTERM gives each worker this long before the master kills it. It has to cover
+# SHUTDOWN_DELAY_SECONDS (still serving, /readyz at 503), finishing in-flight
+# requests, then draining background LLM calls (LLM_DRAIN_SECONDS).
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+# Uvicorn workers heartbeat from their event loop, so this catches a loop that is
+# stuck, not a long streaming request
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+
+# Recycle workers now and then so slow leaks can't build up
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "0"))
+
+accesslog = None  # main.py already logs every request with its request id
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
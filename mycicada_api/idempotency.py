@@ -0,0 +1,126 @@
+# idempotency.py
+# Idempotency-Key support for write endpoints. The first request with a key
+# claims it and runs; its JSON response is stored, and a retry with the same key
+# gets that response back instead of inserting rows or calling the LLM again.
+# Keys are scoped per user.
+import hashlib
+import json
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+
+from db import acquire
+
+IDEMPOTENCY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+# A claim with no stored response after this long is assumed abandoned (crashed worker)
+IDEMPOTENCY_PENDING_SECONDS = float(os.getenv("IDEMPOTENCY_PENDING_SECONDS", "120"))
+IDEMPOTENCY_PRUNE_EVERY = 500
+IDEMPOTENCY_KEY_MAX = 255
+
+_stats = {"claimed": 0, "replayed": 0, "conflicts": 0}
+
+
+def fingerprint(route, body):
+    raw = json.dumps({"route": route, "body": jsonable_encoder(body)}, sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+@asynccontextmanager
+async def _connection(db):
+    if db is not None:
+        yield db
+    else:
+        async with acquire() as conn:
+            yield conn
+
+
+async def claim(db, user_id, key, request_fingerprint):
+    """None if the caller now owns the key; otherwise the stored response to replay."""
+    if len(key) > IDEMPOTENCY_KEY_MAX:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key is longer than {IDEMPOTENCY_KEY_MAX} characters")
+
+    # Insert, or take over a key whose owner gave up or whose response has expired
+    owned = await db.fetchval("""
+        INSERT INTO cicada.idempotency_keys (user_id, key, fingerprint)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (user_id, key) DO UPDATE
+        SET fingerprint = EXCLUDED.fingerprint, response = NULL, created_at = NOW()
+        WHERE idempotency_keys.created_at < NOW() - make_interval(secs =>
+            CASE WHEN idempotency_keys.response IS NULL THEN $4::float8 ELSE $5::float8 END)
+        RETURNING TRUE
+    """, user_id, key, request_fingerprint, IDEMPOTENCY_PENDING_SECONDS, IDEMPOTENCY_TTL_HOURS * 3600)
+    if owned:
+        _stats["claimed"] += 1
+        if _stats["claimed"] % IDEMPOTENCY_PRUNE_EVERY == 0:
+            await prune(db)
+        return None
+
+    row = await db.fetchrow("""
+        SELECT fingerprint, response FROM cicada.idempotency_keys
+        WHERE user_id = $1 AND key = $2
+    """, user_id, key)
+    if row is None:
+        # Released between the two statements; claim again
+        return await claim(db, user_id, key, request_fingerprint)
+    if row["fingerprint"] != request_fingerprint:
+        _stats["conflicts"] += 1
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    if row["response"] is None:
+        _stats["conflicts"] += 1
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+    _stats["replayed"] += 1
+    return json.loads(row["response"])
+
+
+async def store(db, user_id, key, response):
+    await db.execute("""
+        UPDATE cicada.idempotency_keys SET response = $3::jsonb
+        WHERE user_id = $1 AND key = $2
+    """, user_id, key, json.dumps(response))
+
+
+async def release(db, user_id, key):
+    """Drop an unfinished claim so the client can retry with the same key."""
+    await db.execute("""
+        DELETE FROM cicada.idempotency_keys
+        WHERE user_id = $1 AND key = $2 AND response IS NULL
+    """, user_id, key)
+
+
+async def prune(db):
+    await db.execute("""
+        DELETE FROM cicada.idempotency_keys
+        WHERE created_at < NOW() - make_interval(secs => $1)
+    """, IDEMPOTENCY_TTL_HOURS * 3600)
+
+
+async def run_idempotent(key, user_id, route, body, run, db=None):
+    """
+    Run `run()` at most once per (user, key). Without a key it just runs.
+    Pass the request's connection as db to avoid checking out a second one.
+    """
+    if not key:
+        return await run()
+
+    request_fingerprint = fingerprint(route, body)
+    async with _connection(db) as conn:
+        stored = await claim(conn, user_id, key, request_fingerprint)
+    if stored is not None:
+        return stored
+
+    try:
+        response = jsonable_encoder(await run())
+    except BaseException:
+        async with _connection(db) as conn:
+            await release(conn, user_id, key)
+        raise
+
+    async with _connection(db) as conn:
+        await store(conn, user_id, key, response)
+    return response
+
+
+def idempotency_stats():
+    return dict(_stats)
@@ -0,0 +1,180 @@
+# jobs.py
+# Postgres-backed queue for LLM work. The API enqueues a job and returns its id
+# straight away; worker.py claims jobs with FOR UPDATE SKIP LOCKED, runs them and
+# writes the results (and the session messages and mastery they imply) itself, so
+# nothing is lost when a client disconnects. Finished jobs are announced on
+# JOB_DONE_CHANNEL so pollers can long-poll instead of spinning.
+import asyncio
+import json
+import os
+
+from dotenv import load_dotenv
+
+from db import acquire
+from listener import subscribe
+
+load_dotenv()
+
+JOB_CHANNEL = "llm_jobs"
+JOB_DONE_CHANNEL = "llm_jobs_done"
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+JOB_POLL_WAIT_MAX = float(os.getenv("JOB_POLL_WAIT_MAX", "30"))
+
+PENDING = ("queued", "running")
+
+_waiters = {}  # job id -> {asyncio.Event}
+
+
+async def enqueue(db, kind, user_id, payload):
+    """Queue a job and wake the workers; returns the job id."""
+    return await db.fetchval("""
+        WITH job AS (
+            INSERT INTO cicada.llm_jobs (kind, user_id, payload)
+            VALUES ($1, $2, $3::jsonb)
+            RETURNING id
+        )
+        SELECT id, pg_notify($4, id::text) FROM job
+    """, kind, user_id, json.dumps(payload), JOB_CHANNEL)
+
+
+async def claim(db, worker, limit):
+    """
+    Lease up to `limit` runnable jobs. Jobs whose lease ran out (a crashed or
+    hung worker) are picked up again until they have used JOB_MAX_ATTEMPTS.
+    """
+    await expire(db)
+    return await db.fetch("""
+        UPDATE cicada.llm_jobs j
+        SET status = 'running',
+            attempts = j.attempts + 1,
+            started_at = NOW(),
+            locked_until = NOW() + make_interval(secs => $2),
+            worker = $3
+        FROM (
+            SELECT id FROM cicada.llm_jobs
+            WHERE (status = 'queued' AND run_after <= NOW())
+               OR (status = 'running' AND locked_until < NOW() AND attempts < $4)
+            ORDER BY id
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        ) next
+        WHERE j.id = next.id
+        RETURNING j.id, j.kind, j.user_id, j.payload, j.attempts
+    """, limit, JOB_LEASE_SECONDS, worker, JOB_MAX_ATTEMPTS)
+
+
+async def expire(db):
+    """Fail jobs whose lease ran out on their last attempt, so a job that kills its worker isn't retried forever."""
+    rows = await db.fetch("""
+        UPDATE cicada.llm_jobs j
+        SET status = 'failed', error = 'Lease expired after the last attempt', locked_until = NULL, finished_at = NOW()
+        FROM (
+            SELECT id FROM cicada.llm_jobs
+            WHERE status = 'running' AND locked_until < NOW() AND attempts >= $1
+            FOR UPDATE SKIP LOCKED
+        ) expired
+        WHERE j.id = expired.id
+        RETURNING j.id
+    """, JOB_MAX_ATTEMPTS)
+    for row in rows:
+        await db.execute("SELECT pg_notify($1, $2)", JOB_DONE_CHANNEL, str(row["id"]))
+
+
+async def extend_lease(db, job_ids):
+    """Keep long-running jobs leased so other workers don't pick them up again."""
+    await db.execute("""
+        UPDATE cicada.llm_jobs
+        SET locked_until = NOW() + make_interval(secs => $2)
+        WHERE id = ANY($1::bigint[]) AND status = 'running'
+    """, job_ids, JOB_LEASE_SECONDS)
+
+
+async def finish(db, job_id, result):
+    await db.execute("""
+        UPDATE cicada.llm_jobs
+        SET status = 'done', result = $2::jsonb, error = NULL, locked_until = NULL, finished_at = NOW()
+        WHERE id = $1
+    """, job_id, json.dumps(result, default=str))
+    await db.execute("SELECT pg_notify($1, $2)", JOB_DONE_CHANNEL, str(job_id))
+
+
+async def fail(db, job_id, error, attempts, retry=True):
+    """Requeue with backoff while attempts remain, otherwise mark the job failed."""
+    if retry and attempts < JOB_MAX_ATTEMPTS:
+        await db.execute("""
+            UPDATE cicada.llm_jobs
+            SET status = 'queued', error = $2, locked_until = NULL,
+                run_after = NOW() + make_interval(secs => $3)
+            WHERE id = $1
+        """, job_id, error, float(2 ** attempts))
+        return
+    await db.execute("""
+        UPDATE cicada.llm_jobs
+        SET status = 'failed', error = $2, locked_until = NULL, finished_at = NOW()
+        WHERE id = $1
+    """, job_id, error)
+    await db.execute("SELECT pg_notify($1, $2)", JOB_DONE_CHANNEL, str(job_id))
+
+
+async def prune(db):
+    await db.execute("""
+        DELETE FROM cicada.llm_jobs
+        WHERE finished_at < NOW() - make_interval(secs => $1)
+    """, JOB_RETENTION_HOURS * 3600)
+
+
+def _as_response(row):
+    return {
+        "job_id": row["id"],
+        "kind": row["kind"],
+        "status": row["status"],
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"] if row["status"] == "failed" else None,
+        "attempts": row["attempts"],
+        "created_at": row["created_at"],
+        "finished_at": row["finished_at"],
+    }
+
+
+async def _get_job(job_id, user_id):
+    async with acquire() as db:
+        row = await db.fetchrow("""
+            SELECT id, kind, status, result, error, attempts, created_at, finished_at
+            FROM cicada.llm_jobs
+            WHERE id = $1 AND user_id = $2
+        """, job_id, user_id)
+    return _as_response(row) if row else None
+
+
+async def fetch_job(job_id, user_id, wait=0):
+    """The job as seen by its owner, or None. With wait > 0, long-polls until it finishes."""
+    # Register before reading so a completion between the read and the wait isn't missed
+    event = asyncio.Event()
+    _waiters.setdefault(job_id, set()).add(event)
+    try:
+        job = await _get_job(job_id, user_id)
+        if job is None or job["status"] not in PENDING or wait <= 0:
+            return job
+        try:
+            await asyncio.wait_for(event.wait(), timeout=min(wait, JOB_POLL_WAIT_MAX))
+        except asyncio.TimeoutError:
+            return job
+        return await _get_job(job_id, user_id)
+    finally:
+        waiters = _waiters.get(job_id)
+        if waiters is not None:
+            waiters.discard(event)
+            if not waiters:
+                del _waiters[job_id]
+
+
+def _on_done(payload):
+    for event in _waiters.get(int(payload), ()):
+        event.set()
+
+
+def start_jobs():
+    """Subscribe to job completions. Call before listener.start_listener()."""
+    subscribe(JOB_DONE_CHANNEL, _on_done)
@@ -0,0 +1,79 @@
+# listener.py
+# One dedicated LISTEN connection per worker, shared by every in-process
+# subscriber. Notifications are dispatched to callbacks by channel; if the
+# connection drops it is re-established and on_reconnect hooks run so
+# subscribers can resync whatever they may have missed.
+import asyncio
+import logging
+import os
+
+import asyncpg
+
+from db import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+LISTENER_CHECK_SECONDS = float(os.getenv("LISTENER_CHECK_SECONDS", "5"))
+
+_handlers = {}        # channel -> [callback(payload)]
+_reconnect_hooks = []
+_conn = None
+_watchdog = None
+
+
+def subscribe(channel, callback, on_reconnect=None):
+    _handlers.setdefault(channel, []).append(callback)
+    if on_reconnect is not None:
+        _reconnect_hooks.append(on_reconnect)
+
+
+def is_connected():
+    return _conn is not None and not _conn.is_closed()
+
+
+def _dispatch(connection, pid, channel, payload):
+    for callback in _handlers.get(channel, []):
+        try:
+            callback(payload)
+        except Exception:
+            logger.exception("Notification handler for %s failed", channel)
+
+
+async def _connect():
+    global _conn
+    _conn = await asyncpg.connect(DATABASE_URL)
+    for channel in _handlers:
+        await _conn.add_listener(channel, _dispatch)
+
+
+async def _watch():
+    while True:
+        await asyncio.sleep(LISTENER_CHECK_SECONDS)
+        if is_connected():
+            continue
+        try:
+            await _connect()
+            logger.info("LISTEN connection re-established")
+            for hook in _reconnect_hooks:
+                await hook()
+        except Exception:
+            logger.exception("Could not re-establish LISTEN connection")
+
+
+async def start_listener():
+    global _watchdog
+    try:
+        await _connect()
+    except Exception:
+        logger.exception("Could not open LISTEN connection, will keep retrying")
+    _watchdog = asyncio.create_task(_watch())
+
+
+async def stop_listener():
+    global _conn, _watchdog
+    if _watchdog is not None:
+        _watchdog.cancel()
+        _watchdog = None
+    if is_connected():
+        await _conn.close()
+    _conn = None
@@ -0,0 +1,344 @@
+# llm.py
+# Async gateway for chat completions: bounded concurrency, per-call timeouts and
+# retries with jittered backoff. LLM_BACKEND=fake swaps in a local backend so the
+# API can be load-tested without the network.
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from metrics import observe_llm
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")  # 'openai' or 'fake'
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+# On shutdown, after the server has finished its requests, how long to let
+# background calls (session summaries) finish before closing the client
+LLM_DRAIN_SECONDS = float(os.getenv("LLM_DRAIN_SECONDS", "20"))
+LLM_FAKE_LATENCY_MS = float(os.getenv("LLM_FAKE_LATENCY_MS", "800"))
+LLM_FAKE_JITTER_MS = float(os.getenv("LLM_FAKE_JITTER_MS", "200"))
+LLM_FAKE_PASS_RATE = float(os.getenv("LLM_FAKE_PASS_RATE", "0.5"))
+# Share of fake answers from models other than LLM_FAKE_STRONG_MODEL that come back
+# unparseable, to exercise model routing's escalation
+LLM_FAKE_GARBLE_RATE = float(os.getenv("LLM_FAKE_GARBLE_RATE", "0"))
+LLM_FAKE_STRONG_MODEL = os.getenv("LLM_MODEL_LARGE", "gpt-4")
+
+
+@dataclass
+class Completion:
+    content: str
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class RetryableLLMError(Exception):
+    pass
+
+
+class FakeBackend:
+    """Answers after a configurable delay, without calling out to the network."""
+
+    def __init__(self, latency_ms=LLM_FAKE_LATENCY_MS, jitter_ms=LLM_FAKE_JITTER_MS):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+
+    async def complete(self, messages, model, max_tokens, temperature, tool=None):
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        await asyncio.sleep(max(delay, 0) / 1000)
+        prompt = " ".join(m["content"] for m in messages)
+        if model != LLM_FAKE_STRONG_MODEL and random.random() < LLM_FAKE_GARBLE_RATE:
+            content = "Sure!"
+        else:
+            content = self.reply_for(prompt)
+        return Completion(
+            content=content,
+            model=model,
+            prompt_tokens=len(prompt) // 4,
+            completion_tokens=len(content) // 4,
+        )
+
+    async def stream(self, messages, model, max_tokens, temperature, tool=None):
+        completion = await self.complete(messages, model, max_tokens, temperature, tool)
+        # Re-emit the canned reply word by word, like a real token stream
+        for word in completion.content.split(" "):
+            await asyncio.sleep(0.01)
+            yield word + " "
+
+    def reply_for(self, prompt):
+        if "evaluating a learner's response" in prompt:
+            # Arguments for the submit_evaluation tool
+            score = 1 if random.random() < LLM_FAKE_PASS_RATE else 0
+            return json.dumps({
+                "score": score,
+                "feedback": "Fake evaluation: correct. Well done." if score else "Fake evaluation: the result is wrong.",
+                "followup": "" if score else "Can you try again?",
+                "evidence": [{
+                    "observable": "Returns the correct result",
+                    "objective": "Objective",
+                    "score": score,
+                    "importance": 3,
+                    "feedback": "Good" if score else "Wrong result",
+                }],
+                "confidence": 0.9,
+            })
+        if "running summary" in prompt:
+            return "The learner has been practising Python basics."
+        if "asked for help" in prompt:
+            return "Try breaking the problem into smaller steps."
+        return f"Write a Python function that returns the sum of a list of numbers. ({random.getrandbits(32):08x})"
+
+    async def close(self):
+        pass
+
+
+def _tool_args(tool):
+    """Force a call to `tool` ({"name", "description", "parameters"}) so the reply is its JSON arguments."""
+    if tool is None:
+        return {}
+    return {
+        "tools": [{"type": "function", "function": tool}],
+        "tool_choice": {"type": "function", "function": {"name": tool["name"]}},
+    }
+
+
+class OpenAIBackend:
+    def __init__(self):
+        from openai import AsyncOpenAI
+
+        # Retries are handled by the gateway so backoff stays in one place
+        self.client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            timeout=LLM_TIMEOUT,
+            max_retries=0,
+        )
+
+    async def complete(self, messages, model, max_tokens, temperature, tool=None):
+        import openai
+
+        try:
+            response = await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                **_tool_args(tool),
+            )
+        except (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError) as e:
+            raise RetryableLLMError(str(e)) from e
+        except openai.APIStatusError as e:
+            if e.status_code >= 500:
+                raise RetryableLLMError(str(e)) from e
+            raise
+
+        usage = response.usage
+        message = response.choices[0].message
+        if tool is not None and message.tool_calls:
+            content = message.tool_calls[0].function.arguments
+        else:
+            content = message.content or ""
+        return Completion(
+            content=content.strip(),
+            model=response.model,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+        )
+
+    async def stream(self, messages, model, max_tokens, temperature, tool=None):
+        import openai
+
+        try:
+            stream = await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                **_tool_args(tool),
+            )
+        except (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError) as e:
+            raise RetryableLLMError(str(e)) from e
+        except openai.APIStatusError as e:
+            if e.status_code >= 500:
+                raise RetryableLLMError(str(e)) from e
+            raise
+
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if tool is not None and delta.tool_calls:
+                    # The tool's JSON arguments arrive in pieces, like content
+                    if delta.tool_calls[0].function.arguments:
+                        yield delta.tool_calls[0].function.arguments
+                elif delta.content:
+                    yield delta.content
+        finally:
+            # Frees the HTTP connection when the client disconnects mid-stream
+            await stream.close()
+
+    async def close(self):
+        await self.client.close()
+
+
+class LLMGateway:
+    def __init__(self, backend, max_concurrency=LLM_MAX_CONCURRENCY):
+        self.backend = backend
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.stats = {"calls": 0, "retries": 0, "failures": 0, "in_flight": 0}
+        # Calls in progress, including ones queued on the semaphore or backing off
+        self.active = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.draining = False
+
+    def _enter(self):
+        if self.draining:
+            raise HTTPException(status_code=503, detail="Server is shutting down, try again")
+        self.active += 1
+        self.idle.clear()
+
+    def _exit(self):
+        self.active -= 1
+        if self.active == 0:
+            self.idle.set()
+
+    async def complete(self, messages, model="gpt-4", max_tokens=300, temperature=0.7, tool=None):
+        """With a tool, the model must call it and the content is the call's JSON arguments."""
+        self._enter()
+        try:
+            return await self._complete(messages, model, max_tokens, temperature, tool)
+        finally:
+            self._exit()
+
+    async def _complete(self, messages, model, max_tokens, temperature, tool):
+        attempt = 0
+        start = time.perf_counter()
+        while True:
+            try:
+                async with self.semaphore:
+                    self.stats["in_flight"] += 1
+                    try:
+                        result = await asyncio.wait_for(
+                            self.backend.complete(messages, model, max_tokens, temperature, tool),
+                            timeout=LLM_TIMEOUT,
+                        )
+                    finally:
+                        self.stats["in_flight"] -= 1
+                self.stats["calls"] += 1
+                observe_llm(model, time.perf_counter() - start, "ok",
+                            result.prompt_tokens, result.completion_tokens, attempt)
+                return result
+            except (RetryableLLMError, asyncio.TimeoutError):
+                attempt += 1
+                if attempt > LLM_MAX_RETRIES:
+                    self.stats["failures"] += 1
+                    observe_llm(model, time.perf_counter() - start, "failed", retries=attempt - 1)
+                    raise HTTPException(status_code=503, detail="Tutor model unavailable, try again")
+                self.stats["retries"] += 1
+                # Full jitter: sleep a random amount up to the exponential cap
+                cap = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** (attempt - 1))
+                await asyncio.sleep(random.uniform(0, cap))
+
+    async def stream(self, messages, model="gpt-4", max_tokens=300, temperature=0.7, tool=None):
+        """Yield content deltas as they arrive. Retries only happen before the first token."""
+        self._enter()
+        try:
+            async for delta in self._stream(messages, model, max_tokens, temperature, tool):
+                yield delta
+        finally:
+            self._exit()
+
+    async def _stream(self, messages, model, max_tokens, temperature, tool):
+        attempt = 0
+        start = time.perf_counter()
+        while True:
+            started = False
+            deltas = 0
+            try:
+                async with self.semaphore:
+                    self.stats["in_flight"] += 1
+                    try:
+                        tokens = self.backend.stream(messages, model, max_tokens, temperature, tool)
+                        while True:
+                            try:
+                                delta = await asyncio.wait_for(tokens.__anext__(), timeout=LLM_TIMEOUT)
+                            except StopAsyncIteration:
+                                break
+                            started = True
+                            deltas += 1
+                            yield delta
+                    finally:
+                        self.stats["in_flight"] -= 1
+                        await tokens.aclose()
+                self.stats["calls"] += 1
+                # Streams don't report usage; each delta is roughly one completion token
+                observe_llm(model, time.perf_counter() - start, "ok", completion_tokens=deltas, retries=attempt)
+                return
+            except (RetryableLLMError, asyncio.TimeoutError):
+                attempt += 1
+                if started or attempt > LLM_MAX_RETRIES:
+                    self.stats["failures"] += 1
+                    observe_llm(model, time.perf_counter() - start, "failed", completion_tokens=deltas, retries=attempt - 1)
+                    raise HTTPException(status_code=503, detail="Tutor model unavailable, try again")
+                self.stats["retries"] += 1
+                cap = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** (attempt - 1))
+                await asyncio.sleep(random.uniform(0, cap))
+
+    async def drain(self, timeout=LLM_DRAIN_SECONDS):
+        """Refuse new calls and wait for running ones; True if everything finished in time."""
+        self.draining = True
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def close(self):
+        await self.backend.close()
+
+
+_gateway = None
+
+
+def init_gateway():
+    global _gateway
+    if _gateway is None:
+        backend = FakeBackend() if LLM_BACKEND == "fake" else OpenAIBackend()
+        _gateway = LLMGateway(backend)
+    return _gateway
+
+
+async def close_gateway(drain_timeout=LLM_DRAIN_SECONDS):
+    global _gateway
+    if _gateway is not None:
+        if not await _gateway.drain(drain_timeout):
+            logger.warning("Closing LLM gateway with %s calls still running", _gateway.active)
+        await _gateway.close()
+        _gateway = None
+
+
+def get_gateway():
+    if _gateway is None:
+        raise RuntimeError("LLM gateway is not initialized")
+    return _gateway
+
+
+def gateway_stats():
+    if _gateway is None:
+        return {}
+    return {**_gateway.stats, "active": _gateway.active, "draining": _gateway.draining}
@@ -0,0 +1,91 @@
+# loopmon.py
+# Samples event-loop lag: a task asks to wake every LOOP_SAMPLE_INTERVAL and
+# records how late it actually woke. Sustained lag means something is blocking
+# the loop (sync I/O, CPU-heavy work in a handler).
+#
+# A watchdog thread also watches the sampler's heartbeat. If the loop is held for
+# longer than LOOP_BLOCK_THRESHOLD_MS, it logs the loop thread's stack while the
+# blocking code is still running, so the log points at the offending line.
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from metrics import loop_blocked
+
+LOOP_SAMPLE_INTERVAL = float(os.getenv("LOOP_SAMPLE_INTERVAL", "0.1"))
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "250"))  # 0 disables the watchdog
+
+logger = logging.getLogger(__name__)
+
+_task = None
+_watchdog = None
+_stop = threading.Event()
+_last_beat = 0.0
+_stats = {"samples": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0, "blocked": 0}
+
+
+async def _sample():
+    global _last_beat
+    while True:
+        start = time.perf_counter()
+        _last_beat = time.monotonic()
+        await asyncio.sleep(LOOP_SAMPLE_INTERVAL)
+        lag = max(0.0, (time.perf_counter() - start - LOOP_SAMPLE_INTERVAL) * 1000)
+        _stats["samples"] += 1
+        _stats["total_ms"] += lag
+        _stats["last_ms"] = lag
+        _stats["max_ms"] = max(_stats["max_ms"], lag)
+
+
+def _watch(loop_thread_id):
+    threshold = LOOP_BLOCK_THRESHOLD_MS / 1000
+    reported_beat = None
+    while not _stop.wait(threshold / 2):
+        beat = _last_beat
+        held = time.monotonic() - beat - LOOP_SAMPLE_INTERVAL
+        if held < threshold or beat == reported_beat:
+            continue
+        # One report per blocking episode
+        reported_beat = beat
+        _stats["blocked"] += 1
+        loop_blocked.inc()
+        frame = sys._current_frames().get(loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame else "(no frame)"
+        logger.warning("Event loop blocked for %.0f ms so far, loop thread is at:\n%s", held * 1000, stack)
+
+
+def start_loop_monitor():
+    global _task, _watchdog, _last_beat
+    if _task is None:
+        _last_beat = time.monotonic()
+        _task = asyncio.create_task(_sample())
+    if _watchdog is None and LOOP_BLOCK_THRESHOLD_MS > 0:
+        _stop.clear()
+        _watchdog = threading.Thread(target=_watch, args=(threading.get_ident(),), name="loop-watchdog", daemon=True)
+        _watchdog.start()
+
+
+def stop_loop_monitor():
+    global _task, _watchdog
+    if _task is not None:
+        _task.cancel()
+        _task = None
+    if _watchdog is not None:
+        _stop.set()
+        _watchdog.join(timeout=1)
+        _watchdog = None
+
+
+def loop_lag_stats():
+    samples = _stats["samples"]
+    return {
+        "samples": samples,
+        "avg_ms": round(_stats["total_ms"] / samples, 3) if samples else 0.0,
+        "max_ms": round(_stats["max_ms"], 3),
+        "last_ms": round(_stats["last_ms"], 3),
+        "blocked": _stats["blocked"],
+    }
@@ -1,26 +1,73 @@
 # fastapi_backend/main.py
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from typing import List, Optional
 from uuid import UUID, uuid4
 from datetime import datetime
-import asyncpg
-from fastapi import Form, Depends
+from fastapi import Form, Depends, Header
 from fastapi.security import OAuth2PasswordBearer
-from auth_utils import hash_password, verify_password, create_access_token
+from auth_utils import hash_password_async, verify_and_update_async, create_access_token, email_limiter, ip_limiter
 from jose import JWTError, jwt
 from dotenv import load_dotenv
 import os
-from openai import OpenAI
 import json
-from fastapi import Request
+import asyncio
+import anyio
+import logging
+import signal
+from fastapi import Request, Query, WebSocket, WebSocketDisconnect
+from db import get_db, acquire, init_pool, close_pool, pool_stats
+from llm import init_gateway, close_gateway, gateway_stats
+import routing
+from routing import RoutedStream, routing_stats
+from schema import ensure_schema
+from question_bank import build_question_prompt, pick_unseen_question, add_question, mark_served, serve_question, question_ok
+from assessment import evaluation_messages, parse_evaluation, evaluation_accepted, build_help_prompt, evaluate_answer, local_precheck, save_evaluation, EVALUATION_TOOL, FeedbackStream
+from cache import TTLCache
+from messages import fetch_message_page, insert_messages, owns_session
+from catalog import catalog, start_catalog, stop_catalog
+from mastery import start_mastery, next_unmastered_lo, mark_mastery, mastery_stats
+from listener import start_listener, stop_listener, is_connected as listener_connected
+import eval_cache
+from eval_cache import EVALUATION_TEMPERATURE
+from code_check import precheck_stats
+from context import build_context, context_stats
+from loopmon import start_loop_monitor, stop_loop_monitor, loop_lag_stats
+import jobs
+from idempotency import run_idempotent, idempotency_stats
+import idempotency
+from pubsub import start_pubsub, session_subscription, pubsub_stats
+from jobs import start_jobs
+from proficiency import COHORT_CACHE_TTL, record_proficiency, load_snapshot, proficiency_label, cohort_summary, evidence_summary, evidence_rows
+from metrics import setup_logging, instrument_request, register_gauge, render_metrics
+from responses import FastJSONResponse, CompressionMiddleware
 
 load_dotenv()
+setup_logging()
+logger = logging.getLogger(__name__)
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")  # fallback if not in .env
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# Authenticated principals are cached briefly so hot endpoints skip the users lookup.
+# With TRUST_TOKEN_CLAIMS on, profile claims are embedded in the JWT at login and
+# trusted until the token expires, so those requests skip the database entirely.
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "4096"))
+TRUST_TOKEN_CLAIMS = os.getenv("TRUST_TOKEN_CLAIMS", "false").lower() == "true"
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+principal_stats = { "from_claims": 0 }
+
+MESSAGE_PAGE_MAX = int(os.getenv("MESSAGE_PAGE_MAX", "500"))
+MESSAGE_BATCH_MAX = int(os.getenv("MESSAGE_BATCH_MAX", "50"))
+OBJECTIVES_MAX_AGE = int(os.getenv("OBJECTIVES_MAX_AGE", "60"))
+READYZ_TIMEOUT = float(os.getenv("READYZ_TIMEOUT", "2"))
+# After SIGTERM, keep serving (with /readyz at 503) this long before the server stops listening
+SHUTDOWN_DELAY_SECONDS = float(os.getenv("SHUTDOWN_DELAY_SECONDS", "5"))
+stopping = False
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
@@ -34,13 +81,68 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
-# DB connection (adjust credentials)
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-async def get_db():
-    return await asyncpg.connect(DATABASE_URL)
+# 🗜️ Brotli/gzip for larger responses (message history, reports); SSE streams are left alone
+app.add_middleware(CompressionMiddleware)
+
+# 📈 Request id, per-route latency and access log for every request
+app.middleware("http")(instrument_request)
+
+register_gauge("cicada_db_pool_in_use", "Pooled connections checked out", lambda: pool_stats().get("in_use", 0))
+register_gauge("cicada_db_pool_size", "Open pooled connections", lambda: pool_stats().get("size", 0))
+register_gauge("cicada_llm_in_flight", "LLM calls in progress", lambda: gateway_stats().get("in_flight", 0))
+register_gauge("cicada_event_loop_lag_ms", "Most recent event-loop lag sample", lambda: loop_lag_stats()["last_ms"])
+
+
+@app.on_event("startup")
+async def startup():
+    await init_pool()
+    async with acquire() as db:
+        await ensure_schema(db)
+    await start_catalog()
+    start_mastery()
+    start_jobs()
+    start_pubsub()
+    await start_listener()
+    init_gateway()
+    start_loop_monitor()
+    delay_sigterm()
+
+
+def delay_sigterm():
+    """
+    uvicorn stops accepting connections as soon as it gets SIGTERM, and only
+    runs the shutdown hook after in-flight requests finish, so a load balancer
+    would never see /readyz fail. This wraps uvicorn's own handler: SIGTERM
+    flips readiness to 503 right away, and the server gets the signal
+    SHUTDOWN_DELAY_SECONDS later. A second SIGTERM stops at once.
+    """
+    server_handler = signal.getsignal(signal.SIGTERM)
+    if SHUTDOWN_DELAY_SECONDS <= 0 or not callable(server_handler):
+        return
+    loop = asyncio.get_running_loop()
+
+    def on_sigterm(sig, frame):
+        global stopping
+        if stopping:
+            server_handler(sig, frame)
+            return
+        stopping = True
+        logger.info("SIGTERM: not ready, stopping in %ss", SHUTDOWN_DELAY_SECONDS)
+        loop.call_soon_threadsafe(loop.call_later, SHUTDOWN_DELAY_SECONDS, server_handler, sig, frame)
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    stop_loop_monitor()
+    await close_gateway()
+    await stop_catalog()
+    await stop_listener()
+    await close_pool()
 
 
 # --- MODELS ---
@@ -52,11 +154,20 @@ class UserProfile(BaseModel):
 
 
 class SessionMessage(BaseModel):
+    id: Optional[int] = None
     session_id: UUID
     lo_id: int
     role: str
     text: str
     activity_type: Optional[str] = "chat"
+    timestamp: Optional[datetime] = None
+
+
+class SessionMessagePage(BaseModel):
+    messages: List[SessionMessage]
+    has_more: bool
+    before_cursor: Optional[str] = None
+    sync_cursor: Optional[str] = None
 
 
 class SessionMessage_1(BaseModel):
@@ -78,11 +189,26 @@ class SessionStartRequest(BaseModel):
 class AssessmentRequest(BaseModel):
     lo_id: int
 
+class AssessmentJobRequest(BaseModel):
+    lo_id: int
+    # When set, the worker also stores the question in this session's messages
+    session_id: Optional[UUID] = None
+
 class EvaluationRequest(BaseModel):
     session_id: UUID
     lo_id: int
     question: str
     user_input: str
+    # Bank question being answered; its attached tests are run before LLM grading
+    question_id: Optional[int] = None
+    # Store the answer and the tutor's reply with the evaluation, in one transaction
+    persist: bool = False
+
+class HelpRequest(BaseModel):
+    lo_id: int
+    text: str
+    # Store the help request and the hint as session messages
+    persist: bool = True
 
 class SessionMessageInput(BaseModel):
     lo_id: int
@@ -90,23 +216,23 @@ class SessionMessageInput(BaseModel):
     text: str
     activity_type: str = "chat"
 
+    def as_row(self):
+        return (self.lo_id, self.role, self.text, self.activity_type)
+
 # --- ROUTES ---
 @app.post("/api/user", response_model=UserProfile)
-async def create_or_update_user(profile: UserProfile):
-    db = await get_db()
+async def create_or_update_user(profile: UserProfile, db=Depends(get_db)):
     await db.execute("""
         INSERT INTO cicada.users (id, name, email, python_level)
         VALUES ($1, $2, $3, $4)
         ON CONFLICT (id) DO UPDATE SET name = $2, email = $3, python_level = $4
     """, profile.id, profile.name, profile.email, profile.python_level)
-    await db.close()
+    principal_cache.invalidate(profile.id)
     return profile
 
 @app.get("/api/user/{user_id}", response_model=UserProfile)
-async def get_user(user_id: UUID):
-    db = await get_db()
+async def get_user(user_id: UUID, db=Depends(get_db)):
     row = await db.fetchrow("SELECT * FROM cicada.users WHERE id = $1", user_id)
-    await db.close()
     if not row:
         raise HTTPException(status_code=404, detail="User not found")
     return UserProfile(**row)
@@ -114,79 +240,45 @@ async def get_user(user_id: UUID):
 
 
 @app.post("/api/session/start")
-async def start_session(data: SessionStartRequest):
-    db = await get_db()
-
-    # ✅ Reuse active tutor session if it exists and hasn't asked a question yet
-    # if data.mode == "tutor" and not data.lo_id:
-    #     existing = await db.fetchrow("""
-    #         SELECT s.id, s.lo_id
-    #         FROM cicada.sessions s
-    #         LEFT JOIN cicada.session_messages m
-    #         ON s.id = m.session_id AND m.lo_id = s.lo_id
-    #         WHERE s.user_id = $1 AND s.mode = 'tutor' AND s.status = 'active'
-    #         GROUP BY s.id, s.lo_id
-    #         HAVING COUNT(CASE WHEN m.role = 'tutor' AND m.text LIKE '🧠%' THEN 1 END) = 0
-    #         ORDER BY s.created_at DESC
-    #         LIMIT 1
-    #     """, data.user_id)
-
-    #     if existing:
-    #         await db.close()
-    #         return {
-    #             "session_id": str(existing["id"]),
-    #             "lo_id": existing["lo_id"]
-    #         }
+async def start_session(data: SessionStartRequest, idempotency_key: Optional[str] = Header(None), db=Depends(get_db)):
+    async def run():
+        return await create_or_reuse_session(db, data)
+    return await run_idempotent(idempotency_key, data.user_id, "start_session", data, run, db=db)
 
+
+async def create_or_reuse_session(db, data):
     if data.mode == "tutor":
-        existing = await db.fetchrow("""
-            SELECT id, lo_id FROM cicada.sessions
-            WHERE user_id = $1 AND mode = 'tutor' AND status = 'active'
-            ORDER BY created_at DESC
+        # 👇 If no lo_id is passed, start at the next unmastered LO
+        lo_id = data.lo_id or await next_unmastered_lo(db, data.user_id)
+        # ✅ One statement, backed by the unique index on active tutor sessions: concurrent
+        # starts (double clicks, StrictMode double effects) all get the same session back
+        row = await db.fetchrow("""
+            INSERT INTO cicada.sessions (id, user_id, mode, status, lo_id, created_at)
+            VALUES ($1, $2, 'tutor', 'active', $3, NOW())
+            ON CONFLICT (user_id) WHERE mode = 'tutor' AND status = 'active'
+            DO UPDATE SET lo_id = sessions.lo_id
+            RETURNING id, lo_id
+        """, uuid4(), data.user_id, lo_id)
+        return {
+            "session_id": str(row["id"]),
+            "lo_id": row["lo_id"]
+        }
+
+    # ✅ Browse mode: reuse the latest session for an LO that is already mastered
+    if data.mode == "browse" and data.lo_id:
+        existing = await db.fetchval("""
+            SELECT s.id FROM cicada.sessions s
+            JOIN cicada.learner_models m ON m.user_id = s.user_id AND m.lo_id = s.lo_id
+            WHERE s.user_id = $1 AND s.lo_id = $2 AND s.mode = 'browse' AND m.proficiency = 1
+            ORDER BY s.created_at DESC
             LIMIT 1
-        """, data.user_id)
-
+        """, data.user_id, data.lo_id)
         if existing:
-            await db.close()
             return {
-                "session_id": str(existing["id"]),
-                "lo_id": existing["lo_id"]
+                "session_id": str(existing),
+                "lo_id": data.lo_id
             }
 
-        # 👇 If no lo_id is passed, fetch next unmastered LO
-        if not data.lo_id:
-            lo = await db.fetchrow("""
-                SELECT l.id FROM cicada.learning_objectives l
-                LEFT JOIN cicada.learner_models m ON l.id = m.lo_id AND m.user_id = $1
-                WHERE COALESCE(m.proficiency, 0) < 1
-                ORDER BY l.id ASC
-                LIMIT 1
-            """, data.user_id)
-            if lo:
-                data.lo_id = lo["id"]
-
-    # ✅ Browse mode: reuse session if LO already mastered
-    if data.mode == "browse" and data.lo_id:
-        prof = await db.fetchval("""
-            SELECT proficiency FROM cicada.learner_models
-            WHERE user_id = $1 AND lo_id = $2
-        """, data.user_id, data.lo_id)
-
-        if prof == 1:
-            existing = await db.fetchrow("""
-                SELECT id FROM cicada.sessions
-                WHERE user_id = $1 AND lo_id = $2 AND mode = 'browse'
-                ORDER BY created_at DESC
-                LIMIT 1
-            """, data.user_id, data.lo_id)
-
-            if existing:
-                await db.close()
-                return {
-                    "session_id": str(existing["id"]),
-                    "lo_id": data.lo_id
-                }
-
     # ✅ Create new session
     session_id = uuid4()
     await db.execute("""
@@ -194,81 +286,126 @@ async def start_session(data: SessionStartRequest):
         VALUES ($1, $2, $3, 'active', $4, NOW())
     """, session_id, data.user_id, data.mode, data.lo_id)
 
-    await db.close()
     return {
         "session_id": str(session_id),
         "lo_id": data.lo_id
     }
 
 
-
-
-
-@app.get("/api/session/{session_id}/lo/{lo_id}/messages", response_model=List[SessionMessage])
-async def get_lo_messages(session_id: UUID, lo_id: int):
-    db = await get_db()
-    rows = await db.fetch("""
-        SELECT * FROM cicada.session_messages 
-        WHERE session_id = $1 AND lo_id = $2 
-        ORDER BY timestamp ASC
-    """, session_id, lo_id)
-    await db.close()
-    return [SessionMessage(**row) for row in rows]
-
-
-
-
 @app.put("/api/user/{user_id}/lo/{lo_id}")
-async def update_proficiency(user_id: UUID, lo_id: int, data: LearnerProficiency):
-    db = await get_db()
+async def update_proficiency(user_id: UUID, lo_id: int, data: LearnerProficiency, db=Depends(get_db)):
     await db.execute("""
         INSERT INTO cicada.learner_models (user_id, lo_id, proficiency, updated_at)
         VALUES ($1, $2, $3, NOW())
         ON CONFLICT (user_id, lo_id) DO UPDATE SET proficiency = $3, updated_at = NOW()
     """, user_id, lo_id, data.proficiency)
-    await db.close()
+    await record_proficiency(db, user_id, lo_id, data.proficiency)
+    await mark_mastery(db, user_id, lo_id, data.proficiency >= 1)
     return {"status": "updated"}
 
+async def check_attempts(*limited):
+    async with acquire() as db:
+        for limiter, key in limited:
+            retry_after = await limiter.hit(db, key)
+            if retry_after:
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many attempts, try again later",
+                    headers={"Retry-After": str(int(retry_after) + 1)}
+                )
+
+
+def client_ip(request: Request):
+    return request.client.host if request.client else "unknown"
+
+
 @app.post("/auth/register")
-async def register_user(name: str = Form(...), email: str = Form(...), password: str = Form(...)):
-    db = await get_db()
-    existing = await db.fetchrow("SELECT 1 FROM cicada.users WHERE email = $1", email)
+async def register_user(request: Request, name: str = Form(...), email: str = Form(...), password: str = Form(...)):
+    await check_attempts((ip_limiter, client_ip(request)))
+
+    async with acquire() as db:
+        existing = await db.fetchrow("SELECT 1 FROM cicada.users WHERE email = $1", email)
     if existing:
         raise HTTPException(status_code=409, detail="Email already registered")
 
-    await db.execute("""
-        INSERT INTO cicada.users (id, name, email, password_hash)
-        VALUES ($1, $2, $3, $4)
-    """, uuid4(), name, email, hash_password(password))
-    await db.close()
+    # Hash outside the connection so a slow bcrypt doesn't hold a pooled connection
+    password_hash = await hash_password_async(password)
+    async with acquire() as db:
+        await db.execute("""
+            INSERT INTO cicada.users (id, name, email, password_hash)
+            VALUES ($1, $2, $3, $4)
+        """, uuid4(), name, email, password_hash)
     return { "message": "Registered successfully" }
 
 @app.post("/auth/login")
-async def login_user(email: str = Form(...), password: str = Form(...)):
-    db = await get_db()
-    user = await db.fetchrow("SELECT * FROM cicada.users WHERE email = $1", email)
-    await db.close()
-    if not user or not verify_password(password, user["password_hash"]):
+async def login_user(request: Request, email: str = Form(...), password: str = Form(...)):
+    email_key = email.strip().lower()
+    await check_attempts((ip_limiter, client_ip(request)), (email_limiter, email_key))
+
+    async with acquire() as db:
+        user = await db.fetchrow("SELECT * FROM cicada.users WHERE email = $1", email)
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
-    token = create_access_token({ "sub": str(user["id"]) })
+    valid, new_hash = await verify_and_update_async(password, user["password_hash"])
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+
+    async with acquire() as db:
+        await email_limiter.reset(db, email_key)
+        if new_hash:
+            # bcrypt cost changed since this hash was made: upgrade it transparently
+            await db.execute("UPDATE cicada.users SET password_hash = $2 WHERE id = $1", user["id"], new_hash)
+
+    claims = { "sub": str(user["id"]) }
+    if TRUST_TOKEN_CLAIMS:
+        claims.update({
+            "name": user["name"],
+            "email": user["email"],
+            "python_level": user["python_level"]
+        })
+    token = create_access_token(claims)
     return { "access_token": token, "token_type": "bearer" }
 
+
+def to_principal(row):
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "email": row["email"],
+        "python_level": row["python_level"]
+    }
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token")
-        db = await get_db()
-        user = await db.fetchrow("SELECT * FROM cicada.users WHERE id = $1", UUID(user_id))
-        await db.close()
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
-    except JWTError:
+        user_id = UUID(user_id)
+    except (JWTError, ValueError):
         raise HTTPException(status_code=401, detail="Token invalid or expired")
 
+    if TRUST_TOKEN_CLAIMS and "email" in payload:
+        principal_stats["from_claims"] += 1
+        return {
+            "id": user_id,
+            "name": payload.get("name"),
+            "email": payload["email"],
+            "python_level": payload.get("python_level")
+        }
+
+    user = principal_cache.get(user_id)
+    if user is None:
+        async with acquire() as db:
+            row = await db.fetchrow("SELECT * FROM cicada.users WHERE id = $1", user_id)
+        if not row:
+            raise HTTPException(status_code=401, detail="User not found")
+        user = to_principal(row)
+        principal_cache.set(user_id, user)
+    return user
+
 @app.get("/api/me")
 async def get_profile(current_user = Depends(get_current_user)):
     return {
@@ -279,10 +416,8 @@ async def get_profile(current_user = Depends(get_current_user)):
 
 
 @app.get("/api/session/{session_id}")
-async def get_session(session_id: UUID, current_user=Depends(get_current_user)):
-    db = await get_db()
+async def get_session(session_id: UUID, current_user=Depends(get_current_user), db=Depends(get_db)):
     session = await db.fetchrow("SELECT * FROM cicada.sessions WHERE id = $1", session_id)
-    await db.close()
     if not session or session["user_id"] != current_user["id"]:
         raise HTTPException(status_code=403, detail="Session not found or not authorized")
     return {
@@ -292,201 +427,394 @@ async def get_session(session_id: UUID, current_user=Depends(get_current_user)):
     }
 
 
+@app.get("/api/session/{session_id}/lo/{lo_id}/messages", response_model=SessionMessagePage)
+async def get_lo_messages(
+    session_id: UUID,
+    lo_id: int,
+    limit: int = Query(100, ge=1, le=MESSAGE_PAGE_MAX),
+    before: Optional[str] = None,
+    since: Optional[str] = None,
+    format: str = Query("full", pattern="^(full|compact)$"),
+    current_user=Depends(get_current_user),
+    db=Depends(get_db)
+):
+    await require_session(session_id, current_user["id"])
+    # Returned as a response so long histories skip jsonable_encoder and model validation
+    page = await fetch_message_page(
+        db, session_id, lo_id, limit=limit, before=before, since=since, compact=format == "compact"
+    )
+    return FastJSONResponse(page)
+
+
 @app.get("/api/session/{session_id}/messages")
-async def get_all_messages_for_session(session_id: UUID, current_user=Depends(get_current_user)):
-    db = await get_db()
-    rows = await db.fetch("""
-        SELECT * FROM cicada.session_messages
-        WHERE session_id = $1
-        ORDER BY timestamp ASC
-    """, session_id)
-    await db.close()
-    return [dict(r) for r in rows]
+async def get_all_messages_for_session(
+    session_id: UUID,
+    limit: int = Query(100, ge=1, le=MESSAGE_PAGE_MAX),
+    before: Optional[str] = None,
+    since: Optional[str] = None,
+    format: str = Query("full", pattern="^(full|compact)$"),
+    current_user=Depends(get_current_user),
+    db=Depends(get_db)
+):
+    await require_session(session_id, current_user["id"])
+    page = await fetch_message_page(
+        db, session_id, limit=limit, before=before, since=since, compact=format == "compact"
+    )
+    return FastJSONResponse(page)
 
 
 
 @app.post("/api/session/{session_id}/message")
-async def post_message(session_id: UUID, message: SessionMessageInput, current_user=Depends(get_current_user)):
-    db = await get_db()
-    await db.execute("""
-        INSERT INTO cicada.session_messages (session_id, lo_id, role, text, activity_type, timestamp)
-        VALUES ($1, $2, $3, $4, $5, $6)
-    """, session_id, message.lo_id, message.role, message.text, message.activity_type, datetime.utcnow())
-    await db.close()
-    return { "status": "ok" }
-
+async def post_message(
+    session_id: UUID,
+    message: SessionMessageInput,
+    idempotency_key: Optional[str] = Header(None),
+    current_user=Depends(get_current_user),
+    db=Depends(get_db)
+):
+    await require_session(session_id, current_user["id"])
+    async def run():
+        ids = await insert_messages(db, session_id, [message.as_row()])
+        return { "status": "ok", "id": ids[0] }
+    return await run_idempotent(idempotency_key, current_user["id"], f"post_message:{session_id}", message, run, db=db)
+
+
+@app.post("/api/session/{session_id}/messages")
+async def post_messages(
+    session_id: UUID,
+    messages: List[SessionMessageInput],
+    idempotency_key: Optional[str] = Header(None),
+    current_user=Depends(get_current_user),
+    db=Depends(get_db)
+):
+    if len(messages) > MESSAGE_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {MESSAGE_BATCH_MAX} messages per batch")
+    await require_session(session_id, current_user["id"])
+    async def run():
+        ids = await insert_messages(db, session_id, [m.as_row() for m in messages])
+        return { "status": "ok", "ids": ids }
+    return await run_idempotent(idempotency_key, current_user["id"], f"post_messages:{session_id}", messages, run, db=db)
+
+
+
+@app.websocket("/ws/session/{session_id}")
+async def session_socket(websocket: WebSocket, session_id: UUID, token: str, since: Optional[str] = None):
+    """
+    Pushes new messages and mastery changes for a session as they are committed.
+    Browsers can't set headers on a WebSocket, so the access token comes as ?token=.
+    Pass ?since=<sync_cursor> to first receive anything missed while disconnected.
+    """
+    try:
+        current_user = await get_current_user(token)
+    except HTTPException:
+        await websocket.close(code=4401)
+        return
+    async with acquire() as db:
+        owner = await db.fetchval("SELECT user_id FROM cicada.sessions WHERE id = $1", session_id)
+    if owner != current_user["id"]:
+        await websocket.close(code=4403)
+        return
+
+    await websocket.accept()
+    # Subscribe before catching up so nothing committed in between is lost (duplicates share ids)
+    with session_subscription(session_id, current_user["id"]) as subscriber:
+        # Replay page by page until caught up; a long disconnect can miss more than one page
+        while since:
+            try:
+                async with acquire() as db:
+                    page = await fetch_message_page(db, session_id, limit=MESSAGE_PAGE_MAX, since=since)
+            except HTTPException as e:
+                await websocket.close(code=4400, reason=str(e.detail))
+                return
+            if page["messages"]:
+                await websocket.send_json({ "type": "messages", **jsonable_encoder(page) })
+            since = page["sync_cursor"] if page["has_more"] else None
+
+        async def forward():
+            try:
+                while True:
+                    await websocket.send_json(await subscriber.queue.get())
+            except Exception:
+                pass  # client went away mid-send
+
+        async def drain():
+            # Nothing is expected from the client; this just notices the disconnect
+            try:
+                while True:
+                    await websocket.receive_text()
+            except WebSocketDisconnect:
+                pass
+
+        tasks = [asyncio.create_task(forward()), asyncio.create_task(drain())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def cached_json(request: Request, etag, content, cache_control):
+    """JSON response with an ETag, or an empty 304 if the client already has it."""
+    headers = { "ETag": etag, "Cache-Control": cache_control }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(content, headers=headers)
 
 
 @app.get("/api/objectives")
-async def list_learning_objectives():
-    db = await get_db()
-    rows = await db.fetch("SELECT * FROM cicada.learning_objectives ORDER BY id")
-    await db.close()
-    return [dict(r) for r in rows]
+async def list_learning_objectives(request: Request):
+    # Served from the in-memory catalog; clients revalidate with If-None-Match
+    return cached_json(request, catalog.etag, catalog.objectives, f"public, max-age={OBJECTIVES_MAX_AGE}")
 
 
 
 @app.get("/api/session/{current_lo_id}/next_lo")
-async def get_next_unmastered_lo(current_lo_id: int, current_user=Depends(get_current_user)):
-    db = await get_db()
-    rows = await db.fetch("""
-        SELECT l.id, COALESCE(m.proficiency, 0) as prof
-        FROM cicada.learning_objectives l
-        LEFT JOIN cicada.learner_models m ON l.id = m.lo_id AND m.user_id = $1
-        WHERE l.id > $2
-        ORDER BY l.id ASC
-    """, current_user["id"], current_lo_id)
-    await db.close()
-
-    for row in rows:
-        if row["prof"] < 1:
-            return {"next_lo_id": row["id"]}
+async def get_next_unmastered_lo(current_lo_id: int, current_user=Depends(get_current_user), db=Depends(get_db)):
+    return {"next_lo_id": await next_unmastered_lo(db, current_user["id"], current_lo_id)}
 
-    return {"next_lo_id": None}
 
+async def require_session(session_id, user_id):
+    """404 unless the session is the user's own, before its history is read or written."""
+    async with acquire() as db:
+        if not await owns_session(db, session_id, user_id):
+            raise HTTPException(status_code=404, detail="Session not found")
 
 #****************************************
 
 @app.post("/api/assessment_question")
 async def generate_assessment(data: AssessmentRequest, current_user=Depends(get_current_user)):
-    lo_id = data.lo_id
-    db = await get_db()
-    lo = await db.fetchrow("SELECT topic, objective FROM cicada.learning_objectives WHERE id = $1", lo_id)
-    await db.close()
+    lo = catalog.get(data.lo_id)
     if not lo:
         raise HTTPException(status_code=404, detail="LO not found")
 
-    prompt = f"""
-You are an expert Python tutor. Given the learning objective: "{lo['objective']}" from the topic "{lo['topic']}", generate a single clear, instructive assessment question (coding or short answer) that will effectively assess the user's mastery of this objective.
-
-Only return **ONE** question per request.
-The question should be standalone, and written clearly on a single topic.
-Do NOT return multiple questions.
-
-Only output the question text, nothing else.
-""".strip()
-
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": prompt}
-        ],
-        max_tokens=300,
-        temperature=0.7
-    )
-
-    return { "question": response.choices[0].message.content.strip() }
+    # ✅ Serve from the pre-generated bank when the learner hasn't seen everything yet
+    return await serve_question(current_user["id"], lo)
 
 
 @app.post("/api/evaluate_response")
 async def evaluate_response(
     data: EvaluationRequest,
+    idempotency_key: Optional[str] = Header(None),
     current_user=Depends(get_current_user)
 ):
-    db = await get_db()
-
-    lo = await db.fetchrow(
-        "SELECT topic, objective FROM cicada.learning_objectives WHERE id = $1",
-        data.lo_id
-    )
+    lo = catalog.get(data.lo_id)
     if not lo:
-        await db.close()
         raise HTTPException(status_code=404, detail="LO not found")
+    await require_session(data.session_id, current_user["id"])
+
+    # A retried request with the same Idempotency-Key gets the first result back,
+    # without a second LLM call or a second copy of the turn
+    async def run():
+        return await evaluate_answer(
+            lo, current_user["id"], data.session_id, data.question, data.user_input,
+            question_id=data.question_id, persist=data.persist
+        )
+    return await run_idempotent(idempotency_key, current_user["id"], "evaluate_response", data, run)
 
-    prompt = f"""
-You are an AI Python tutor evaluating a learner's response to a Python question based on the following learning objective:
 
-"{lo['objective']}"
+@app.post("/api/session/{session_id}/help")
+async def ask_for_help(session_id: UUID, data: HelpRequest, current_user=Depends(get_current_user)):
+    lo = catalog.get(data.lo_id)
+    if not lo:
+        raise HTTPException(status_code=404, detail="LO not found")
+    await require_session(session_id, current_user["id"])
 
-### Question Asked:
-{data.question}
+    # Bounded prompt: recent turns for this LO plus a running summary of older ones
+    async with acquire() as db:
+        messages = await build_context(db, session_id, data.lo_id, build_help_prompt(lo))
+    messages.append({ "role": "user", "content": data.text })
 
-### Learner Response:
-{data.user_input}
+    response = await routing.complete("help", messages, lo=lo, max_tokens=300, temperature=0.5)
 
----
+    message_ids = []
+    if data.persist:
+        async with acquire() as db:
+            message_ids = await insert_messages(db, session_id, [
+                (data.lo_id, "user", data.text, "help"),
+                (data.lo_id, "tutor", response.content, "help")
+            ])
+    return { "hint": response.content, "message_ids": message_ids }
 
-### Scoring Instructions:
 
-- **Score 1** only if the response is:
-  - Fully correct in logic
-  - Properly **indented**
-  - Free of **syntax or runtime errors**
+# --- QUEUED LLM JOBS (processed by worker.py) ---
+@app.post("/api/jobs/assessment_question", status_code=202)
+async def queue_assessment(data: AssessmentJobRequest, current_user=Depends(get_current_user)):
+    if not catalog.get(data.lo_id):
+        raise HTTPException(status_code=404, detail="LO not found")
+    if data.session_id:
+        await require_session(data.session_id, current_user["id"])
+    payload = { "lo_id": data.lo_id, "session_id": str(data.session_id) if data.session_id else None }
+    async with acquire() as db:
+        job_id = await jobs.enqueue(db, "question", current_user["id"], payload)
+    return { "job_id": job_id, "status": "queued" }
 
-- **Score 0** if:
-  - Any required concept is missing
-  - The response is ambiguous, poorly formatted, or syntactically incorrect
-  - Indentation or formatting issues would cause an execution or readability problem
 
-- **Do NOT** assume intent or fix mistakes silently — only score what is written explicitly.
+@app.post("/api/jobs/evaluate_response", status_code=202)
+async def queue_evaluation(data: EvaluationRequest, current_user=Depends(get_current_user)):
+    if not catalog.get(data.lo_id):
+        raise HTTPException(status_code=404, detail="LO not found")
+    await require_session(data.session_id, current_user["id"])
+    # The worker always persists the turn, whatever data.persist says
+    payload = {
+        "session_id": str(data.session_id),
+        "lo_id": data.lo_id,
+        "question": data.question,
+        "question_id": data.question_id,
+        "user_input": data.user_input
+    }
+    async with acquire() as db:
+        job_id = await jobs.enqueue(db, "evaluation", current_user["id"], payload)
+    return { "job_id": job_id, "status": "queued" }
 
----
 
-### Feedback Instructions:
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: int, wait: float = Query(0, ge=0), current_user=Depends(get_current_user)):
+    # ?wait=N long-polls up to N seconds for the job to finish
+    job = await jobs.fetch_job(job_id, current_user["id"], wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
-- If the score is 0:
-  - Return the response in JSON format:
-    {{
-      "score": 0,
-      "feedback": "Explain the mistake (e.g. indentation, syntax, logic, etc.)",
-      "followup": "Ask a guiding question to prompt correction."
-    }}
 
-- If the score is 1:
-  - Return the response in this EXACT markdown format:
+# --- STREAMING (Server-Sent Events) ---
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-## FEEDBACK
-[Feedback]
 
-## EVALUATION
-| Observable | Mapped Objective | Score (0 or 1) | Importance (1-3) | Feedback |
-|------------|------------------|----------------|------------------|----------|
-[Rows here]
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # don't let a reverse proxy buffer the stream
+}
 
-## SUMMARY
-[Summary of strengths and improvements]
-""".strip()
 
-    messages = [
-        { "role": "system", "content": prompt },
-        { "role": "user", "content": data.user_input }
-    ]
+@app.post("/api/assessment_question/stream")
+async def stream_assessment(data: AssessmentRequest, current_user=Depends(get_current_user)):
+    lo_id = data.lo_id
+    lo = catalog.get(lo_id)
+    if not lo:
+        raise HTTPException(status_code=404, detail="LO not found")
 
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=messages,
-        temperature=0.7,
-        max_tokens=600
-    )
+    async with acquire() as db:
+        banked = await pick_unseen_question(db, current_user["id"], lo_id)
+    user_id = current_user["id"]
+
+    async def events():
+        if banked:
+            yield sse("token", { "text": banked["question"] })
+            yield sse("result", { "question": banked["question"], "question_id": banked["id"] })
+            return
+
+        # A question that fails the check is replaced by the larger model's in the result event
+        stream = RoutedStream(
+            "question",
+            [{"role": "system", "content": build_question_prompt(lo)}],
+            lo=lo,
+            accept=question_ok,
+            max_tokens=300,
+            temperature=0.7
+        )
+        try:
+            async for delta in stream:
+                yield sse("token", { "text": delta })
+            question = await stream.content()
+        except HTTPException as e:
+            yield sse("error", { "detail": e.detail })
+            return
 
-    content = response.choices[0].message.content.strip()
+        async with acquire() as conn:
+            question_id = await add_question(conn, lo_id, question, source="live")
+            if question_id:
+                await mark_served(conn, user_id, question_id)
+        yield sse("result", { "question": question, "question_id": question_id })
 
-    try:
-        parsed = json.loads(content)
-        score = parsed.get("score", 0)
-        feedback = parsed.get("feedback", "")
-        followup = parsed.get("followup", "")
-    except json.JSONDecodeError:
-        # Assume it's markdown and score is 1
-        score = 1
-        feedback = content
-        followup = ""
-
-    if score == 1:
-        await db.execute("""
-            INSERT INTO cicada.learner_models (user_id, lo_id, proficiency, feedback, updated_at)
-            VALUES ($1, $2, 1, $3, NOW())
-            ON CONFLICT (user_id, lo_id)
-            DO UPDATE SET proficiency = 1, feedback = $3, updated_at = NOW()
-        """, current_user["id"], data.lo_id, feedback)
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
 
-    await db.close()
 
-    return {
-        "score": score,
-        "feedback": feedback,
-        "followup": followup
-    }
+@app.post("/api/evaluate_response/stream")
+async def stream_evaluation(
+    data: EvaluationRequest,
+    idempotency_key: Optional[str] = Header(None),
+    current_user=Depends(get_current_user)
+):
+    lo = catalog.get(data.lo_id)
+    if not lo:
+        raise HTTPException(status_code=404, detail="LO not found")
+
+    user_id = current_user["id"]
+    await require_session(data.session_id, user_id)
+    prechecked = await local_precheck(data.question_id, data.user_input)
+    key = eval_cache.cache_key(data.lo_id, data.question, data.user_input)
+    cached = None
+    if not prechecked:
+        async with acquire() as db:
+            cached = await eval_cache.lookup(db, key)
+
+    # Same key space as /api/evaluate_response: a retry replays the stored result.
+    # Claimed last, so nothing that can raise runs between the claim and the
+    # try/finally in events() that releases it.
+    if idempotency_key:
+        async with acquire() as db:
+            replay = await idempotency.claim(
+                db, user_id, idempotency_key, idempotency.fingerprint("evaluate_response", data)
+            )
+        if replay is not None:
+            async def replayed():
+                yield sse("token", { "text": replay["feedback"] })
+                yield sse("result", replay)
+            return StreamingResponse(replayed(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    async def events():
+        stored = False
+        try:
+            if prechecked or cached:
+                result = prechecked or cached
+                yield sse("token", { "text": result["feedback"] })
+            else:
+                messages = evaluation_messages(lo, data.question, data.user_input)
+                # If the streamed answer doesn't parse, the larger model's evaluation goes in the result event
+                stream = RoutedStream(
+                    "evaluation",
+                    messages,
+                    lo=lo,
+                    accept=evaluation_accepted,
+                    tool=EVALUATION_TOOL,
+                    temperature=EVALUATION_TEMPERATURE,
+                    max_tokens=600
+                )
+                # The model streams tool-call JSON; only the feedback text goes out as tokens
+                feedback = FeedbackStream()
+                try:
+                    async for delta in stream:
+                        text = feedback.feed(delta)
+                        if text:
+                            yield sse("token", { "text": text })
+                    content = await stream.content()
+                    result = parse_evaluation(content)
+                except HTTPException as e:
+                    yield sse("error", { "detail": e.detail })
+                    return
+                # Streams don't report usage, so estimate at ~4 characters per token
+                tokens = (sum(len(m["content"]) for m in messages) + len(content)) // 4
+
+            # ✅ Final event only goes out once the mastery upsert is committed
+            async with acquire() as conn:
+                if not (prechecked or cached):
+                    await eval_cache.store(conn, key, data.lo_id, result, tokens)
+                await save_evaluation(conn, user_id, data.session_id, data.lo_id, data.user_input, result, data.persist)
+                final = jsonable_encoder({ **result, "cached": bool(cached) })
+                if idempotency_key:
+                    await idempotency.store(conn, user_id, idempotency_key, final)
+                    stored = True
+            yield sse("result", final)
+        finally:
+            # Errors and disconnects leave the key free for a retry. Shielded because a
+            # disconnect cancels this generator and would otherwise abort the release too
+            if idempotency_key and not stored:
+                with anyio.CancelScope(shield=True):
+                    async with acquire() as conn:
+                        await idempotency.release(conn, user_id, idempotency_key)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
 
 
 
@@ -494,33 +822,111 @@ You are an AI Python tutor evaluating a learner's response to a Python question
 #**************************
 
 @app.get("/api/user/{user_id}/proficiency")
-async def get_user_proficiency(user_id: UUID, current_user=Depends(get_current_user)):
+async def get_user_proficiency(request: Request, user_id: UUID, current_user=Depends(get_current_user), db=Depends(get_db)):
     if user_id != current_user["id"]:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    db = await get_db()
-    rows = await db.fetch("""
-        SELECT 
-            l.topic, 
-            l.objective,
-            COALESCE(m.proficiency, 0) AS score,
-            m.feedback
-        FROM cicada.learning_objectives l
-        LEFT JOIN cicada.learner_models m ON l.id = m.lo_id AND m.user_id = $1
-        ORDER BY l.id
-    """, user_id)
-    await db.close()
+    version, snapshot = await load_snapshot(db, user_id)
+    # Evidence is append-only, so its row count tells whether the aggregates moved
+    evidence = {row["lo_id"]: row for row in await evidence_summary(db, user_id)}
+    observations = sum(row["observations"] for row in evidence.values())
+    # Changes when this user's snapshot, evidence or the catalog changes
+    catalog_version = catalog.etag.strip('"')
+    etag = f'W/"{version}-{observations}-{catalog_version}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={ "ETag": etag, "Cache-Control": "private, no-cache" })
 
     result = []
-    for row in rows:
-        feedback_label = "✅ Mastered" if row["score"] >= 1 else (
-            "🟡 In Progress" if row["score"] > 0 else "🔴 Not Started"
-        )
+    for lo in catalog.objectives:
+        entry = snapshot.get(lo["id"], {})
+        score = entry.get("score") or 0
+        observed = evidence.get(lo["id"])
         result.append({
-            "topic": row["topic"],
-            "objective": row["objective"],
-            "score": row["score"],
-            "feedback": row["feedback"] or feedback_label
+            "topic": lo["topic"],
+            "objective": lo["objective"],
+            "score": score,
+            "feedback": entry.get("feedback") or proficiency_label(score),
+            "evidence_score": observed["weighted_score"] if observed else None,
+            "observations": observed["observations"] if observed else 0
         })
 
-    return result
+    return cached_json(request, etag, result, "private, no-cache")
+
+
+# 🔍 Per-objective evidence from evaluations; with lo_id, that objective's latest rows
+@app.get("/api/user/{user_id}/evidence")
+async def get_user_evidence(user_id: UUID, lo_id: Optional[int] = None, current_user=Depends(get_current_user), db=Depends(get_db)):
+    if user_id != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if lo_id is not None:
+        return await evidence_rows(db, user_id, lo_id)
+    return await evidence_summary(db, user_id)
+
+
+@app.get("/api/cohort/proficiency")
+async def get_cohort_proficiency(request: Request, current_user=Depends(get_current_user), db=Depends(get_db)):
+    etag, summary = await cohort_summary(db, catalog.objectives)
+    return cached_json(request, etag, summary, f"private, max-age={int(COHORT_CACHE_TTL)}")
+
+
+@app.get("/api/stats")
+async def get_stats():
+    return {
+        "db_pool": pool_stats(),
+        "event_loop_lag": loop_lag_stats(),
+        "llm": gateway_stats(),
+        "llm_routing": routing_stats(),
+        "principal_cache": { **principal_cache.stats(), **principal_stats },
+        "catalog": catalog.stats(),
+        "mastery_cache": mastery_stats(),
+        "evaluation_cache": eval_cache.eval_cache_stats(),
+        "code_precheck": precheck_stats(),
+        "context": context_stats(),
+        "session_push": pubsub_stats(),
+        "idempotency": idempotency_stats(),
+        "login_limiter": { "email_rejected": email_limiter.rejected, "ip_rejected": ip_limiter.rejected }
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# 🩺 Liveness: the worker process is up and its event loop is answering
+@app.get("/healthz")
+async def healthz():
+    return { "status": "ok" }
+
+
+async def _check_db():
+    async with acquire() as db:
+        await db.fetchval("SELECT 1")
+
+
+# 🚦 Readiness: this worker can serve traffic. Turns 503 as soon as SIGTERM arrives (see delay_sigterm).
+@app.get("/readyz")
+async def readyz():
+    checks = {}
+    if stopping:
+        checks["shutdown"] = "stopping"
+    try:
+        await asyncio.wait_for(_check_db(), timeout=READYZ_TIMEOUT)
+        checks["db"] = "ok"
+    except Exception as e:
+        checks["db"] = f"error: {getattr(e, 'detail', None) or type(e).__name__}"
+
+    stats = gateway_stats()
+    if not stats:
+        checks["llm"] = "not initialized"
+    elif stats["draining"]:
+        checks["llm"] = "draining"
+    else:
+        checks["llm"] = "ok"
+
+    checks["catalog"] = "ok" if catalog.etag else "not loaded"
+    # Pushes and job long-polls stall without LISTEN; the listener reconnects on its own
+    checks["listener"] = "ok" if listener_connected() else "disconnected"
+
+    ready = all(value == "ok" for value in checks.values())
+    return JSONResponse({ "ready": ready, "checks": checks }, status_code=200 if ready else 503)
@@ -0,0 +1,110 @@
+# mastery.py
+# Per-user mastery bitsets over the catalog. Bit i is set when the learner has
+# mastered catalog.objectives[i], so "first unmastered", "next unmastered after X"
+# and "mastered count" are a few integer operations instead of a join.
+#
+# Bitsets are cached per worker and kept in sync across workers by a NOTIFY
+# sent with every learner_models write and delivered on commit (see mark_mastery).
+import os
+from bisect import bisect_right
+from uuid import UUID
+
+from cache import TTLCache
+from catalog import catalog
+from listener import subscribe
+
+MASTERY_CHANNEL = "mastery_changed"
+MASTERY_CACHE_ENABLED = os.getenv("MASTERY_CACHE_ENABLED", "true").lower() == "true"
+MASTERY_CACHE_TTL = float(os.getenv("MASTERY_CACHE_TTL", "600"))
+MASTERY_CACHE_SIZE = int(os.getenv("MASTERY_CACHE_SIZE", "10000"))
+
+# user_id -> (catalog etag, bits); bit positions are only valid for that catalog version
+_bitsets = TTLCache(maxsize=MASTERY_CACHE_SIZE, ttl=MASTERY_CACHE_TTL)
+
+
+async def mastery_bits(db, user_id):
+    cached = _bitsets.get(user_id)
+    if cached is not None and cached[0] == catalog.etag:
+        return cached[1]
+
+    rows = await db.fetch("""
+        SELECT lo_id FROM cicada.learner_models
+        WHERE user_id = $1 AND proficiency >= 1
+    """, user_id)
+    bits = 0
+    for row in rows:
+        position = catalog.position.get(row["lo_id"])
+        if position is not None:
+            bits |= 1 << position
+    _bitsets.set(user_id, (catalog.etag, bits))
+    return bits
+
+
+def _apply(user_id, lo_id, mastered):
+    cached = _bitsets.get(user_id)
+    position = catalog.position.get(lo_id)
+    if cached is None or cached[0] != catalog.etag or position is None:
+        return
+    bits = cached[1] | (1 << position) if mastered else cached[1] & ~(1 << position)
+    _bitsets.set(user_id, (cached[0], bits))
+
+
+async def mark_mastery(db, user_id, lo_id, mastered):
+    """
+    Tell every worker, this one included, once the learner_models write commits.
+    Call after writing learner_models. The write may still roll back, so the
+    local bitset is only dropped here and gets reloaded from the database; the
+    NOTIFY is delivered on commit and never on rollback.
+    """
+    _bitsets.invalidate(user_id)
+    await db.execute("SELECT pg_notify($1, $2)", MASTERY_CHANNEL, f"{user_id}:{lo_id}:{int(mastered)}")
+
+
+def _on_notify(payload):
+    user_id, lo_id, mastered = payload.split(":")
+    _apply(UUID(user_id), int(lo_id), mastered == "1")
+
+
+async def _on_reconnect():
+    # Changes may have been missed while disconnected
+    _bitsets.clear()
+
+
+def start_mastery():
+    subscribe(MASTERY_CHANNEL, _on_notify, on_reconnect=_on_reconnect)
+
+
+def next_unmastered(bits, after_lo_id=None):
+    """Lowest-position unmastered objective, optionally only those with id > after_lo_id."""
+    total = len(catalog.objectives)
+    start = 0 if after_lo_id is None else bisect_right(catalog.ids, after_lo_id)
+    candidates = ~bits & ((1 << total) - 1) & ~((1 << start) - 1)
+    if not candidates:
+        return None
+    lowest = (candidates & -candidates).bit_length() - 1
+    return catalog.objectives[lowest]["id"]
+
+
+def mastered_count(bits):
+    return bin(bits).count("1")
+
+
+async def next_unmastered_lo(db, user_id, after_lo_id=None):
+    if MASTERY_CACHE_ENABLED and catalog.objectives:
+        return next_unmastered(await mastery_bits(db, user_id), after_lo_id)
+
+    # Single-row fallback, served by the learner_models (user_id, lo_id) key
+    return await db.fetchval("""
+        SELECT l.id FROM cicada.learning_objectives l
+        WHERE l.id > $2
+          AND NOT EXISTS (
+              SELECT 1 FROM cicada.learner_models m
+              WHERE m.user_id = $1 AND m.lo_id = l.id AND m.proficiency >= 1
+          )
+        ORDER BY l.id
+        LIMIT 1
+    """, user_id, after_lo_id if after_lo_id is not None else -1)
+
+
+def mastery_stats():
+    return _bitsets.stats()
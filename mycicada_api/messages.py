@@ -0,0 +1,119 @@
+# messages.py
+# Keyset pagination over cicada.session_messages. Cursors are opaque tokens
+# wrapping a message's id, so each page is one index range scan no matter how
+# long the session has grown.
+#
+# Messages are ordered by id, not timestamp: timestamps are set by the
+# database and only displayed. A message whose id is below a client's sync
+# cursor can still commit after the client synced, because sequence values
+# are handed out before commit. The NOTIFY sent on commit pushes those to
+# connected clients (see pubsub.py).
+import base64
+
+from fastapi import HTTPException
+
+MESSAGE_COLUMNS = "id, session_id, lo_id, role, text, activity_type, timestamp"
+# Column header for format=compact pages, where each message is a row array
+MESSAGE_FIELDS = [c.strip() for c in MESSAGE_COLUMNS.split(",")]
+
+# Every insert is announced as "session_id:id,id,..." so connected clients get it
+# pushed (see pubsub.py). Inside a transaction it is delivered on commit.
+SESSION_CHANNEL = "session_events"
+
+
+def encode_cursor(row):
+    return base64.urlsafe_b64encode(str(row["id"]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        # Older cursors were "timestamp|id"; the id is all that is needed
+        return int(raw.rpartition("|")[2])
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def fetch_message_page(db, session_id, lo_id=None, limit=100, before=None, since=None, compact=False):
+    """
+    One page of messages in chronological order.
+    With compact=True messages are row arrays under a "columns" header instead
+    of objects, which keeps the key names out of every message.
+
+    - since:  messages newer than the cursor (incremental sync after a reconnect)
+    - before: messages older than the cursor (scrolling back through history)
+    - neither: the latest `limit` messages
+    """
+    if before and since:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'since', not both")
+
+    args = [session_id]
+    where = "session_id = $1"
+    if lo_id is not None:
+        args.append(lo_id)
+        where += f" AND lo_id = ${len(args)}"
+
+    if since:
+        args.append(decode_cursor(since))
+        where += f" AND id > ${len(args)}"
+        order = "ASC"
+    else:
+        if before:
+            args.append(decode_cursor(before))
+            where += f" AND id < ${len(args)}"
+        order = "DESC"
+
+    # Fetch one extra row to know whether another page exists
+    args.append(limit + 1)
+    rows = await db.fetch(f"""
+        SELECT {MESSAGE_COLUMNS} FROM cicada.session_messages
+        WHERE {where}
+        ORDER BY id {order}
+        LIMIT ${len(args)}
+    """, *args)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if order == "DESC":
+        rows = list(reversed(rows))
+
+    if compact:
+        page = {"columns": MESSAGE_FIELDS, "rows": [tuple(r) for r in rows]}
+    else:
+        page = {"messages": [dict(r) for r in rows]}
+    return {
+        **page,
+        "has_more": has_more,
+        # Pass as ?before= to load older messages
+        "before_cursor": encode_cursor(rows[0]) if rows else before,
+        # Pass as ?since= to fetch only what arrived after this page
+        "sync_cursor": encode_cursor(rows[-1]) if rows and (since or not before) else since
+    }
+
+
+async def insert_messages(db, session_id, items):
+    """
+    Insert several messages for one session in a single statement and return
+    their ids in order. The database fills in the timestamp.
+    Items are (lo_id, role, text, activity_type) tuples.
+    """
+    if not items:
+        return []
+    lo_ids, roles, texts, activity_types = (list(column) for column in zip(*items))
+    rows = await db.fetch("""
+        INSERT INTO cicada.session_messages (session_id, lo_id, role, text, activity_type)
+        SELECT $1, m.lo_id, m.role, m.text, m.activity_type
+        FROM unnest($2::int[], $3::text[], $4::text[], $5::text[])
+            WITH ORDINALITY AS m(lo_id, role, text, activity_type, ord)
+        ORDER BY m.ord
+        RETURNING id
+    """, session_id, lo_ids, roles, texts, activity_types)
+    ids = sorted(r["id"] for r in rows)
+    await db.execute("SELECT pg_notify($1, $2)", SESSION_CHANNEL, f"{session_id}:{','.join(map(str, ids))}")
+    return ids
+
+
+async def owns_session(db, session_id, user_id):
+    """True if the session exists and belongs to user_id."""
+    owner = await db.fetchval("SELECT user_id FROM cicada.sessions WHERE id = $1", session_id)
+    return owner is not None and owner == user_id
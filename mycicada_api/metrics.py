@@ -0,0 +1,225 @@
+# metrics.py
+# In-process request metrics in Prometheus text format, served on /metrics:
+# per-route latency, asyncpg query time by statement, and LLM latency and
+# tokens by model and route. Also sets up a request id per request and,
+# with LOG_FORMAT=json, structured JSON log lines that carry it.
+import contextvars
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # 'text' or 'json'
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+# Set per request by the HTTP middleware, read by logs and LLM metrics
+request_id_var = contextvars.ContextVar("request_id", default="-")
+_scope_var = contextvars.ContextVar("scope", default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LLM_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, labels
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names, self.buckets = name, help, labels, buckets
+        self.series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in self.series.items():
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, ('le', bound))} {count}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, ('le', '+Inf'))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {round(series[-2], 6)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {series[-1]}")
+        return lines
+
+
+http_latency = Histogram("cicada_http_request_duration_seconds", "HTTP request latency (to response headers for streams)",
+                         ("method", "route", "status"))
+db_latency = Histogram("cicada_db_query_duration_seconds", "asyncpg query latency by statement", ("statement",))
+db_errors = Counter("cicada_db_query_errors_total", "asyncpg queries that raised", ("statement",))
+llm_latency = Histogram("cicada_llm_request_duration_seconds", "LLM call latency including retries",
+                        ("model", "route", "outcome"), buckets=LLM_BUCKETS)
+llm_tokens = Counter("cicada_llm_tokens_total", "LLM tokens by kind (prompt/completion)", ("model", "route", "kind"))
+llm_retries = Counter("cicada_llm_retries_total", "LLM attempts that were retried", ("model", "route"))
+llm_task_latency = Histogram("cicada_llm_task_duration_seconds", "LLM latency per routed task and model",
+                             ("task", "model"), buckets=LLM_BUCKETS)
+llm_route_calls = Counter("cicada_llm_route_calls_total",
+                          "Routed LLM calls by outcome (accepted/escalated/rejected)", ("task", "model", "outcome"))
+llm_route_cost = Counter("cicada_llm_cost_usd_total", "Estimated LLM spend in USD", ("task", "model"))
+loop_blocked = Counter("cicada_event_loop_blocked_total", "Times the event loop was held past the block threshold")
+
+_registry = [http_latency, db_latency, db_errors, llm_latency, llm_tokens, llm_retries,
+             llm_task_latency, llm_route_calls, llm_route_cost, loop_blocked]
+_gauges = {}  # name -> (help, callable returning a number)
+
+
+def register_gauge(name, help, read):
+    _gauges[name] = (help, read)
+
+
+def render_metrics():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for name, (help, read) in _gauges.items():
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {read()}"]
+    return "\n".join(lines) + "\n"
+
+
+# --- DB query spans ---
+
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN)\s+(?:cicada\.)?(\w+)", re.IGNORECASE)
+_VERB = re.compile(r"^\s*(\w+)")
+
+
+@lru_cache(maxsize=1024)
+def statement_name(query):
+    """'SELECT users', 'INSERT session_messages', ... — stable, low-cardinality labels."""
+    sql = re.sub(r"/\*.*?\*/|--[^\n]*", " ", query, flags=re.DOTALL)
+    verb = _VERB.match(sql)
+    table = _TABLE.search(sql)
+    name = verb.group(1).upper() if verb else "QUERY"
+    return f"{name} {table.group(1)}" if table else name
+
+
+def log_query(record):
+    """asyncpg query logger (Connection.add_query_logger), installed on every pooled connection."""
+    name = statement_name(record.query)
+    db_latency.observe(record.elapsed, name)
+    if record.exception is not None:
+        db_errors.inc(name)
+    elapsed_ms = record.elapsed * 1000
+    if elapsed_ms >= SLOW_QUERY_MS:
+        logger.warning("Slow query %s took %.1f ms", name, elapsed_ms)
+
+
+# --- LLM calls ---
+
+def current_route():
+    """Route template of the request being handled, or 'background' outside one."""
+    scope = _scope_var.get()
+    route = scope.get("route") if scope else None
+    return route.path if route is not None else "background"
+
+
+def observe_llm(model, elapsed, outcome, prompt_tokens=0, completion_tokens=0, retries=0):
+    route = current_route()
+    llm_latency.observe(elapsed, model, route, outcome)
+    if prompt_tokens:
+        llm_tokens.inc(model, route, "prompt", amount=prompt_tokens)
+    if completion_tokens:
+        llm_tokens.inc(model, route, "completion", amount=completion_tokens)
+    if retries:
+        llm_retries.inc(model, route, amount=retries)
+
+
+# --- Request ids and logs ---
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        for key in ("method", "route", "status", "duration_ms"):
+            if hasattr(record, key):
+                entry[key] = getattr(record, key)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def setup_logging():
+    handler = logging.StreamHandler()
+    handler.addFilter(_RequestIdFilter())
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL)
+
+
+async def instrument_request(request, call_next):
+    """HTTP middleware: request id, per-route latency histogram, one access log line."""
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    request_id_var.set(request_id)
+    _scope_var.set(request.scope)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        # Label by route template ("/api/session/{session_id}/messages"), not the raw path
+        path = current_route()
+        if path == "background":
+            path = "unmatched"
+        http_latency.observe(elapsed, request.method, path, str(status))
+        logger.info("%s %s %s", request.method, path, status, extra={
+            "method": request.method, "route": path, "status": status, "duration_ms": round(elapsed * 1000, 2)
+        })
@@ -0,0 +1,46 @@
+-- Core tables. Idempotent, so databases created before migrations existed adopt it as is.
+
+CREATE SCHEMA IF NOT EXISTS cicada;
+
+CREATE TABLE IF NOT EXISTS cicada.users (
+    id UUID PRIMARY KEY,
+    name TEXT,
+    email TEXT UNIQUE,
+    password_hash TEXT,
+    python_level INT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS cicada.learning_objectives (
+    id SERIAL PRIMARY KEY,
+    topic TEXT NOT NULL,
+    objective TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS cicada.sessions (
+    id UUID PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES cicada.users(id) ON DELETE CASCADE,
+    mode TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'active',
+    lo_id INT REFERENCES cicada.learning_objectives(id),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS cicada.session_messages (
+    id BIGSERIAL PRIMARY KEY,
+    session_id UUID NOT NULL REFERENCES cicada.sessions(id) ON DELETE CASCADE,
+    lo_id INT NOT NULL,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL,
+    activity_type TEXT NOT NULL DEFAULT 'chat',
+    timestamp TIMESTAMP NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS cicada.learner_models (
+    user_id UUID NOT NULL REFERENCES cicada.users(id) ON DELETE CASCADE,
+    lo_id INT NOT NULL REFERENCES cicada.learning_objectives(id) ON DELETE CASCADE,
+    proficiency REAL NOT NULL DEFAULT 0,
+    feedback TEXT,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, lo_id)
+);
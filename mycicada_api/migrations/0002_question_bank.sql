@@ -0,0 +1,18 @@
+CREATE TABLE IF NOT EXISTS cicada.question_bank (
+    id BIGSERIAL PRIMARY KEY,
+    lo_id INT NOT NULL REFERENCES cicada.learning_objectives(id) ON DELETE CASCADE,
+    question TEXT NOT NULL,
+    source TEXT NOT NULL DEFAULT 'batch',
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+-- Optional Python test code (asserts) run against code answers before LLM grading
+ALTER TABLE cicada.question_bank ADD COLUMN IF NOT EXISTS tests TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS question_bank_lo_question_key
+    ON cicada.question_bank (lo_id, md5(question));
+
+CREATE TABLE IF NOT EXISTS cicada.question_bank_served (
+    user_id UUID NOT NULL,
+    question_id BIGINT NOT NULL REFERENCES cicada.question_bank(id) ON DELETE CASCADE,
+    served_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, question_id)
+);
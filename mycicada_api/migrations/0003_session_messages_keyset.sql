@@ -0,0 +1,5 @@
+ALTER TABLE cicada.session_messages ADD COLUMN IF NOT EXISTS id BIGSERIAL;
+CREATE INDEX IF NOT EXISTS session_messages_session_lo_ts_idx
+    ON cicada.session_messages (session_id, lo_id, timestamp, id);
+CREATE INDEX IF NOT EXISTS session_messages_session_ts_idx
+    ON cicada.session_messages (session_id, timestamp, id);
@@ -0,0 +1,11 @@
+CREATE OR REPLACE FUNCTION cicada.notify_learning_objectives_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('learning_objectives_changed', TG_OP);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS learning_objectives_changed ON cicada.learning_objectives;
+CREATE TRIGGER learning_objectives_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON cicada.learning_objectives
+    FOR EACH STATEMENT EXECUTE FUNCTION cicada.notify_learning_objectives_changed();
@@ -0,0 +1,14 @@
+CREATE TABLE IF NOT EXISTS cicada.evaluation_cache (
+    key TEXT PRIMARY KEY,
+    lo_id INT NOT NULL,
+    score INT NOT NULL,
+    feedback TEXT NOT NULL,
+    followup TEXT NOT NULL DEFAULT '',
+    tokens INT NOT NULL DEFAULT 0,
+    hits INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_hit_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    expires_at TIMESTAMPTZ NOT NULL
+);
+CREATE INDEX IF NOT EXISTS evaluation_cache_last_hit_idx ON cicada.evaluation_cache (last_hit_at);
+CREATE INDEX IF NOT EXISTS evaluation_cache_expires_idx ON cicada.evaluation_cache (expires_at);
@@ -0,0 +1,6 @@
+CREATE TABLE IF NOT EXISTS cicada.session_summaries (
+    session_id UUID PRIMARY KEY,
+    summary TEXT NOT NULL,
+    summarized_through_id BIGINT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS cicada.proficiency_snapshots (
+    user_id UUID PRIMARY KEY,
+    version BIGINT NOT NULL,
+    payload JSONB NOT NULL,
+    complete BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
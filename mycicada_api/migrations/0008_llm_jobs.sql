@@ -0,0 +1,20 @@
+CREATE TABLE IF NOT EXISTS cicada.llm_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    user_id UUID NOT NULL,
+    payload JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    result JSONB,
+    error TEXT,
+    attempts INT NOT NULL DEFAULT 0,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    locked_until TIMESTAMPTZ,
+    worker TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+CREATE INDEX IF NOT EXISTS llm_jobs_pending_idx
+    ON cicada.llm_jobs (id) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS llm_jobs_finished_idx
+    ON cicada.llm_jobs (finished_at) WHERE finished_at IS NOT NULL;
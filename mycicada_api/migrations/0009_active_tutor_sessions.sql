@@ -0,0 +1,13 @@
+-- At most one active tutor session per user, so start_session can upsert. Older
+-- duplicates left by the previous check-then-insert are closed first.
+
+UPDATE cicada.sessions s SET status = 'closed'
+WHERE s.mode = 'tutor' AND s.status = 'active' AND EXISTS (
+    SELECT 1 FROM cicada.sessions n
+    WHERE n.user_id = s.user_id AND n.mode = 'tutor' AND n.status = 'active'
+      AND (n.created_at, n.id) > (s.created_at, s.id)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS sessions_active_tutor_idx
+    ON cicada.sessions (user_id) WHERE mode = 'tutor' AND status = 'active';
+CREATE INDEX IF NOT EXISTS sessions_user_lo_idx
+    ON cicada.sessions (user_id, lo_id, mode, created_at DESC);
@@ -0,0 +1,9 @@
+CREATE TABLE IF NOT EXISTS cicada.idempotency_keys (
+    user_id UUID NOT NULL,
+    key TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    response JSONB,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, key)
+);
+CREATE INDEX IF NOT EXISTS idempotency_keys_created_idx ON cicada.idempotency_keys (created_at);
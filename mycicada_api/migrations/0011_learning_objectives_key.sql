@@ -0,0 +1,33 @@
+-- (topic, objective) is the catalog's natural key, used by catalog_tool.py imports.
+-- Duplicates from earlier reseeding are folded into the lowest id first, moving
+-- anything that points at them across.
+
+ALTER TABLE cicada.learning_objectives ADD COLUMN IF NOT EXISTS difficulty INT;
+
+DO $$
+BEGIN
+    CREATE TEMP TABLE lo_duplicates ON COMMIT DROP AS
+    SELECT id, keep_id FROM (
+        SELECT id, MIN(id) OVER (PARTITION BY topic, objective) AS keep_id
+        FROM cicada.learning_objectives
+    ) d WHERE id <> keep_id;
+
+    -- Skip the writes (and the catalog NOTIFY trigger) when there is nothing to fold
+    IF EXISTS (SELECT 1 FROM lo_duplicates) THEN
+        UPDATE cicada.sessions t SET lo_id = d.keep_id FROM lo_duplicates d WHERE t.lo_id = d.id;
+        UPDATE cicada.session_messages t SET lo_id = d.keep_id FROM lo_duplicates d WHERE t.lo_id = d.id;
+        UPDATE cicada.learner_models t SET lo_id = d.keep_id FROM lo_duplicates d
+        WHERE t.lo_id = d.id AND NOT EXISTS (
+            SELECT 1 FROM cicada.learner_models k WHERE k.user_id = t.user_id AND k.lo_id = d.keep_id
+        );
+        UPDATE cicada.question_bank t SET lo_id = d.keep_id FROM lo_duplicates d
+        WHERE t.lo_id = d.id AND NOT EXISTS (
+            SELECT 1 FROM cicada.question_bank k WHERE k.lo_id = d.keep_id AND md5(k.question) = md5(t.question)
+        );
+        DELETE FROM cicada.learning_objectives WHERE id IN (SELECT id FROM lo_duplicates);
+    END IF;
+    DROP TABLE lo_duplicates;
+END $$;
+
+CREATE UNIQUE INDEX IF NOT EXISTS learning_objectives_topic_objective_key
+    ON cicada.learning_objectives (topic, objective);
@@ -0,0 +1,12 @@
+-- Databases created before 0001 got session_messages.id from the ALTER in 0003,
+-- with no key on it, so lookups by id (WebSocket pushes, summary backlogs)
+-- scanned the whole table. New databases already have the primary key.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conrelid = 'cicada.session_messages'::regclass AND contype = 'p'
+    ) THEN
+        ALTER TABLE cicada.session_messages ADD PRIMARY KEY (id);
+    END IF;
+END $$;
@@ -0,0 +1,21 @@
+-- Evaluations are now structured (score, feedback, followup, evidence rows)
+-- instead of JSON-or-markdown text. Each evidence row is stored in its own
+-- indexed row so proficiency views can aggregate it without parsing blobs.
+CREATE TABLE IF NOT EXISTS cicada.evaluation_evidence (
+    id BIGSERIAL PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES cicada.users(id) ON DELETE CASCADE,
+    lo_id INT NOT NULL,
+    session_id UUID,
+    observable TEXT NOT NULL,
+    objective TEXT NOT NULL,
+    score SMALLINT NOT NULL CHECK (score IN (0, 1)),
+    importance SMALLINT NOT NULL CHECK (importance BETWEEN 1 AND 3),
+    feedback TEXT NOT NULL DEFAULT '',
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS evaluation_evidence_user_lo_idx
+    ON cicada.evaluation_evidence (user_id, lo_id, created_at DESC);
+
+ALTER TABLE cicada.evaluation_cache ADD COLUMN IF NOT EXISTS evidence JSONB NOT NULL DEFAULT '[]';
+-- Entries from the old format may hold markdown scored 1 by default; let them re-evaluate
+DELETE FROM cicada.evaluation_cache;
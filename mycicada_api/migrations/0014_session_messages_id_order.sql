@@ -0,0 +1,11 @@
+-- Messages are now ordered and paged by id, and the database sets their
+-- timestamp. App-server clocks can disagree, so with several workers a
+-- (timestamp, id) sync cursor could move past a row that committed later.
+ALTER TABLE cicada.session_messages
+    ALTER COLUMN timestamp SET DEFAULT (clock_timestamp() AT TIME ZONE 'UTC');
+CREATE INDEX IF NOT EXISTS session_messages_session_seq_idx
+    ON cicada.session_messages (session_id, id);
+CREATE INDEX IF NOT EXISTS session_messages_session_lo_seq_idx
+    ON cicada.session_messages (session_id, lo_id, id);
+DROP INDEX IF EXISTS cicada.session_messages_session_lo_ts_idx;
+DROP INDEX IF EXISTS cicada.session_messages_session_ts_idx;
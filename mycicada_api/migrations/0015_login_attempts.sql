@@ -0,0 +1,9 @@
+-- Login/register attempts, so the limits hold across every worker process
+-- instead of each worker counting its own share.
+CREATE TABLE IF NOT EXISTS cicada.login_attempts (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    attempted_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS login_attempts_key_idx ON cicada.login_attempts (scope, key, attempted_at);
+CREATE INDEX IF NOT EXISTS login_attempts_time_idx ON cicada.login_attempts (attempted_at);
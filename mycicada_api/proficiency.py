@@ -0,0 +1,139 @@
+# proficiency.py
+# Per-user proficiency snapshots: one JSON row per learner, keyed by objective
+# id, patched in place whenever learner_models is written. The proficiency view
+# reads one row by primary key, and its version number doubles as the ETag.
+import hashlib
+import json
+import os
+
+from cache import TTLCache
+
+COHORT_CACHE_TTL = float(os.getenv("COHORT_CACHE_TTL", "30"))
+_cohort_cache = TTLCache(maxsize=1, ttl=COHORT_CACHE_TTL)
+
+
+async def record_proficiency(db, user_id, lo_id, score, feedback=None):
+    """Patch one objective in the user's snapshot. Call alongside every learner_models write."""
+    patch = {"score": score}
+    if feedback is not None:
+        patch["feedback"] = feedback
+    # A user without a snapshot gets a partial one (complete = FALSE), which is
+    # filled in from learner_models the first time it is read
+    await db.execute("""
+        INSERT INTO cicada.proficiency_snapshots (user_id, version, payload, complete, updated_at)
+        VALUES ($1, 1, jsonb_build_object($2::text, $3::jsonb), FALSE, NOW())
+        ON CONFLICT (user_id) DO UPDATE SET
+            version = proficiency_snapshots.version + 1,
+            payload = jsonb_set(
+                proficiency_snapshots.payload,
+                ARRAY[$2::text],
+                COALESCE(proficiency_snapshots.payload -> $2::text, '{}'::jsonb) || $3::jsonb
+            ),
+            updated_at = NOW()
+    """, user_id, str(lo_id), json.dumps(patch))
+
+
+async def load_snapshot(db, user_id):
+    """Returns (version, {lo_id: {"score", "feedback"}})."""
+    row = await db.fetchrow("""
+        SELECT version, payload FROM cicada.proficiency_snapshots
+        WHERE user_id = $1 AND complete
+    """, user_id)
+    if row is None:
+        # Build from learner_models; entries already in a partial snapshot are newer and win
+        row = await db.fetchrow("""
+            INSERT INTO cicada.proficiency_snapshots (user_id, version, payload, complete, updated_at)
+            SELECT $1, 1, COALESCE(
+                jsonb_object_agg(lo_id::text, jsonb_build_object('score', proficiency, 'feedback', feedback)),
+                '{}'::jsonb
+            ), TRUE, NOW()
+            FROM cicada.learner_models WHERE user_id = $1
+            ON CONFLICT (user_id) DO UPDATE SET
+                version = proficiency_snapshots.version + 1,
+                payload = EXCLUDED.payload || proficiency_snapshots.payload,
+                complete = TRUE,
+                updated_at = NOW()
+            RETURNING version, payload
+        """, user_id)
+    payload = json.loads(row["payload"])
+    return row["version"], {int(lo_id): entry for lo_id, entry in payload.items()}
+
+
+def proficiency_label(score):
+    return "✅ Mastered" if score >= 1 else (
+        "🟡 In Progress" if score > 0 else "🔴 Not Started"
+    )
+
+
+async def cohort_summary(db, objectives):
+    """Mastery counts and evidence scores per objective across all learners, cached for COHORT_CACHE_TTL."""
+    cached = _cohort_cache.get("cohort")
+    if cached is not None:
+        return cached
+
+    rows = await db.fetch("""
+        SELECT
+            lo_id,
+            COUNT(*) FILTER (WHERE proficiency >= 1) AS mastered,
+            COUNT(*) FILTER (WHERE proficiency > 0 AND proficiency < 1) AS in_progress
+        FROM cicada.learner_models
+        GROUP BY lo_id
+    """)
+    scored = await db.fetch("""
+        SELECT
+            lo_id,
+            COUNT(DISTINCT user_id) AS assessed,
+            ROUND(SUM(score * importance)::numeric / SUM(importance), 3)::float AS evidence_score
+        FROM cicada.evaluation_evidence
+        GROUP BY lo_id
+    """)
+    learners = await db.fetchval("SELECT COUNT(*) FROM cicada.users")
+    counts = {r["lo_id"]: r for r in rows}
+    evidence = {r["lo_id"]: r for r in scored}
+
+    objectives_summary = []
+    for lo in objectives:
+        row = counts.get(lo["id"])
+        observed = evidence.get(lo["id"])
+        objectives_summary.append({
+            "lo_id": lo["id"],
+            "topic": lo["topic"],
+            "objective": lo["objective"],
+            "mastered": row["mastered"] if row else 0,
+            "in_progress": row["in_progress"] if row else 0,
+            "assessed": observed["assessed"] if observed else 0,
+            "evidence_score": observed["evidence_score"] if observed else None
+        })
+
+    summary = {"learners": learners, "objectives": objectives_summary}
+    digest = hashlib.sha1(json.dumps(summary, sort_keys=True).encode()).hexdigest()
+    cached = (f'"{digest[:16]}"', summary)
+    _cohort_cache.set("cohort", cached)
+    return cached
+
+
+async def evidence_summary(db, user_id):
+    """Importance-weighted evidence score per objective, from cicada.evaluation_evidence."""
+    rows = await db.fetch("""
+        SELECT
+            lo_id,
+            COUNT(*) AS observations,
+            ROUND(SUM(score * importance)::numeric / SUM(importance), 3)::float AS weighted_score,
+            MAX(created_at) AS last_evaluated_at
+        FROM cicada.evaluation_evidence
+        WHERE user_id = $1
+        GROUP BY lo_id
+        ORDER BY lo_id
+    """, user_id)
+    return [dict(r) for r in rows]
+
+
+async def evidence_rows(db, user_id, lo_id, limit=50):
+    rows = await db.fetch("""
+        SELECT observable, objective, score, importance, feedback, session_id, created_at
+        FROM cicada.evaluation_evidence
+        WHERE user_id = $1 AND lo_id = $2
+        ORDER BY created_at DESC, id
+        LIMIT $3
+    """, user_id, lo_id, limit)
+    return [dict(r) for r in rows]
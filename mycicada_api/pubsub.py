@@ -0,0 +1,125 @@
+# pubsub.py
+# Pushes session updates to WebSocket clients. Write paths announce themselves
+# with NOTIFY: new session_messages rows on SESSION_CHANNEL (messages.py) and
+# mastery changes on MASTERY_CHANNEL (mastery.py). Every API worker receives
+# them on its shared LISTEN connection and forwards them to the sockets it
+# holds, so it doesn't matter which worker a client is connected to.
+import asyncio
+import logging
+import os
+from contextlib import contextmanager
+from uuid import UUID
+
+from fastapi.encoders import jsonable_encoder
+
+from db import acquire
+from listener import subscribe
+from mastery import MASTERY_CHANNEL
+from messages import MESSAGE_COLUMNS, SESSION_CHANNEL, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+SESSION_QUEUE_SIZE = int(os.getenv("SESSION_QUEUE_SIZE", "100"))
+
+_by_session = {}  # session_id -> {Subscriber}
+_by_user = {}     # user_id -> {Subscriber}
+_tasks = set()
+_stats = {"pushed": 0, "resyncs": 0}
+
+
+class Subscriber:
+    def __init__(self, session_id, user_id):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize=SESSION_QUEUE_SIZE)
+
+    def push(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow client: drop the backlog and have it catch up from its sync cursor
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({ "type": "resync" })
+            _stats["resyncs"] += 1
+            return
+        _stats["pushed"] += 1
+
+
+@contextmanager
+def session_subscription(session_id, user_id):
+    subscriber = Subscriber(session_id, user_id)
+    _by_session.setdefault(session_id, set()).add(subscriber)
+    _by_user.setdefault(user_id, set()).add(subscriber)
+    try:
+        yield subscriber
+    finally:
+        for index, key in ((_by_session, session_id), (_by_user, user_id)):
+            subscribers = index.get(key)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del index[key]
+
+
+async def _deliver_messages(session_id, ids):
+    try:
+        async with acquire() as db:
+            rows = await db.fetch(f"""
+                SELECT {MESSAGE_COLUMNS} FROM cicada.session_messages
+                WHERE id = ANY($1::bigint[])
+                ORDER BY id
+            """, ids)
+    except Exception:
+        logger.exception("Could not load messages for session %s", session_id)
+        return
+    if not rows:
+        return
+    # Fetched once per worker, however many sockets follow the session
+    event = {
+        "type": "messages",
+        "messages": jsonable_encoder([dict(r) for r in rows]),
+        "sync_cursor": encode_cursor(rows[-1])
+    }
+    for subscriber in list(_by_session.get(session_id, ())):
+        subscriber.push(event)
+
+
+def _on_session_event(payload):
+    session_id, _, ids = payload.partition(":")
+    session_id = UUID(session_id)
+    if session_id not in _by_session or not ids:
+        return
+    task = asyncio.get_running_loop().create_task(
+        _deliver_messages(session_id, [int(i) for i in ids.split(",")])
+    )
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+def _on_mastery_event(payload):
+    user_id, lo_id, mastered = payload.split(":")
+    event = { "type": "mastery", "lo_id": int(lo_id), "mastered": mastered == "1" }
+    for subscriber in list(_by_user.get(UUID(user_id), ())):
+        subscriber.push(event)
+
+
+async def _on_reconnect():
+    # Notifications may have been missed while disconnected
+    for subscribers in list(_by_session.values()):
+        for subscriber in list(subscribers):
+            subscriber.push({ "type": "resync" })
+
+
+def start_pubsub():
+    """Subscribe to session and mastery events. Call before listener.start_listener()."""
+    subscribe(SESSION_CHANNEL, _on_session_event, on_reconnect=_on_reconnect)
+    subscribe(MASTERY_CHANNEL, _on_mastery_event)
+
+
+def pubsub_stats():
+    return {
+        "sessions": len(_by_session),
+        "sockets": sum(len(s) for s in _by_session.values()),
+        **_stats,
+    }
@@ -0,0 +1,90 @@
+# question_bank.py
+# Pre-generated assessment questions per learning objective. The API serves a
+# random question the learner hasn't seen yet and only generates live when the
+# bank for that objective is exhausted.
+import routing
+from db import acquire
+
+# Shorter than this is an empty or truncated answer, not a question
+QUESTION_MIN_CHARS = 20
+
+
+def build_question_prompt(lo):
+    return f"""
+You are an expert Python tutor. Given the learning objective: "{lo['objective']}" from the topic "{lo['topic']}", generate a single clear, instructive assessment question (coding or short answer) that will effectively assess the user's mastery of this objective.
+
+Only return **ONE** question per request.
+The question should be standalone, and written clearly on a single topic.
+Do NOT return multiple questions.
+
+Only output the question text, nothing else.
+""".strip()
+
+
+def question_ok(content):
+    return len(content.strip()) >= QUESTION_MIN_CHARS
+
+
+async def pick_unseen_question(db, user_id, lo_id):
+    """Pick a random unseen question for the user and mark it served, in one round trip."""
+    return await db.fetchrow("""
+        WITH pick AS (
+            SELECT q.id, q.question
+            FROM cicada.question_bank q
+            WHERE q.lo_id = $2
+              AND NOT EXISTS (
+                  SELECT 1 FROM cicada.question_bank_served s
+                  WHERE s.user_id = $1 AND s.question_id = q.id
+              )
+            ORDER BY random()
+            LIMIT 1
+        ), served AS (
+            INSERT INTO cicada.question_bank_served (user_id, question_id)
+            SELECT $1, id FROM pick
+            ON CONFLICT DO NOTHING
+        )
+        SELECT id, question FROM pick
+    """, user_id, lo_id)
+
+
+async def add_question(db, lo_id, question, source="batch"):
+    """Store a question in the bank; returns its id, or None if it was a duplicate."""
+    return await db.fetchval("""
+        INSERT INTO cicada.question_bank (lo_id, question, source)
+        VALUES ($1, $2, $3)
+        ON CONFLICT DO NOTHING
+        RETURNING id
+    """, lo_id, question, source)
+
+
+async def mark_served(db, user_id, question_id):
+    await db.execute("""
+        INSERT INTO cicada.question_bank_served (user_id, question_id)
+        VALUES ($1, $2)
+        ON CONFLICT DO NOTHING
+    """, user_id, question_id)
+
+
+async def serve_question(user_id, lo):
+    """A question for the learner: unseen from the bank, else generated live and banked."""
+    async with acquire() as db:
+        banked = await pick_unseen_question(db, user_id, lo["id"])
+    if banked:
+        return { "question": banked["question"], "question_id": banked["id"] }
+
+    response = await routing.complete(
+        "question",
+        [{"role": "system", "content": build_question_prompt(lo)}],
+        lo=lo,
+        accept=question_ok,
+        max_tokens=300,
+        temperature=0.7
+    )
+
+    # Keep it for the next learner
+    async with acquire() as db:
+        question_id = await add_question(db, lo["id"], response.content, source="live")
+        if question_id:
+            await mark_served(db, user_id, question_id)
+
+    return { "question": response.content, "question_id": question_id }
@@ -0,0 +1,60 @@
+# responses.py
+# Fast JSON for large payloads (message history, proficiency tables) and
+# response compression.
+#
+# FastJSONResponse serializes with orjson when it is installed. orjson handles
+# UUIDs and datetimes itself, so handlers that return one directly skip
+# FastAPI's jsonable_encoder pass over every row. Without orjson it falls back
+# to the standard encoder.
+#
+# CompressionMiddleware uses brotli when brotli-asgi is installed and the client
+# accepts it, gzip otherwise. Server-Sent Events pass through untouched, since
+# a compressor buffers output and would hold streamed tokens back.
+import os
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette.middleware.gzip import GZipMiddleware
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+COMPRESS_ENABLED = os.getenv("COMPRESS_ENABLED", "true").lower() == "true"
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+
+
+def _default(value):
+    # Anything orjson can't do natively (Decimal, asyncpg Records, models)
+    return jsonable_encoder(value)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content):
+        if orjson is not None:
+            return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        return super().render(jsonable_encoder(content))
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=COMPRESS_MIN_BYTES):
+        self.app = app
+        if BrotliMiddleware is not None:
+            self.compressed = BrotliMiddleware(
+                app, quality=COMPRESS_BROTLI_QUALITY, minimum_size=minimum_size, gzip_fallback=True
+            )
+        else:
+            self.compressed = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope, receive, send):
+        if not COMPRESS_ENABLED or scope["type"] != "http" or scope["path"].endswith("/stream"):
+            await self.app(scope, receive, send)
+        else:
+            await self.compressed(scope, receive, send)
@@ -0,0 +1,167 @@
+# routing.py
+# Picks the model for each LLM task. A task routed "small" or "large" always
+# uses that model. A task routed "auto" tries the small model first and
+# escalates to the large one when the answer fails the caller's check (an
+# evaluation that doesn't validate or whose confidence is below
+# LLM_ESCALATE_CONFIDENCE, a question that is too short). Objectives at or
+# above LLM_LARGE_DIFFICULTY skip the small model.
+#
+#   LLM_ROUTES="question=auto,evaluation=auto,help=small,summary=small"
+#
+# Per-task calls, latency, cost and escalation rate show up in /api/stats and
+# /metrics. LLM_ROUTING_ENABLED=false sends everything to the large model.
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+from llm import get_gateway
+from metrics import llm_route_calls, llm_route_cost, llm_task_latency
+
+load_dotenv()
+
+LLM_ROUTING_ENABLED = os.getenv("LLM_ROUTING_ENABLED", "true").lower() == "true"
+LLM_MODEL_SMALL = os.getenv("LLM_MODEL_SMALL", "gpt-4o-mini")
+LLM_MODEL_LARGE = os.getenv("LLM_MODEL_LARGE", "gpt-4")
+LLM_LARGE_DIFFICULTY = int(os.getenv("LLM_LARGE_DIFFICULTY", "4"))
+# Evaluations report a 0-1 confidence; below this the small model's answer is escalated
+LLM_ESCALATE_CONFIDENCE = float(os.getenv("LLM_ESCALATE_CONFIDENCE", "0.6"))
+
+DEFAULT_ROUTES = {"question": "auto", "evaluation": "auto", "help": "small", "summary": "small"}
+ROUTE_CHOICES = ("small", "large", "auto")
+
+# USD per million tokens, (prompt, completion). LLM_PRICES='{"model": [in, out]}' adds or overrides.
+PRICES = {
+    "gpt-4": (30.0, 60.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-3.5-turbo": (0.5, 1.5),
+}
+PRICES.update({model: tuple(price) for model, price in json.loads(os.getenv("LLM_PRICES", "{}")).items()})
+
+
+def parse_routes(text):
+    routes = dict(DEFAULT_ROUTES)
+    for item in filter(None, (part.strip() for part in (text or "").split(","))):
+        task, _, choice = item.partition("=")
+        if choice.strip() not in ROUTE_CHOICES:
+            raise ValueError(f"LLM_ROUTES: {item!r} should be task=small|large|auto")
+        routes[task.strip()] = choice.strip()
+    return routes
+
+
+ROUTES = parse_routes(os.getenv("LLM_ROUTES"))
+
+_stats = {}  # task -> {"calls", "escalations", "models": {model -> {"calls", "latency_total", "cost"}}}
+
+
+def plan(task, lo=None):
+    """Models to try for this task, in order."""
+    if not LLM_ROUTING_ENABLED:
+        return [LLM_MODEL_LARGE]
+    choice = ROUTES.get(task, "large")
+    if choice == "large" or (lo and (lo.get("difficulty") or 0) >= LLM_LARGE_DIFFICULTY):
+        return [LLM_MODEL_LARGE]
+    if choice == "small":
+        return [LLM_MODEL_SMALL]
+    return [LLM_MODEL_SMALL, LLM_MODEL_LARGE]
+
+
+def cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def record(task, model, elapsed, prompt_tokens, completion_tokens, outcome):
+    """outcome: 'accepted', 'escalated' (rejected, retried on a larger model) or 'rejected' (last model)."""
+    spent = cost(model, prompt_tokens, completion_tokens)
+    task_stats = _stats.setdefault(task, {"calls": 0, "escalations": 0, "models": {}})
+    model_stats = task_stats["models"].setdefault(model, {"calls": 0, "latency_total": 0.0, "cost": 0.0})
+    model_stats["calls"] += 1
+    model_stats["latency_total"] += elapsed
+    model_stats["cost"] += spent
+    if outcome == "escalated":
+        task_stats["escalations"] += 1
+    else:
+        task_stats["calls"] += 1
+    llm_task_latency.observe(elapsed, task, model)
+    llm_route_calls.inc(task, model, outcome)
+    llm_route_cost.inc(task, model, amount=spent)
+
+
+async def complete(task, messages, lo=None, accept=None, models=None, **kwargs):
+    """
+    Run the task on the routed models until one's answer passes accept(content).
+    The last model's answer is returned whether or not it passes.
+    """
+    models = models or plan(task, lo)
+    for i, model in enumerate(models):
+        start = time.perf_counter()
+        response = await get_gateway().complete(messages=messages, model=model, **kwargs)
+        last = i == len(models) - 1
+        ok = accept is None or accept(response.content)
+        outcome = "accepted" if ok else ("rejected" if last else "escalated")
+        record(task, model, time.perf_counter() - start, response.prompt_tokens, response.completion_tokens, outcome)
+        if ok or last:
+            return response
+
+
+class RoutedStream:
+    """
+    Streams the first routed model's answer. Once the stream is consumed,
+    content() checks it and, if it fails and a larger model is routed, asks
+    that model (without streaming) for the answer to use instead.
+
+        stream = RoutedStream("evaluation", messages, lo=lo, accept=evaluation_accepted, max_tokens=600)
+        async for delta in stream:
+            ...
+        content = await stream.content()
+    """
+
+    def __init__(self, task, messages, lo=None, accept=None, **kwargs):
+        self.task, self.messages, self.accept, self.kwargs = task, messages, accept, kwargs
+        self.models = plan(task, lo)
+        self.parts = []
+        self.escalated = False
+
+    async def __aiter__(self):
+        self.start = time.perf_counter()
+        async for delta in get_gateway().stream(messages=self.messages, model=self.models[0], **self.kwargs):
+            self.parts.append(delta)
+            yield delta
+
+    async def content(self):
+        streamed = "".join(self.parts).strip()
+        ok = self.accept is None or self.accept(streamed)
+        last = len(self.models) == 1
+        # Streams don't report usage, so estimate at ~4 characters per token
+        prompt_tokens = sum(len(m["content"]) for m in self.messages) // 4
+        record(self.task, self.models[0], time.perf_counter() - self.start, prompt_tokens, len(streamed) // 4,
+               "accepted" if ok else ("rejected" if last else "escalated"))
+        if ok or last:
+            return streamed
+        self.escalated = True
+        response = await complete(self.task, self.messages, accept=self.accept, models=self.models[1:], **self.kwargs)
+        return response.content.strip()
+
+
+def routing_stats():
+    stats = {"enabled": LLM_ROUTING_ENABLED, "routes": ROUTES, "tasks": {}}
+    for task, task_stats in _stats.items():
+        calls = task_stats["calls"]
+        stats["tasks"][task] = {
+            "calls": task_stats["calls"],
+            "escalations": task_stats["escalations"],
+            # Share of task calls whose first answer was rejected
+            "escalation_rate": round(task_stats["escalations"] / calls, 3) if calls else 0.0,
+            "models": {
+                model: {
+                    "calls": m["calls"],
+                    "avg_latency_ms": round(m["latency_total"] / m["calls"] * 1000, 1),
+                    "cost_usd": round(m["cost"], 6),
+                }
+                for model, m in task_stats["models"].items()
+            },
+        }
+    return stats
@@ -0,0 +1,109 @@
+# schema.py
+# Versioned migrations for the cicada schema. Each migrations/NNNN_name.sql
+# file runs once, in order, in its own transaction, and is recorded in
+# cicada.schema_migrations. ensure_schema() applies whatever is pending on
+# startup, under an advisory lock so concurrent workers don't race.
+#
+#   python schema.py            # apply pending migrations
+#   python schema.py --status   # list applied / pending
+#
+# Never edit a migration that has shipped; add a new one.
+import argparse
+import asyncio
+import hashlib
+import logging
+import re
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+SCHEMA_LOCK_ID = 7_310_001
+
+MIGRATIONS_TABLE = """
+CREATE SCHEMA IF NOT EXISTS cicada;
+CREATE TABLE IF NOT EXISTS cicada.schema_migrations (
+    version INT PRIMARY KEY,
+    name TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+"""
+
+
+def load_migrations():
+    """(version, name, sql, checksum) for every migration file, in version order."""
+    migrations = []
+    for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        match = MIGRATION_FILE.match(path.name)
+        if not match:
+            raise ValueError(f"Unexpected file in migrations/: {path.name}")
+        sql = path.read_text(encoding="utf-8")
+        migrations.append((int(match[1]), match[2], sql, hashlib.sha256(sql.encode()).hexdigest()))
+
+    versions = [m[0] for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError("Two migrations share a version number")
+    return migrations
+
+
+async def applied_migrations(conn):
+    await conn.execute(MIGRATIONS_TABLE)
+    rows = await conn.fetch("SELECT version, checksum FROM cicada.schema_migrations")
+    return {r["version"]: r["checksum"] for r in rows}
+
+
+async def ensure_schema(conn):
+    """Apply pending migrations; returns the versions that were applied."""
+    migrations = load_migrations()
+    await conn.execute("SELECT pg_advisory_lock($1)", SCHEMA_LOCK_ID)
+    try:
+        applied = await applied_migrations(conn)
+        done = []
+        for version, name, sql, checksum in migrations:
+            if version in applied:
+                if applied[version] != checksum:
+                    logger.warning("Migration %04d_%s changed after it was applied", version, name)
+                continue
+            async with conn.transaction():
+                await conn.execute(sql)
+                await conn.execute("""
+                    INSERT INTO cicada.schema_migrations (version, name, checksum)
+                    VALUES ($1, $2, $3)
+                """, version, name, checksum)
+            logger.info("Applied migration %04d_%s", version, name)
+            done.append(version)
+        return done
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", SCHEMA_LOCK_ID)
+
+
+async def main(status_only):
+    import asyncpg
+    from db import DATABASE_URL
+
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        if not status_only:
+            done = await ensure_schema(conn)
+            print(f"✅ Applied {len(done)} migration(s)")
+        applied = await applied_migrations(conn)
+        for version, name, _, checksum in load_migrations():
+            if version not in applied:
+                state = "pending"
+            elif applied[version] != checksum:
+                state = "applied, file changed since"
+            else:
+                state = "applied"
+            print(f"{version:04d}_{name}: {state}")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply database migrations.")
+    parser.add_argument("--status", action="store_true", help="only list migrations")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(args.status))
@@ -0,0 +1,5 @@
+# The API modules import each other by bare name (they run from mycicada_api/)
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,42 @@
+import asyncio
+
+from code_check import looks_like_code, precheck
+
+
+def run(answer):
+    return asyncio.run(precheck(answer))
+
+
+def test_full_program_passes():
+    assert run("def add(a, b):\n    return a + b\n\nprint(add(1, 2))") is None
+
+
+def test_function_body_fragment_passes():
+    assert run("total = a + b\nreturn total") is None
+
+
+def test_await_fragment_passes():
+    assert run("data = await fetch()\nreturn data") is None
+
+
+def test_fenced_fragment_passes():
+    assert run("Here is mine:\n```python\nreturn a + b\n```") is None
+
+
+def test_broken_full_program_fails():
+    result = run("def add(a, b)\n    return a + b")
+    assert result["score"] == 0
+    assert "SyntaxError on line 1" in result["feedback"]
+
+
+def test_broken_fragment_reports_its_own_line():
+    result = run("x = 1\nreturn (x +")
+    assert result["score"] == 0
+    assert "on line 2" in result["feedback"]
+    assert "_answer" not in result["feedback"]
+
+
+def test_prose_goes_to_the_llm():
+    assert not looks_like_code("x = 5 is an assignment")
+    assert run("A list is mutable, so you can append to it.") is None
+    assert run("if x > 3: it prints big") is None
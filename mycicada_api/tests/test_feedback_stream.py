@@ -0,0 +1,48 @@
+import json
+import random
+
+import pytest
+
+from assessment import FeedbackStream
+
+FEEDBACK = 'Close! Use "return", not print.\nTabs\there, a backslash \\ and café 🎉'
+
+
+def arguments(ensure_ascii):
+    return json.dumps({
+        "score": 0,
+        "feedback": FEEDBACK,
+        "followup": "What does the function give back?",
+        "evidence": [{"observable": "returns", "objective": "x", "score": 0, "importance": 2, "feedback": "not this one"}],
+        "confidence": 0.9,
+    }, ensure_ascii=ensure_ascii)
+
+
+def stream(chunks):
+    feedback = FeedbackStream()
+    return "".join(feedback.feed(chunk) for chunk in chunks)
+
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_every_two_way_split(ensure_ascii):
+    raw = arguments(ensure_ascii)
+    for i in range(len(raw) + 1):
+        assert stream([raw[:i], raw[i:]]) == FEEDBACK
+
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_random_chunks(ensure_ascii):
+    raw = arguments(ensure_ascii)
+    rng = random.Random(0)
+    for _ in range(200):
+        cuts = sorted(rng.sample(range(1, len(raw)), rng.randint(1, 30)))
+        chunks = [raw[a:b] for a, b in zip([0] + cuts, cuts + [len(raw)])]
+        assert stream(chunks) == FEEDBACK
+
+
+def test_one_character_at_a_time():
+    assert stream(arguments(True)) == FEEDBACK
+
+
+def test_no_feedback_yet():
+    assert stream(['{"score": 1, "fee']) == ""
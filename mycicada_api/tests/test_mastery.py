@@ -0,0 +1,38 @@
+import pytest
+
+from catalog import catalog
+from mastery import next_unmastered
+
+
+@pytest.fixture
+def objectives(monkeypatch):
+    # Ids with gaps, so positions and ids differ
+    rows = [{"id": lo_id} for lo_id in (3, 5, 8, 13, 21)]
+    monkeypatch.setattr(catalog, "objectives", rows)
+    monkeypatch.setattr(catalog, "ids", [row["id"] for row in rows])
+
+
+def bits(*positions):
+    return sum(1 << p for p in positions)
+
+
+def test_first_unmastered(objectives):
+    assert next_unmastered(0) == 3
+    assert next_unmastered(bits(0, 1)) == 8
+
+
+def test_after_lo_id(objectives):
+    assert next_unmastered(0, after_lo_id=5) == 8
+    assert next_unmastered(0, after_lo_id=6) == 8
+    assert next_unmastered(bits(2), after_lo_id=5) == 13
+    assert next_unmastered(0, after_lo_id=0) == 3
+
+
+def test_nothing_left(objectives):
+    assert next_unmastered(bits(0, 1, 2, 3, 4)) is None
+    assert next_unmastered(bits(4), after_lo_id=13) is None
+    assert next_unmastered(0, after_lo_id=21) is None
+
+
+def test_bits_beyond_the_catalog_are_ignored(objectives):
+    assert next_unmastered(bits(0, 1, 2, 3, 4, 7)) is None
@@ -0,0 +1,28 @@
+import base64
+
+import pytest
+from fastapi import HTTPException
+
+from messages import decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize("message_id", [1, 42, 2**40])
+def test_round_trip(message_id):
+    assert decode_cursor(encode_cursor({"id": message_id})) == message_id
+
+
+def test_legacy_timestamp_cursor():
+    legacy = base64.urlsafe_b64encode(b"2025-01-01T00:00:00|17").decode()
+    assert decode_cursor(legacy) == 17
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not base64!",
+    base64.urlsafe_b64encode(b"abc").decode(),
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+])
+def test_bad_cursor(cursor):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(cursor)
+    assert e.value.status_code == 400
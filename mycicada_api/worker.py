@@ -0,0 +1,160 @@
+# worker.py
+# Runs queued LLM jobs (question generation and evaluation) outside the API
+# processes. Any number of workers can run side by side: each claims jobs with
+# FOR UPDATE SKIP LOCKED, keeps them leased while they run and writes the results
+# to session_messages / learner_models itself. SIGTERM stops claiming and lets
+# running jobs finish.
+#
+#   python worker.py --concurrency 8
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import time
+from uuid import UUID
+
+from fastapi import HTTPException
+
+import jobs
+from assessment import evaluate_answer
+from catalog import catalog, start_catalog, stop_catalog
+from db import init_pool, close_pool, acquire
+from listener import subscribe, start_listener, stop_listener
+from llm import init_gateway, close_gateway
+from messages import insert_messages, owns_session
+from metrics import setup_logging
+from question_bank import serve_question
+from schema import ensure_schema
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "8"))
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "5"))
+PRUNE_EVERY_SECONDS = 3600
+
+logger = logging.getLogger("worker")
+
+
+async def run_job(job):
+    payload = json.loads(job["payload"])
+    lo = catalog.get(payload["lo_id"])
+    if not lo:
+        raise ValueError(f"LO {payload['lo_id']} not found")
+    # The queue routes check this too; re-checked so no job writes to another user's session
+    if payload.get("session_id"):
+        async with acquire() as db:
+            if not await owns_session(db, UUID(payload["session_id"]), job["user_id"]):
+                raise ValueError(f"Session {payload['session_id']} not found for this user")
+
+    if job["kind"] == "evaluation":
+        # Always persisted: the answer, the tutor's reply and any mastery update
+        return await evaluate_answer(
+            lo, job["user_id"], UUID(payload["session_id"]), payload["question"], payload["user_input"],
+            question_id=payload.get("question_id"), persist=True
+        )
+
+    if job["kind"] == "question":
+        result = await serve_question(job["user_id"], lo)
+        if payload.get("session_id"):
+            async with acquire() as db:
+                result["message_ids"] = await insert_messages(db, UUID(payload["session_id"]), [
+                    (lo["id"], "tutor", "🧠 **New Learning Objective**", "chat"),
+                    (lo["id"], "tutor", result["question"], "chat")
+                ])
+        return result
+
+    raise ValueError(f"Unknown job kind {job['kind']!r}")
+
+
+async def process(job):
+    try:
+        result = await run_job(job)
+    except HTTPException as e:
+        # The gateway already retried; requeue with backoff while attempts remain
+        logger.warning("Job %s: %s (attempt %s)", job["id"], e.detail, job["attempts"])
+        async with acquire() as db:
+            await jobs.fail(db, job["id"], str(e.detail), job["attempts"])
+        return
+    except Exception as e:
+        logger.exception("Job %s failed", job["id"])
+        async with acquire() as db:
+            await jobs.fail(db, job["id"], str(e) or type(e).__name__, job["attempts"], retry=False)
+        return
+
+    async with acquire() as db:
+        await jobs.finish(db, job["id"], result)
+
+
+async def work(concurrency, stopping):
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    wake = asyncio.Event()
+    subscribe(jobs.JOB_CHANNEL, lambda payload: wake.set())
+    await start_listener()
+
+    running = {}  # task -> job id
+    last_renewal = last_prune = time.monotonic()
+
+    def done(task):
+        running.pop(task, None)
+        wake.set()
+
+    logger.info("Worker %s started with concurrency %s", name, concurrency)
+    while not stopping.is_set():
+        wake.clear()
+        free = concurrency - len(running)
+        if free:
+            async with acquire() as db:
+                claimed = await jobs.claim(db, name, free)
+            for job in claimed:
+                task = asyncio.create_task(process(job))
+                running[task] = job["id"]
+                task.add_done_callback(done)
+
+        now = time.monotonic()
+        if running and now - last_renewal > jobs.JOB_LEASE_SECONDS / 3:
+            async with acquire() as db:
+                await jobs.extend_lease(db, list(running.values()))
+            last_renewal = now
+        if now - last_prune > PRUNE_EVERY_SECONDS:
+            async with acquire() as db:
+                await jobs.prune(db)
+            last_prune = now
+
+        # NOTIFY wakes us for new jobs; the timeout catches retries coming due and expired leases
+        try:
+            await asyncio.wait_for(wake.wait(), timeout=WORKER_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+    if running:
+        logger.info("Stopping, waiting for %s running jobs", len(running))
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+async def main(concurrency):
+    setup_logging()
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    await init_pool()
+    init_gateway()
+    try:
+        async with acquire() as db:
+            await ensure_schema(db)
+        await start_catalog()
+        await work(concurrency, stopping)
+    finally:
+        await stop_catalog()
+        await stop_listener()
+        await close_gateway()
+        await close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process queued LLM jobs.")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY, help="jobs run in parallel")
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency))
@@ -0,0 +1,15 @@
+// src/api.js
+// Resend on network errors, 5xx and 409 (the first attempt is still running).
+// Callers pass the same Idempotency-Key header on every attempt, so the server
+// replays the first result instead of doing the work twice.
+export async function fetchWithRetry(url, options, attempts = 3) {
+  for (let i = 1; ; i++) {
+    try {
+      const res = await fetch(url, options);
+      if (i >= attempts || !(res.status === 409 || res.status >= 500)) return res;
+    } catch (err) {
+      if (i >= attempts) throw err;
+    }
+    await new Promise((resolve) => setTimeout(resolve, 500 * i));
+  }
+}
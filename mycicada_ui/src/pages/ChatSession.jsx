@@ -2,6 +2,45 @@ import { useEffect, useRef, useState } from "react";
 import { useParams } from "react-router-dom";
 import { useAuth } from "../hooks/useAuth";
 import ReactMarkdown from "react-markdown";
+import { fetchWithRetry } from "../api";
+
+// POST a JSON body and read the Server-Sent Events reply.
+// Calls onToken for every streamed chunk and resolves with the final "result" event.
+async function postStream(url, token, body, onToken, extraHeaders = {}) {
+  const res = await fetchWithRetry(url, {
+    method: "POST",
+    headers: {
+      Authorization: `Bearer ${token}`,
+      "Content-Type": "application/json",
+      ...extraHeaders,
+    },
+    body: JSON.stringify(body),
+  });
+  if (!res.ok) throw new Error(`Request failed: ${res.status}`);
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let result = null;
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let sep;
+    while ((sep = buffer.indexOf("\n\n")) !== -1) {
+      const raw = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+      const event = raw.match(/^event: (.*)$/m)?.[1];
+      const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] ?? "null");
+      if (event === "token") onToken(data.text);
+      else if (event === "result") result = data;
+      else if (event === "error") throw new Error(data.detail);
+    }
+  }
+  return result;
+}
 
 export default function ChatSession() {
   const params = useParams();
@@ -14,10 +53,20 @@ export default function ChatSession() {
   const [loading, setLoading] = useState(true);
   const [sending, setSending] = useState(false);
   const [question, setQuestion] = useState("");
+  const [questionId, setQuestionId] = useState(null);
+  const [olderCursor, setOlderCursor] = useState(null); // before_cursor while older history remains
+  const [loadingOlder, setLoadingOlder] = useState(false);
+  const keepScroll = useRef(false);
   const hasAskedQuestion = useRef(false);
   const isLoadingQuestion = useRef(false);
   const chatEndRef = useRef(null);
   const currentSessionLoaded = useRef(null);
+  const syncCursor = useRef(null);
+  const savedIds = useRef(new Set()); // ids already on screen (posted by this tab or pushed), skipped when syncing
+  const writesInFlight = useRef(0); // our own saves whose ids aren't known yet
+  const pushed = useRef([]); // pushed message batches held back until our own saves return
+  const answerKey = useRef(null); // { scope, key } for the answer being submitted, kept until it succeeds
+  const submitting = useRef(false); // drops a second submit fired before `sending` re-renders
 
   useEffect(() => {
     async function fetchSessionAndMessages() {
@@ -39,11 +88,14 @@ export default function ChatSession() {
         }
         currentSessionLoaded.current = sessionId;
 
-        const msgRes = await fetch(`http://localhost:8000/api/session/${sessionId}/messages`, {
+        const msgRes = await fetch(`http://localhost:8000/api/session/${sessionId}/messages?limit=200`, {
           headers: { Authorization: `Bearer ${token}` },
         });
-        const pastMessages = await msgRes.json();
-        const msgs = pastMessages.map((m) => ({ role: m.role, text: m.text }));
+        const page = await msgRes.json();
+        syncCursor.current = page.sync_cursor;
+        setOlderCursor(page.has_more ? page.before_cursor : null);
+        page.messages.forEach((m) => savedIds.current.add(m.id));
+        const msgs = page.messages.map((m) => ({ role: m.role, text: m.text }));
         setMessages(msgs); // ✅ reset, not append
 
         const hasQuestion = msgs.some((m) =>
@@ -74,35 +126,154 @@ export default function ChatSession() {
   }, [sessionId]);
 
 
+  // Page backwards through history the first load didn't include
+  async function loadEarlier() {
+    if (!olderCursor || loadingOlder) return;
+    setLoadingOlder(true);
+    try {
+      const res = await fetch(
+        `http://localhost:8000/api/session/${sessionId}/messages?limit=100&before=${encodeURIComponent(olderCursor)}`,
+        { headers: { Authorization: `Bearer ${token}` } }
+      );
+      const page = await res.json();
+      const older = page.messages.filter((m) => !savedIds.current.has(m.id));
+      older.forEach((m) => savedIds.current.add(m.id));
+      keepScroll.current = true;
+      setMessages((prev) => [...older.map((m) => ({ role: m.role, text: m.text })), ...prev]);
+      setOlderCursor(page.has_more ? page.before_cursor : null);
+    } catch (err) {
+      console.error("❌ Failed to load earlier messages", err);
+    } finally {
+      setLoadingOlder(false);
+    }
+  }
+
+  function showFresh(page) {
+    const fresh = page.messages.filter((m) => !savedIds.current.has(m.id));
+    fresh.forEach((m) => savedIds.current.add(m.id));
+    if (page.sync_cursor) syncCursor.current = page.sync_cursor;
+    if (fresh.length) {
+      setMessages((prev) => [...prev, ...fresh.map((m) => ({ role: m.role, text: m.text }))]);
+    }
+  }
+
+  // Pushes can arrive before our own POST returns the ids it created; wait for those first
+  function flushPushed() {
+    if (writesInFlight.current > 0) return;
+    pushed.current.splice(0).forEach(showFresh);
+  }
+
+  async function trackWrite(write) {
+    writesInFlight.current += 1;
+    try {
+      return await write();
+    } finally {
+      writesInFlight.current -= 1;
+      flushPushed();
+    }
+  }
+
+  // Fetch only messages newer than what we have (after a resync push or when back online)
+  async function syncNewMessages() {
+    if (!sessionId || !syncCursor.current || writesInFlight.current > 0) return;
+    try {
+      let hasMore = true;
+      while (hasMore) {
+        const res = await fetch(
+          `http://localhost:8000/api/session/${sessionId}/messages?since=${encodeURIComponent(syncCursor.current)}`,
+          { headers: { Authorization: `Bearer ${token}` } }
+        );
+        const page = await res.json();
+        if (page.messages.length === 0) break;
+        showFresh(page);
+        hasMore = page.has_more;
+      }
+    } catch (err) {
+      console.error("❌ Failed to sync messages", err);
+    }
+  }
+
+  // Live updates: the server pushes messages from other tabs and devices as they are committed
+  useEffect(() => {
+    if (!sessionId || !token) return;
+    let ws;
+    let closed = false;
+    let retry;
+
+    function connect() {
+      const since = syncCursor.current ? `&since=${encodeURIComponent(syncCursor.current)}` : "";
+      ws = new WebSocket(
+        `ws://localhost:8000/ws/session/${sessionId}?token=${encodeURIComponent(token)}${since}`
+      );
+      ws.onmessage = (e) => {
+        const event = JSON.parse(e.data);
+        if (event.type === "messages") {
+          pushed.current.push(event);
+          flushPushed();
+        } else if (event.type === "resync") {
+          syncNewMessages();
+        }
+      };
+      // Reconnect with the latest cursor; the server replays anything missed.
+      // 44xx closes (bad token, not our session, bad cursor) won't get better by retrying.
+      ws.onclose = (e) => {
+        if (!closed && (e.code < 4400 || e.code >= 4500)) retry = setTimeout(connect, 2000);
+      };
+    }
+
+    connect();
+    window.addEventListener("online", syncNewMessages);
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      ws?.close();
+      window.removeEventListener("online", syncNewMessages);
+    };
+  }, [sessionId, token]);
+
   useEffect(() => {
+    // Older history goes above; keep the reader where they are
+    if (keepScroll.current) {
+      keepScroll.current = false;
+      return;
+    }
     chatEndRef.current?.scrollIntoView({ behavior: "smooth" });
   }, [messages]);
 
   async function handleSend(e) {
     e.preventDefault();
-    if (!input.trim() || !loId) return;
+    if (!input.trim() || !loId || submitting.current) return;
+
+    // One key per answer: resubmitting the same answer after an error reuses it
+    const scope = `${sessionId}|${loId}|${questionId}|${input}`;
+    if (answerKey.current?.scope !== scope) {
+      answerKey.current = { scope, key: crypto.randomUUID() };
+    }
+    const idempotencyKey = answerKey.current.key;
 
+    submitting.current = true;
     setSending(true);
     const userMsg = { role: "user", text: input };
     setMessages((prev) => [...prev, userMsg]);
-    await saveMessage(userMsg);
 
     try {
-      const res = await fetch(`http://localhost:8000/api/evaluate_response`, {
-        method: "POST",
-        headers: {
-          Authorization: `Bearer ${token}`,
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({
-          session_id: sessionId,
-          lo_id: loId,
-          question,
-          user_input: input,
-        }),
+      // Show the tutor's reply as it streams in, then swap in the final messages
+      setMessages((prev) => [...prev, { role: "tutor", text: "", streaming: true }]);
+      const data = await trackWrite(async () => {
+        const result = await postStream(
+          `http://localhost:8000/api/evaluate_response/stream`,
+          token,
+          // persist: the server stores the answer, the reply and the mastery update in one transaction
+          { session_id: sessionId, lo_id: loId, question, question_id: questionId, user_input: input, persist: true },
+          (text) => setMessages((prev) => appendToStreaming(prev, text)),
+          // A resent request replays the stored result instead of grading twice
+          { "Idempotency-Key": idempotencyKey }
+        );
+        (result.message_ids || []).forEach((id) => savedIds.current.add(id));
+        return result;
       });
-
-      const data = await res.json();
+      answerKey.current = null;
+      setMessages((prev) => prev.filter((m) => !m.streaming));
 
       if (data.score === 1) {
         const msgs = [
@@ -110,7 +281,6 @@ export default function ChatSession() {
           { role: "tutor", text: data.feedback },
         ];
         setMessages((prev) => [...prev, ...msgs]);
-        for (const msg of msgs) await saveMessage(msg);
 
         // Allow time for feedback to render before transition
         if (mode === "tutor") {
@@ -127,19 +297,20 @@ export default function ChatSession() {
         const msgs = [
           { role: "tutor", text: data.feedback },
           { role: "tutor", text: data.followup },
-        ];
+        ].filter((m) => m.text);
         setMessages((prev) => [...prev, ...msgs]);
-        for (const msg of msgs) await saveMessage(msg);
       }
     } catch (err) {
       console.error("Error evaluating response", err);
+      setMessages((prev) => prev.filter((m) => !m.streaming));
       const errMsg = { role: "tutor", text: "⚠️ Sorry, I couldn't process your response." };
       setMessages((prev) => [...prev, errMsg]);
-      await saveMessage(errMsg);
+      await saveMessages([userMsg, errMsg]);
     }
 
     setInput("");
     setSending(false);
+    submitting.current = false;
 
     // Ensure scroll to bottom after messages
     setTimeout(() => {
@@ -147,6 +318,7 @@ export default function ChatSession() {
     }, 150);
   }
 
+  // Each call is one logical save; its key is reused if the request is retried
   async function saveMessage(msg, sessionIdOverride = null, loIdOverride = null) {
     const sid = sessionIdOverride || sessionId;
     const lid = loIdOverride || loId;
@@ -157,18 +329,24 @@ export default function ChatSession() {
     }
 
     try {
-      await fetch(`http://localhost:8000/api/session/${sid}/message`, {
-        method: "POST",
-        headers: {
-          Authorization: `Bearer ${token}`,
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({
-          lo_id: lid,
-          role: msg.role,
-          text: msg.text,
-          activity_type: "chat",
-        }),
+      const idempotencyKey = crypto.randomUUID();
+      await trackWrite(async () => {
+        const res = await fetchWithRetry(`http://localhost:8000/api/session/${sid}/message`, {
+          method: "POST",
+          headers: {
+            Authorization: `Bearer ${token}`,
+            "Content-Type": "application/json",
+            "Idempotency-Key": idempotencyKey,
+          },
+          body: JSON.stringify({
+            lo_id: lid,
+            role: msg.role,
+            text: msg.text,
+            activity_type: "chat",
+          }),
+        });
+        const saved = await res.json();
+        if (saved.id) savedIds.current.add(saved.id);
       });
     } catch (err) {
       console.error("❌ Failed to save message:", err);
@@ -176,6 +354,38 @@ export default function ChatSession() {
   }
 
 
+  // Save several messages in one request (one transaction on the server)
+  async function saveMessages(msgs, sessionIdOverride = null, loIdOverride = null) {
+    const sid = sessionIdOverride || sessionId;
+    const lid = loIdOverride || loId;
+
+    if (!lid || !sid) {
+      console.warn("⚠️ loId or sessionId is missing. Messages not saved.");
+      return;
+    }
+
+    try {
+      const idempotencyKey = crypto.randomUUID();
+      await trackWrite(async () => {
+        const res = await fetchWithRetry(`http://localhost:8000/api/session/${sid}/messages`, {
+          method: "POST",
+          headers: {
+            Authorization: `Bearer ${token}`,
+            "Content-Type": "application/json",
+            "Idempotency-Key": idempotencyKey,
+          },
+          body: JSON.stringify(
+            msgs.map((msg) => ({ lo_id: lid, role: msg.role, text: msg.text, activity_type: "chat" }))
+          ),
+        });
+        const saved = await res.json();
+        (saved.ids || []).forEach((id) => savedIds.current.add(id));
+      });
+    } catch (err) {
+      console.error("❌ Failed to save messages:", err);
+    }
+  }
+
   async function loadNewQuestion(lo_id, session_id) {
     if (!lo_id || !session_id) return;
     if (hasAskedQuestion.current || isLoadingQuestion.current) return;
@@ -184,31 +394,33 @@ export default function ChatSession() {
     isLoadingQuestion.current = true;
 
     try {
-      const res = await fetch(`http://localhost:8000/api/assessment_question`, {
-        method: "POST",
-        headers: {
-          Authorization: `Bearer ${token}`,
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({ lo_id }),
-      });
-
-      const qData = await res.json();
+      const transitionMsg = { role: "tutor", text: `🧠 **New Learning Objective**` };
+      setMessages((prev) => [...prev, transitionMsg, { role: "tutor", text: "", streaming: true }]);
+
+      const qData = await postStream(
+        `http://localhost:8000/api/assessment_question/stream`,
+        token,
+        { lo_id },
+        (text) => setMessages((prev) => appendToStreaming(prev, text))
+      );
       setQuestion(qData.question);
+      setQuestionId(qData.question_id);
 
-      const transitionMsg = { role: "tutor", text: `🧠 **New Learning Objective**` };
       const questionMsg = { role: "tutor", text: qData.question };
-
-      setMessages((prev) => [...prev, transitionMsg, questionMsg]);
-      await saveMessage(transitionMsg, session_id, lo_id);
-      await saveMessage(questionMsg, session_id, lo_id);
+      setMessages((prev) => [...prev.filter((m) => !m.streaming), questionMsg]);
+      await saveMessages([transitionMsg, questionMsg], session_id, lo_id);
     } catch (err) {
       console.error("❌ Failed to load question:", err);
+      setMessages((prev) => prev.filter((m) => !m.streaming));
     } finally {
       isLoadingQuestion.current = false;
     }
   }
 
+  function appendToStreaming(prev, text) {
+    return prev.map((m) => (m.streaming ? { ...m, text: m.text + text } : m));
+  }
+
   async function goToNextLO(currentLoId) {
     const res = await fetch(`http://localhost:8000/api/session/${currentLoId}/next_lo`, {
       headers: { Authorization: `Bearer ${token}` },
@@ -255,7 +467,15 @@ export default function ChatSession() {
           {loading ? (
             <div style={{ color: "#197278" }}>Loading session...</div>
           ) : (
-            messages.map((msg, idx) => (
+            <>
+            {olderCursor && (
+              <div style={{ textAlign: "center", marginBottom: 12 }}>
+                <button onClick={loadEarlier} className="wgu-session-back" disabled={loadingOlder}>
+                  {loadingOlder ? "Loading..." : "⬆ Load earlier messages"}
+                </button>
+              </div>
+            )}
+            {messages.map((msg, idx) => (
               <div key={idx} className="wgu-chat-msg-row" style={{
                 justifyContent: msg.role === "user" ? "flex-end" : "flex-start"
               }}>
@@ -272,7 +492,8 @@ export default function ChatSession() {
                   )}
                 </div>
               </div>
-            ))
+            ))}
+            </>
           )}
           <div ref={chatEndRef} />
         </div>
@@ -1,6 +1,7 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { useNavigate } from "react-router-dom";
 import { useAuth } from "../hooks/useAuth";
+import { fetchWithRetry } from "../api";
 
 export default function SessionSelector() {
   const navigate = useNavigate();
@@ -9,6 +10,8 @@ export default function SessionSelector() {
   const [view, setView] = useState("menu"); // "menu" | "browse" | "proficiency"
   const [groupedObjectives, setGroupedObjectives] = useState({});
   const [proficiency, setProficiency] = useState([]);
+  // { scope, key } of the session start in progress: double clicks and retries share it
+  const startKey = useRef(null);
 
   useEffect(() => {
     if (view === "browse") fetchLOs();
@@ -38,21 +41,30 @@ export default function SessionSelector() {
   }
 
   async function startSession(mode, loId = null) {
-    const res = await fetch("http://localhost:8000/api/session/start", {
+    const scope = `${mode}|${loId}`;
+    if (startKey.current?.scope !== scope) {
+      startKey.current = { scope, key: crypto.randomUUID() };
+    }
+    const request = {
       method: "POST",
       headers: {
         Authorization: `Bearer ${localStorage.getItem("access_token")}`,
         "Content-Type": "application/json",
+        "Idempotency-Key": startKey.current.key,
       },
       body: JSON.stringify({
         user_id: user.id,
         mode,
         lo_id: loId,
       }),
-    });
+    };
+
+    // 409: the same start is still running (a double click); wait and get its result
+    const res = await fetchWithRetry("http://localhost:8000/api/session/start", request);
 
     const data = await res.json();
     if (res.ok) {
+      startKey.current = null;
       navigate(`/session/${data.session_id}`);
     } else {
       alert("Failed to start session.");
@@ -151,6 +163,7 @@ return (
                 <th>Topic</th>
                 <th>Learning Objective</th>
                 <th>Proficiency</th>
+                <th>Evidence</th>
                 <th>Feedback</th>
               </tr>
             </thead>
@@ -164,6 +177,11 @@ return (
                       {item.score?.toFixed(2)}
                     </span>
                   </td>
+                  <td>
+                    {item.evidence_score == null
+                      ? "—"
+                      : `${item.evidence_score.toFixed(2)} (${item.observations})`}
+                  </td>
                   <td>{item.feedback}</td>
                 </tr>
               ))}